@@ -0,0 +1,252 @@
+"""
+Admission control and priority lanes for the ProactED ML API prediction endpoints
+At most a fixed number of requests run inference at once. Requests are tagged interactive (dashboard
+clicks) or bulk (fleet sweeps, large batches), and each lane has its own bounded wait queue. Freed
+slots always go to waiting interactive work first; bulk work only takes the remaining capacity and
+never all of it, so a sweep cannot stall the UI. Requests beyond a lane's queue are rejected straight
+away (429) and requests that wait too long give up (503), both with a Retry-After estimated from the
+lane's recent throughput.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+WORKERS_ENV_VAR = 'ML_INFERENCE_WORKERS'
+QUEUE_DEPTH_ENV_VAR = 'ML_INFERENCE_QUEUE_DEPTH'
+QUEUE_TIMEOUT_ENV_VAR = 'ML_INFERENCE_QUEUE_TIMEOUT_MS'
+BULK_WORKERS_ENV_VAR = 'ML_BULK_WORKERS'
+BULK_QUEUE_DEPTH_ENV_VAR = 'ML_BULK_QUEUE_DEPTH'
+BULK_QUEUE_TIMEOUT_ENV_VAR = 'ML_BULK_QUEUE_TIMEOUT_MS'
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+DEFAULT_QUEUE_DEPTH = 32
+DEFAULT_QUEUE_TIMEOUT_MS = 5000
+DEFAULT_BULK_QUEUE_DEPTH = 16
+DEFAULT_BULK_QUEUE_TIMEOUT_MS = 30000
+
+# Recent requests kept per lane for wait/service percentiles and the throughput estimate
+STATS_WINDOW = 512
+
+MAX_RETRY_AFTER_SECONDS = 60
+
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; carries the lane, HTTP status and Retry-After seconds"""
+
+    def __init__(self, reason: str, status: int, retry_after: int, lane: str = INTERACTIVE):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+        self.lane = lane
+
+
+def default_workers() -> int:
+    # One slot beyond the bulk share always stays free for interactive work
+    return max(2, min(4, os.cpu_count() or 1))
+
+
+def percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(float(np.percentile(np.fromiter(values, dtype=float), q)), 2)
+
+
+class Lane:
+    """Wait queue, slot cap and recent statistics of one priority lane (guarded by the controller lock)"""
+
+    def __init__(self, name: str, capacity: int, queue_depth: int, queue_timeout_ms: float):
+        self.name = name
+        self.capacity = capacity
+        self.queue_depth = max(0, int(queue_depth))
+        self.queue_timeout_ms = float(queue_timeout_ms)
+        self.in_flight = 0
+        self.waiters: Deque[threading.Event] = deque()
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = {QUEUE_FULL: 0, QUEUE_TIMEOUT: 0}
+        self.wait_ms: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self.service_ms: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self.finished_at: Deque[float] = deque(maxlen=STATS_WINDOW)
+
+    def throughput(self) -> Optional[float]:
+        """
+        Requests per second the lane is currently sustaining.
+        Observed completions over the window understate it after idle gaps, so the rate implied by
+        recent service times across the lane's slots is used when it is higher.
+        """
+        rates = []
+        if len(self.finished_at) >= 2:
+            span = self.finished_at[-1] - self.finished_at[0]
+            if span > 0:
+                rates.append((len(self.finished_at) - 1) / span)
+        if self.service_ms:
+            mean_ms = sum(self.service_ms) / len(self.service_ms)
+            if mean_ms > 0:
+                rates.append(self.capacity * 1000.0 / mean_ms)
+        return max(rates) if rates else None
+
+    def retry_after(self) -> int:
+        """Seconds until the lane's queue plus one more request should have drained"""
+        rate = self.throughput()
+        if not rate:
+            return 1
+        seconds = (len(self.waiters) + 1) / rate
+        return int(min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(seconds))))
+
+    def describe(self) -> Dict[str, Any]:
+        wait_ms = list(self.wait_ms)
+        service_ms = list(self.service_ms)
+        rate = self.throughput()
+        return {
+            "workers": self.capacity,
+            "queue_depth": self.queue_depth,
+            "queue_timeout_ms": self.queue_timeout_ms,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected": dict(self.rejected),
+            "queue_wait_ms": {
+                "p50": percentile(wait_ms, 50),
+                "p95": percentile(wait_ms, 95),
+                "max": round(max(wait_ms), 2) if wait_ms else None
+            },
+            "service_ms": {
+                "p50": percentile(service_ms, 50),
+                "p95": percentile(service_ms, 95)
+            },
+            "throughput_per_second": round(rate, 2) if rate else None,
+            "retry_after_seconds": self.retry_after()
+        }
+
+
+class AdmissionController:
+    """
+    Inference slots shared by an interactive and a bulk lane, each with a FIFO wait queue.
+    Interactive requests may use every slot; bulk requests at most bulk_workers of them. Work runs on
+    the calling request thread (so Flask's request context stays valid); a freed slot is handed
+    directly to the next waiter, so a late arrival cannot overtake either queue.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                 queue_timeout_ms: float = DEFAULT_QUEUE_TIMEOUT_MS, bulk_workers: Optional[int] = None,
+                 bulk_queue_depth: int = DEFAULT_BULK_QUEUE_DEPTH,
+                 bulk_queue_timeout_ms: float = DEFAULT_BULK_QUEUE_TIMEOUT_MS):
+        self.workers = max(1, int(workers or default_workers()))
+        if bulk_workers is None:
+            bulk_workers = self.workers - 1
+        bulk_workers = max(1, min(self.workers, int(bulk_workers)))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.lanes = {
+            INTERACTIVE: Lane(INTERACTIVE, self.workers, queue_depth, queue_timeout_ms),
+            BULK: Lane(BULK, bulk_workers, bulk_queue_depth, bulk_queue_timeout_ms)
+        }
+
+    @classmethod
+    def from_environment(cls) -> 'AdmissionController':
+        workers = os.environ.get(WORKERS_ENV_VAR)
+        bulk_workers = os.environ.get(BULK_WORKERS_ENV_VAR)
+        return cls(
+            workers=int(workers) if workers else None,
+            queue_depth=int(os.environ.get(QUEUE_DEPTH_ENV_VAR, DEFAULT_QUEUE_DEPTH)),
+            queue_timeout_ms=float(os.environ.get(QUEUE_TIMEOUT_ENV_VAR, DEFAULT_QUEUE_TIMEOUT_MS)),
+            bulk_workers=int(bulk_workers) if bulk_workers else None,
+            bulk_queue_depth=int(os.environ.get(BULK_QUEUE_DEPTH_ENV_VAR, DEFAULT_BULK_QUEUE_DEPTH)),
+            bulk_queue_timeout_ms=float(os.environ.get(BULK_QUEUE_TIMEOUT_ENV_VAR, DEFAULT_BULK_QUEUE_TIMEOUT_MS))
+        )
+
+    def lane(self, name: Optional[str]) -> Lane:
+        if name not in self.lanes:
+            raise ValueError(f"Unknown priority lane {name!r}; expected one of {list(LANES)}")
+        return self.lanes[name]
+
+    def _can_start(self, lane: Lane) -> bool:
+        """Whether a request of this lane may take a free slot now (caller holds the lock)"""
+        if self._in_flight >= self.workers or lane.in_flight >= lane.capacity:
+            return False
+        if lane.name == BULK:
+            # Bulk never starts while interactive work is waiting
+            return not self.lanes[INTERACTIVE].waiters
+        return True
+
+    def acquire(self, lane_name: str = INTERACTIVE) -> float:
+        """Wait for an inference slot in a lane; returns the queue wait in milliseconds or raises Overloaded"""
+        lane = self.lane(lane_name)
+        with self._lock:
+            if not lane.waiters and self._can_start(lane):
+                self._in_flight += 1
+                lane.in_flight += 1
+                lane.admitted += 1
+                lane.wait_ms.append(0.0)
+                return 0.0
+            if len(lane.waiters) >= lane.queue_depth:
+                lane.rejected[QUEUE_FULL] += 1
+                raise Overloaded(QUEUE_FULL, 429, lane.retry_after(), lane.name)
+            granted = threading.Event()
+            lane.waiters.append(granted)
+
+        started = time.perf_counter()
+        granted.wait(lane.queue_timeout_ms / 1000.0)
+        wait_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            # A slot may have been handed over between the timeout and taking the lock
+            if not granted.is_set():
+                lane.waiters.remove(granted)
+                lane.rejected[QUEUE_TIMEOUT] += 1
+                # An interactive waiter leaving may unblock bulk work
+                self._dispatch()
+                raise Overloaded(QUEUE_TIMEOUT, 503, lane.retry_after(), lane.name)
+            lane.admitted += 1
+            lane.wait_ms.append(wait_ms)
+        return wait_ms
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, interactive first (caller holds the lock)"""
+        for lane in (self.lanes[INTERACTIVE], self.lanes[BULK]):
+            while lane.waiters and self._can_start(lane):
+                self._in_flight += 1
+                lane.in_flight += 1
+                lane.waiters.popleft().set()
+
+    def release(self, lane_name: str, service_ms: float) -> None:
+        lane = self.lane(lane_name)
+        with self._lock:
+            self._in_flight -= 1
+            lane.in_flight -= 1
+            lane.completed += 1
+            lane.service_ms.append(service_ms)
+            lane.finished_at.append(time.perf_counter())
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, lane_name: str = INTERACTIVE) -> Iterator[float]:
+        """Hold an inference slot for the duration of the block; yields the queue wait in milliseconds"""
+        wait_ms = self.acquire(lane_name)
+        started = time.perf_counter()
+        try:
+            yield wait_ms
+        finally:
+            self.release(lane_name, (time.perf_counter() - started) * 1000.0)
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "lanes": {name: lane.describe() for name, lane in self.lanes.items()}
+            }
@@ -0,0 +1,213 @@
+"""
+Fleet-wide streaming anomaly detection over ingested sensor readings
+Every equipment keeps EWMA mean/variance and two-sided CUSUM state per channel in flat NumPy arrays;
+each ingestion tick updates the whole fleet in one vectorized pass and reports only equipment
+that has just become anomalous.
+"""
+
+import collections
+import datetime
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from sensor_buffers import DEFAULT_CAPACITY, SENSOR_CHANNELS, SlotIndex, grow_rows, occurrence_rank
+
+# EWMA rates for the mean and (slower, for a stable scale) the variance
+DEFAULT_ALPHA = 0.1
+DEFAULT_VARIANCE_ALPHA = 0.02
+DEFAULT_Z_THRESHOLD = 5.0
+# CUSUM slack and decision threshold, in standard deviations
+DEFAULT_CUSUM_K = 0.5
+DEFAULT_CUSUM_H = 8.0
+# Readings per channel before alarms are allowed
+DEFAULT_WARMUP = 30
+# Consecutive normal readings before an anomalous equipment is cleared
+DEFAULT_CLEAR_AFTER = 5
+DEFAULT_EVENT_HISTORY = 10000
+
+# Standard deviation floor relative to the mean, so near-constant signals do not alarm on noise
+RELATIVE_SIGMA_FLOOR = 0.01
+ABSOLUTE_SIGMA_FLOOR = 1e-6
+
+SPIKE = 1
+SHIFT_UP = 2
+SHIFT_DOWN = 4
+
+
+class FleetAnomalyDetector:
+    """
+    EWMA z-score (spikes) and CUSUM change-point (level shifts) detection for every equipment.
+    Z-scores use the state before the reading is absorbed, so a reading is judged against history only.
+    Rates start at 1/n (a plain running mean and variance) and settle at the EWMA rates, so early
+    estimates are not biased towards the first reading.
+    """
+
+    def __init__(self, channels: Sequence[str] = SENSOR_CHANNELS, alpha: float = DEFAULT_ALPHA,
+                 variance_alpha: float = DEFAULT_VARIANCE_ALPHA, z_threshold: float = DEFAULT_Z_THRESHOLD,
+                 cusum_k: float = DEFAULT_CUSUM_K, cusum_h: float = DEFAULT_CUSUM_H, warmup: int = DEFAULT_WARMUP,
+                 clear_after: int = DEFAULT_CLEAR_AFTER, capacity: int = DEFAULT_CAPACITY,
+                 event_history: int = DEFAULT_EVENT_HISTORY):
+        self.channels = list(channels)
+        self.alpha = alpha
+        self.variance_alpha = variance_alpha
+        self.z_threshold = z_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.warmup = warmup
+        self.clear_after = clear_after
+        self.index = SlotIndex(capacity)
+        self._lock = threading.Lock()
+
+        n_channels = len(self.channels)
+        self.mean = np.zeros((capacity, n_channels))
+        self.var = np.zeros((capacity, n_channels))
+        self.seen = np.zeros((capacity, n_channels), dtype=np.int64)
+        self.cusum_pos = np.zeros((capacity, n_channels))
+        self.cusum_neg = np.zeros((capacity, n_channels))
+        self.last_z = np.zeros((capacity, n_channels))
+        self.anomalous = np.zeros(capacity, dtype=bool)
+        self.normal_streak = np.zeros(capacity, dtype=np.int64)
+        self.since = np.full(capacity, np.nan)
+        self.flags = np.zeros((capacity, n_channels), dtype=np.uint8)
+
+        # Newly anomalous events, polled by sequence number
+        self.events = collections.deque(maxlen=event_history)
+        self.sequence = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self._state_arrays())
+
+    @staticmethod
+    def _state_arrays() -> List[str]:
+        return ['mean', 'var', 'seen', 'cusum_pos', 'cusum_neg', 'last_z', 'anomalous', 'normal_streak',
+                'since', 'flags']
+
+    def _grow(self, capacity: int) -> None:
+        for name in self._state_arrays():
+            fill = np.nan if name == 'since' else 0
+            setattr(self, name, grow_rows(getattr(self, name), capacity, fill))
+
+    def update(self, equipment_ids: Sequence[Any], timestamps: np.ndarray, values: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Absorb one ingestion tick, values being (n, channels) with NaN for missing channels.
+        Returns the events for equipment that turned anomalous during this tick.
+        """
+        if len(equipment_ids) == 0:
+            return []
+        with self._lock:
+            slots, new_capacity = self.index.assign(equipment_ids)
+            if new_capacity is not None:
+                self._grow(new_capacity)
+
+            newly = []
+            rank = occurrence_rank(slots)
+            for round_number in range(int(rank.max()) + 1):
+                selected = np.flatnonzero(rank == round_number)
+                turned = self._update_round(slots[selected], timestamps[selected], values[selected])
+                newly.extend(selected[turned].tolist())
+
+            events = [self._event(int(slots[row]), float(timestamps[row])) for row in newly]
+            self.events.extend(events)
+            return events
+
+    def _update_round(self, slots: np.ndarray, timestamps: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """One reading per slot (slots are unique); returns a mask of slots that became anomalous"""
+        present = ~np.isnan(values)
+        x = np.where(present, values, 0.0)
+        mean = self.mean[slots]
+        var = self.var[slots]
+        seen = self.seen[slots]
+
+        sigma = np.maximum(np.sqrt(var), RELATIVE_SIGMA_FLOOR * np.abs(mean) + ABSOLUTE_SIGMA_FLOOR)
+        z = np.where(present & (seen > 0), (x - mean) / sigma, 0.0)
+        armed = present & (seen >= self.warmup)
+
+        cusum_pos = np.where(armed, np.maximum(0.0, self.cusum_pos[slots] + z - self.cusum_k), 0.0)
+        cusum_neg = np.where(armed, np.maximum(0.0, self.cusum_neg[slots] - z - self.cusum_k), 0.0)
+        spike = armed & (np.abs(z) > self.z_threshold)
+        shift_up = cusum_pos > self.cusum_h
+        shift_down = cusum_neg > self.cusum_h
+        flags = (spike * SPIKE | shift_up * SHIFT_UP | shift_down * SHIFT_DOWN).astype(np.uint8)
+
+        # Absorb the reading; a detected shift restarts the channel's CUSUM on the new level
+        n = (seen + 1).astype(np.float64)
+        rate = np.maximum(self.alpha, 1.0 / n)
+        variance_rate = np.maximum(self.variance_alpha, 1.0 / n)
+        diff = x - mean
+        new_mean = mean + rate * diff
+        new_var = (1.0 - variance_rate) * var + variance_rate * diff * (x - new_mean)
+        shifted = shift_up | shift_down
+        self.mean[slots] = np.where(present, new_mean, mean)
+        self.var[slots] = np.where(present, new_var, var)
+        self.seen[slots] = seen + present
+        self.cusum_pos[slots] = np.where(shifted, 0.0, np.where(present, cusum_pos, self.cusum_pos[slots]))
+        self.cusum_neg[slots] = np.where(shifted, 0.0, np.where(present, cusum_neg, self.cusum_neg[slots]))
+        self.last_z[slots] = np.where(present, z, self.last_z[slots])
+
+        alarm = flags.any(axis=1)
+        was_anomalous = self.anomalous[slots]
+        streak = np.where(alarm, 0, self.normal_streak[slots] + 1)
+        still_anomalous = alarm | (was_anomalous & (streak < self.clear_after))
+        turned = alarm & ~was_anomalous
+
+        self.normal_streak[slots] = streak
+        self.anomalous[slots] = still_anomalous
+        self.since[slots] = np.where(turned, timestamps, np.where(still_anomalous, self.since[slots], np.nan))
+        self.flags[slots] = np.where(turned[:, None], flags,
+                                     np.where(still_anomalous[:, None], self.flags[slots] | flags, 0))
+        return turned
+
+    def _event(self, slot: int, timestamp: float) -> Dict[str, Any]:
+        self.sequence += 1
+        return {
+            "sequence": self.sequence,
+            "equipment_id": self.index.ids[slot],
+            "detected_at": datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(),
+            "channels": self._channel_reasons(slot)
+        }
+
+    def _channel_reasons(self, slot: int) -> Dict[str, Dict[str, Any]]:
+        reasons = {}
+        for j, channel in enumerate(self.channels):
+            flag = int(self.flags[slot, j])
+            if not flag:
+                continue
+            kinds = [name for bit, name in ((SPIKE, 'spike'), (SHIFT_UP, 'shift_up'), (SHIFT_DOWN, 'shift_down'))
+                     if flag & bit]
+            reasons[channel] = {"kinds": kinds, "z_score": round(float(self.last_z[slot, j]), 3)}
+        return reasons
+
+    def events_since(self, sequence: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Newly anomalous events with a sequence number greater than the given one"""
+        with self._lock:
+            events = [event for event in self.events if event["sequence"] > sequence]
+        return events[:limit] if limit is not None else events
+
+    def active(self) -> List[Dict[str, Any]]:
+        """Equipment currently flagged as anomalous"""
+        with self._lock:
+            slots = np.flatnonzero(self.anomalous[:len(self.index)])
+            return [{
+                "equipment_id": self.index.ids[slot],
+                "since": datetime.datetime.fromtimestamp(self.since[slot], datetime.timezone.utc).isoformat(),
+                "channels": self._channel_reasons(int(slot))
+            } for slot in slots]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "equipment_count": len(self.index),
+            "anomalous_count": int(self.anomalous[:len(self.index)].sum()),
+            "channels": self.channels,
+            "alpha": self.alpha,
+            "variance_alpha": self.variance_alpha,
+            "z_threshold": self.z_threshold,
+            "cusum_k": self.cusum_k,
+            "cusum_h": self.cusum_h,
+            "warmup": self.warmup,
+            "clear_after": self.clear_after,
+            "last_sequence": self.sequence,
+            "bytes": self.nbytes
+        }
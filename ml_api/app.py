@@ -3,16 +3,47 @@ Production Flask API for ProactED ML predictions using trained Random Forest mod
 Integrates with the actual trained model from the Predictive Model directory
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-import pandas as pd
-import pickle
 import numpy as np
+import atexit
 import datetime
+import functools
 import logging
 import os
-from dataclasses import dataclass
-from typing import Dict, Any
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from engines import (
+    MODEL_SEARCH_PATHS,
+    OPTIONAL_FEATURES,
+    REQUIRED_FIELDS,
+    ForestEngine,
+    PredictorEngine,
+    create_engine,
+    load_model_system
+)
+from region_index import load_region_index_for
+from sensor_buffers import DEFAULT_WINDOW, REQUIRED_SENSOR_CHANNELS, SensorRingBuffers, parse_timestamp
+from sensor_store import SensorHistoryStore
+from anomaly import FleetAnomalyDetector
+from model_router import ModelRouter, equipment_type_of
+from batch_jobs import DEFAULT_PAGE_SIZE, BatchJobManager
+from risk_table import DEFAULT_SWEEP_SECONDS, LOCATION_FIELDS, RISK_SWEEP_ENV_VAR, RiskTable, SweepScheduler, format_row
+from feature_store import FeatureStore
+from incremental import IncrementalRescorer
+from fleet_rollups import DEFAULT_SORT, DEFAULT_TOP_K, GROUP_FIELDS, FleetRollups, parse_group_by, parse_risk_level
+from featurizer import DEFAULT_SENSOR_VALUES, FEATURE_COLUMNS, calendar_cache_info, featurize, model_feature_coverage, to_records
+from timetable_usage import DEFAULT_TIMETABLE_DIR, TIMETABLE_DIR_ENV_VAR, TimetableExtractor
+from admission import BULK, INTERACTIVE, AdmissionController, Overloaded
+from response_format import compress_response, parse_fields, parse_format, shape_rows
+from counterfactual import DEFAULT_TARGET as DEFAULT_COUNTERFACTUAL_TARGET, search_for
+from shadow import DEFAULT_SAMPLE_RATE as DEFAULT_SHADOW_SAMPLE_RATE, ShadowEvaluator, resolve_model_path
+from memory_report import (DEFAULT_TOP_STATS, DEFAULT_TRACE_FRAMES, MemoryTracer, deep_sizeof,
+                           estimate_mapping_bytes, model_footprint, process_memory)
+from transport import DEFAULT_LISTEN, LISTEN_ENV_VAR, serve
+from schedule_optimizer import DEFAULT_HORIZON_DAYS, DEFAULT_SLOT_MINUTES, DEFAULT_TIME_LIMIT_SECONDS, optimize_schedule
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -32,35 +63,56 @@ class EquipmentData:
 # Global model system
 MODEL_SYSTEM = None
 
+# Active predictor engine (trained forest or heuristic fallback)
+ENGINE = None
+
+# Routes rows to per-equipment-type models in front of ENGINE (see model_router.py)
+MODEL_ROUTER = None
+
+# Rolling sensor windows per equipment, fed by /api/sensors/ingest
+SENSOR_BUFFERS = SensorRingBuffers(window=int(os.environ.get('ML_SENSOR_WINDOW', DEFAULT_WINDOW)))
+
+# Persistent columnar sensor history, enabled by setting ML_SENSOR_STORE_DIR
+SENSOR_STORE = SensorHistoryStore(os.environ['ML_SENSOR_STORE_DIR']) if os.environ.get('ML_SENSOR_STORE_DIR') else None
+
+# Streaming anomaly state for the whole fleet, updated on every ingestion tick
+ANOMALY_DETECTOR = FleetAnomalyDetector()
+
+# Asynchronous batch jobs scored by worker processes (created on first use)
+BATCH_JOBS = None
+
+# Latest prediction per known equipment (created on first use) and its sweep scheduler
+RISK_TABLE = None
+RISK_SWEEPER = None
+
+# Latest feature vector per equipment for predict-by-ID (created on first use)
+FEATURE_STORE = None
+
+# Equipment whose inputs changed since the last incremental sweep
+RESCORER = IncrementalRescorer()
+
+# Column snapshot of the risk table for fleet rollups and top-K queries (created on first use)
+FLEET_ROLLUPS = None
+
+# Content-hash-cached timetable parser providing per-room daily usage hours (created on first use)
+TIMETABLES = None
+
+# Candidate model scoring sampled live traffic in the background (ML_SHADOW_MODEL_PATH or POST /api/shadow)
+SHADOW = None
+
+# On-demand tracemalloc snapshots for /api/admin/memory/snapshot
+MEMORY_TRACER = MemoryTracer()
+
+# Bounded inference slots shared by the prediction endpoints, with interactive and bulk priority lanes
+ADMISSION = AdmissionController.from_environment()
+
 def load_trained_model():
     """Load the trained Random Forest model from the ml_api directory"""
     global MODEL_SYSTEM
     try:
-        # Path to the trained model (in the same directory as this script)
-        model_path = 'complete_equipment_failure_prediction_system.pkl'
+        MODEL_SYSTEM, _ = load_model_system(MODEL_SEARCH_PATHS)
         
-        # Alternative paths in case the structure is different
-        alternative_paths = [
-            os.path.join('..', 'Predictive Model', 'complete_equipment_failure_prediction_system.pkl'),
-            '../Predictive Model/equipment_failure_model_deployment.pkl',
-            'equipment_failure_model_deployment.pkl'
-        ]
-        
-        # Try to load the model
-        loaded = False
-        for path in [model_path] + alternative_paths:
-            try:
-                if os.path.exists(path):
-                    with open(path, 'rb') as f:
-                        MODEL_SYSTEM = pickle.load(f)
-                    logger.info(f"Model loaded successfully from: {path}")
-                    loaded = True
-                    break
-            except Exception as e:
-                logger.warning(f"Failed to load from {path}: {e}")
-                continue
-        
-        if not loaded:
+        if MODEL_SYSTEM is None:
             logger.error("Could not load model from any path")
             return False
         
@@ -77,145 +129,371 @@ def load_trained_model():
         logger.error(f"Failed to load trained model: {e}")
         return False
 
-def predict_with_trained_model(equipment_data: EquipmentData) -> Dict[str, Any]:
+def get_engine() -> PredictorEngine:
+    """Return the active engine, building one from the current model state if needed"""
+    global ENGINE
+    if ENGINE is None:
+        ENGINE = create_engine(model_system=MODEL_SYSTEM)
+    return ENGINE
+
+def get_router() -> ModelRouter:
+    """Return the type model router in front of the active engine"""
+    global MODEL_ROUTER
+    if MODEL_ROUTER is None or MODEL_ROUTER.default_engine is not get_engine():
+        MODEL_ROUTER = ModelRouter.from_environment(get_engine())
+    return MODEL_ROUTER
+
+def parse_equipment_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate and coerce one request record into model input fields"""
+    equipment_data = EquipmentData(
+        equipment_id=data['equipment_id'],
+        age_months=int(data['age_months']),
+        operating_temperature=float(data['operating_temperature']),
+        vibration_level=float(data['vibration_level']),
+        power_consumption=float(data['power_consumption'])
+    )
+    record = asdict(equipment_data)
+    # Secondary model features are optional and default inside the engine
+    for feature in OPTIONAL_FEATURES:
+        if data.get(feature) is not None:
+            record[feature] = float(data[feature])
+    equipment_type = equipment_type_of(data)
+    if equipment_type:
+        record['equipment_type'] = equipment_type
+    for field in LOCATION_FIELDS:
+        if data.get(field) is not None:
+            record[field] = str(data[field])
+    return record
+
+def apply_sensor_features(items: List[Dict[str, Any]], override: bool = False) -> List[bool]:
     """
-    Use the actual trained Random Forest model for equipment failure prediction
+    Fill sensor fields from the rolling windows of equipment that has buffered readings.
+    Missing fields are always filled; override (or 'use_sensor_features': true) also replaces sent snapshots.
+    Returns, per item, whether rolling features were used.
     """
-    global MODEL_SYSTEM
+    equipment_ids = [item.get('equipment_id') for item in items]
+    features = SENSOR_BUFFERS.rolling_features(equipment_ids)
+    used = []
+    for i, item in enumerate(items):
+        if features["count"][i] == 0:
+            used.append(False)
+            continue
+        replace = override or bool(item.get('use_sensor_features', False))
+        filled = False
+        for j, channel in enumerate(SENSOR_BUFFERS.channels):
+            if replace or channel not in item:
+                item[channel] = float(features["mean"][i, j])
+                filled = True
+        used.append(filled)
+    return used
+
+def get_batch_jobs() -> BatchJobManager:
+    """Return the batch job manager, creating it (and its job directory) on first use"""
+    global BATCH_JOBS
+    if BATCH_JOBS is None:
+        BATCH_JOBS = BatchJobManager.from_environment(on_results=lambda records, results:
+                                                      get_risk_table().upsert(records, results))
+    return BATCH_JOBS
+
+def get_risk_table() -> RiskTable:
+    """Return the materialized risk table, opening (and loading) it on first use"""
+    global RISK_TABLE
+    if RISK_TABLE is None:
+        RISK_TABLE = RiskTable.from_environment()
+        # Write rows still buffered for SQLite before the process exits
+        atexit.register(RISK_TABLE.close)
+    return RISK_TABLE
+
+def get_feature_store() -> FeatureStore:
+    """Return the equipment feature store, opening (and loading) it on first use"""
+    global FEATURE_STORE
+    if FEATURE_STORE is None:
+        FEATURE_STORE = FeatureStore.from_environment()
+    return FEATURE_STORE
+
+def store_features(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Upsert into the feature store and mark the equipment whose stored values changed as dirty"""
+    result = get_feature_store().upsert(items)
+    RESCORER.mark(result["changed_ids"])
+    return result
+
+def known_equipment_ids() -> List[str]:
+    """Every equipment with stored features or a materialized prediction"""
+    return list(get_risk_table().records.keys() | get_feature_store().records.keys())
+
+def rescoring_items(equipment_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Inputs for rescoring: the stored feature vector over the risk table's last input record, with
+    sensor fields replaced by the latest rolling means; None for unknown equipment
+    """
+    risk_records = get_risk_table().records
+    stored = get_feature_store().records
+    items = []
+    for equipment_id in equipment_ids:
+        base, vector = risk_records.get(equipment_id), stored.get(equipment_id)
+        if base is None and vector is None:
+            items.append(None)
+            continue
+        item = {**(base or {}), **(vector or {}), "use_sensor_features": True}
+        item.pop('updated_at', None)
+        items.append(item)
+    return items
+
+def get_fleet_rollups() -> FleetRollups:
+    """Return the rollup view over the risk table"""
+    global FLEET_ROLLUPS
+    if FLEET_ROLLUPS is None or FLEET_ROLLUPS.table is not get_risk_table():
+        FLEET_ROLLUPS = FleetRollups(get_risk_table())
+    return FLEET_ROLLUPS
+
+def fleet_filters() -> Dict[str, Any]:
+    """building/room/equipment_type equality filters and the minimum risk level from the query string"""
+    return {
+        "filters": {field: request.args[field] for field in GROUP_FIELDS if request.args.get(field)},
+        "min_band": parse_risk_level(request.args.get('min_risk_level'))
+    }
+
+def get_timetables() -> TimetableExtractor:
+    """Return the timetable extractor, creating its cache directory on first use"""
+    global TIMETABLES
+    if TIMETABLES is None:
+        TIMETABLES = TimetableExtractor.from_environment()
+    return TIMETABLES
+
+def request_lane(default_lane: str) -> str:
+    """Priority lane from the X-Priority header or ?priority= (interactive or bulk), else the endpoint default"""
+    lane = request.headers.get('X-Priority') or request.args.get('priority') or default_lane
+    return lane.strip().lower()
+
+def admission_controlled(default_lane: str):
+    """
+    Run a prediction endpoint inside an inference slot of the request's priority lane.
+    Requests the lane cannot take are rejected with 429 (queue full) or 503 (waited too long) and Retry-After.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.request_arrived = time.perf_counter()
+            lane = request_lane(default_lane)
+            if lane not in ADMISSION.lanes:
+                return jsonify({
+                    "success": False,
+                    "error": f"Unknown priority {lane!r}; expected one of {sorted(ADMISSION.lanes)}"
+                }), 400
+            try:
+                with ADMISSION.slot(lane):
+                    return view(*args, **kwargs)
+            except Overloaded as e:
+                logger.warning(f"Rejected {e.lane} {request.path}: {e.reason} (retry after {e.retry_after}s)")
+                response = jsonify({
+                    "success": False,
+                    "error": "Prediction queue is full" if e.status == 429 else "Timed out waiting for a prediction slot",
+                    "reason": e.reason,
+                    "lane": e.lane,
+                    "retry_after_seconds": e.retry_after
+                })
+                response.status_code = e.status
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+        return wrapper
+    return decorator
+
+def response_options(data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Batch response format and field projection from the query string or the request body"""
+    data = data or {}
+    return {
+        "response_format": parse_format(request.args.get('format', data.get('format'))),
+        "fields": parse_fields(request.args.get('fields', data.get('fields')))
+    }
+
+def sweep_risk_table() -> Dict[str, Any]:
+    """Re-score every known equipment in one routed, vectorized pass, using the latest sensor means"""
+    return get_risk_table().sweep(
+        score=lambda records: get_router().predict_records(records),
+        prepare=lambda records: apply_sensor_features(records, override=True)
+    )
+
+def parse_equipment_list(equipment_list: List[Dict[str, Any]], defaults: Optional[Dict[str, float]] = None
+                         ) -> Tuple[List[Optional[Dict[str, Any]]], List[int], List[Dict[str, Any]]]:
+    """
+    Validate batch items, filling sensor fields from the rolling windows.
+    Fields still missing after that take their value from `defaults` when given
+    (listed per record under 'defaulted_fields').
+    Returns per-position responses (errors for invalid items, None otherwise),
+    the positions of valid items and their parsed records.
+    """
+    predictions = [None] * len(equipment_list)
+    valid_positions = []
+    valid_records = []
+    sensor_used = apply_sensor_features(equipment_list)
     
-    if MODEL_SYSTEM is None:
-        return {
-            "success": False,
-            "error": "Model not loaded. Using fallback prediction.",
-            "equipment_id": equipment_data.equipment_id,
-            "failure_probability": 0.3,
-            "risk_level": "Medium",
-            "confidence_score": 0.5
-        }
+    for position, equipment_data in enumerate(equipment_list):
+        try:
+            defaulted = [field for field in (defaults or {}) if equipment_data.get(field) is None]
+            for field in defaulted:
+                equipment_data[field] = defaults[field]
+            
+            # Validate each equipment item
+            if not all(field in equipment_data for field in REQUIRED_FIELDS):
+                predictions[position] = {
+                    "success": False,
+                    "equipment_id": equipment_data.get('equipment_id', 'unknown'),
+                    "error": "Missing required fields"
+                }
+                continue
+            
+            record = parse_equipment_record(equipment_data)
+            if sensor_used[position]:
+                record['sensor_features_used'] = True
+            if defaulted:
+                record['defaulted_fields'] = defaulted
+            valid_records.append(record)
+            valid_positions.append(position)
+            
+        except Exception as e:
+            predictions[position] = {
+                "success": False,
+                "equipment_id": equipment_data.get('equipment_id', 'unknown'),
+                "error": str(e)
+            }
+    
+    return predictions, valid_positions, valid_records
+
+def predict_equipment_list(equipment_list: List[Dict[str, Any]], deadline: Optional[float] = None,
+                           tolerance: Optional[float] = None,
+                           defaults: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """Validate and score raw batch items, returning one response per item in request order"""
+    predictions, valid_positions, valid_records = parse_equipment_list(equipment_list, defaults)
+    
+    # Score every valid item in one engine call
+    for position, record, prediction in zip(valid_positions, valid_records,
+                                            predict_records(valid_records, deadline=deadline, tolerance=tolerance)):
+        if record.get('sensor_features_used'):
+            prediction["sensor_features_used"] = True
+        if record.get('defaulted_fields'):
+            prediction["defaulted_fields"] = record['defaulted_fields']
+        predictions[position] = prediction
+    return predictions
+
+def predict_stored_equipment(equipment_ids: List[Any], use_sensor_features: bool = False,
+                             deadline: Optional[float] = None, tolerance: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Score equipment from their stored feature vectors, one response per ID in request order"""
+    predictions: List[Optional[Dict[str, Any]]] = [None] * len(equipment_ids)
+    positions = []
+    items = []
+    for position, (equipment_id, stored) in enumerate(zip(equipment_ids, get_feature_store().get_many(equipment_ids))):
+        if stored is None:
+            predictions[position] = {
+                "success": False,
+                "equipment_id": equipment_id,
+                "error": "No stored features for this equipment"
+            }
+            continue
+        item = {field: value for field, value in stored.items() if field != 'updated_at'}
+        if use_sensor_features:
+            item['use_sensor_features'] = True
+        positions.append(position)
+        items.append(item)
     
+    for position, prediction in zip(positions, predict_equipment_list(items, deadline=deadline, tolerance=tolerance)):
+        predictions[position] = prediction
+    return predictions
+
+def fallback_prediction(equipment_id: Any, error: str) -> Dict[str, Any]:
+    """Response used when scoring itself fails"""
+    return {
+        "success": False,
+        "equipment_id": equipment_id,
+        "error": f"Prediction failed: {error}",
+        "failure_probability": 0.3,
+        "risk_level": "Medium",
+        "confidence_score": 0.5,
+        "prediction_timestamp": datetime.datetime.utcnow().isoformat(),
+        "model_version": "fallback-v1.0"
+    }
+
+def parse_anytime_options(data: Dict[str, Any], request_started: float) -> Dict[str, Optional[float]]:
+    """
+    Read the optional latency budget and convergence tolerance from a request body.
+    The deadline counts from when the request arrived, so time spent queued for a slot is included.
+    """
+    budget_ms = data.get('latency_budget_ms')
+    tolerance = data.get('convergence_tolerance')
+    
+    deadline = None
+    if budget_ms is not None:
+        budget_ms = float(budget_ms)
+        if budget_ms <= 0:
+            raise ValueError("latency_budget_ms must be positive")
+        deadline = request_started + budget_ms / 1000.0
+    
+    if tolerance is not None:
+        tolerance = float(tolerance)
+        if tolerance <= 0:
+            raise ValueError("convergence_tolerance must be positive")
+    
+    return {"deadline": deadline, "tolerance": tolerance}
+
+def predict_records(records: List[Dict[str, Any]], deadline: Optional[float] = None,
+                    tolerance: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Score a list of parsed records with one vectorized call per routed model"""
+    engine = get_engine()
+    started = time.perf_counter()
     try:
-        # Create DataFrame from equipment data
-        # The real model has 8 features, so we need to provide defaults for missing ones
-        df = pd.DataFrame([{
-            'equipment_id': equipment_data.equipment_id,
-            'age_months': equipment_data.age_months,
-            'operating_temperature': equipment_data.operating_temperature,
-            'vibration_level': equipment_data.vibration_level,
-            'power_consumption': equipment_data.power_consumption,
-            # Add default values for additional model features
-            'humidity_level': 45.0,  # Default humidity
-            'dust_accumulation': 2.5,  # Default dust level
-            'performance_score': 0.85,  # Default performance
-            'daily_usage_hours': 8.0   # Default usage hours
-        }])
-        
-        # Extract model components
-        if isinstance(MODEL_SYSTEM, dict) and 'model_info' in MODEL_SYSTEM:
-            model_info = MODEL_SYSTEM['model_info']
-            model = model_info['model_object']
-            features = model_info['features']
-            threshold = model_info.get('optimal_threshold', 0.5)
-            model_name = model_info.get('model_name', 'Random Forest')
-            performance_metrics = model_info.get('performance_metrics', {})
-        else:
-            # Fallback if model structure is different
-            model = MODEL_SYSTEM.get('best_model', MODEL_SYSTEM)
-            features = MODEL_SYSTEM.get('features', ['age_months', 'operating_temperature', 'vibration_level', 'power_consumption'])
-            threshold = 0.5
-            model_name = "Random Forest"
-            performance_metrics = {}
-        
-        # Ensure all required features are present
-        for feature in features:
-            if feature not in df.columns:
-                # Provide reasonable defaults for missing features
-                if feature in ['humidity_level']:
-                    df[feature] = 45.0
-                elif feature in ['dust_accumulation']:
-                    df[feature] = 2.5
-                elif feature in ['performance_score']:
-                    df[feature] = 0.85
-                elif feature in ['daily_usage_hours']:
-                    df[feature] = 8.0
-                else:
-                    df[feature] = 0
-        
-        # Prepare features for prediction
-        X = df[features].fillna(0)
-        
-        # Apply scaling if available
-        if isinstance(MODEL_SYSTEM, dict) and 'scaler' in MODEL_SYSTEM:
-            X = MODEL_SYSTEM['scaler'].transform(X)
-        
-        # Make prediction - this is a regressor, so output is failure probability directly
-        failure_probability = float(model.predict(X)[0])
-        
-        # Ensure probability is in valid range
-        failure_probability = max(0.01, min(0.99, failure_probability))
-        
-        # Calculate confidence based on model performance
-        r2_score = performance_metrics.get('r2_score', 0.91)
-        base_confidence = min(0.95, r2_score + 0.04)  # Convert R² to confidence
-        confidence_adjustment = np.random.uniform(-0.05, 0.05)
-        confidence_score = max(0.65, min(0.98, base_confidence + confidence_adjustment))
-        
-        # Determine risk level based on failure probability
-        if failure_probability >= 0.7:
-            risk_level = "Critical"
-        elif failure_probability >= 0.5:
-            risk_level = "High"
-        elif failure_probability >= 0.3:
-            risk_level = "Medium"
-        else:
-            risk_level = "Low"
-        
-        # Get feature importance if available
-        feature_importance = {}
-        if hasattr(model, 'feature_importances_'):
-            for i, feature in enumerate(features):
-                if i < len(model.feature_importances_):
-                    feature_importance[feature] = float(model.feature_importances_[i])
-        
-        # Log prediction details
-        logger.info(f"Real model prediction for {equipment_data.equipment_id}: {failure_probability:.1%} ({risk_level})")
-        
-        return {
-            "success": True,
-            "equipment_id": equipment_data.equipment_id,
-            "failure_probability": round(failure_probability, 3),
-            "risk_level": risk_level,
-            "confidence_score": round(confidence_score, 3),
-            "prediction_timestamp": datetime.datetime.utcnow().isoformat(),
-            "model_version": f"{model_name}-production-v1.0",
-            "model_threshold": threshold,
-            "r2_score": performance_metrics.get('r2_score', 0.91),
-            "feature_importance": feature_importance,
-            "model_features_used": len(features),
-            "note": "Using trained Random Forest model with 8 features"
-        }
-        
+        predictions = get_router().predict_records(records, deadline=deadline, tolerance=tolerance)
     except Exception as e:
-        logger.error(f"Real model prediction error for {equipment_data.equipment_id}: {e}")
-        return {
-            "success": False,
-            "equipment_id": equipment_data.equipment_id,
-            "error": f"Prediction failed: {str(e)}",
-            "failure_probability": 0.3,
-            "risk_level": "Medium",
-            "confidence_score": 0.5,
-            "prediction_timestamp": datetime.datetime.utcnow().isoformat(),
-            "model_version": "fallback-v1.0"
-        }
+        logger.error(f"{engine.name} engine prediction error for {len(records)} record(s): {e}")
+        return [fallback_prediction(record['equipment_id'], str(e)) for record in records]
+    primary_ms = (time.perf_counter() - started) * 1000.0
+    
+    # Sampled copies are scored by the shadow candidate on its own thread
+    shadow = SHADOW
+    if shadow is not None:
+        shadow.offer(records, predictions, primary_ms)
+    
+    try:
+        get_risk_table().upsert(records, predictions)
+    except Exception as e:
+        logger.error(f"Risk table update failed: {e}")
+
+    if len(predictions) == 1:
+        prediction = predictions[0]
+        logger.info(f"{engine.name} prediction for {prediction['equipment_id']}: "
+                    f"{prediction['failure_probability']:.1%} ({prediction['risk_level']})")
+    else:
+        logger.info(f"{engine.name} engine scored {len(predictions)} equipment items")
+    return predictions
+
+def predict_with_trained_model(equipment_data: EquipmentData) -> Dict[str, Any]:
+    """
+    Use the active predictor engine (trained Random Forest when loaded) for equipment failure prediction
+    """
+    return predict_records([asdict(equipment_data)])[0]
 
 # Initialize model on startup
 def initialize_model():
-    """Initialize the model when the app starts"""
-    global MODEL_SYSTEM
+    """Initialize the model and predictor engine when the app starts"""
+    global MODEL_SYSTEM, ENGINE, RISK_SWEEPER, SHADOW
     success = load_trained_model()
     if success:
         logger.info("✅ Trained model loaded successfully")
     else:
         logger.warning("⚠️ Could not load trained model, will use fallback predictions")
+    ENGINE = create_engine(model_system=MODEL_SYSTEM)
+    if isinstance(ENGINE, ForestEngine):
+        ENGINE.region_index = load_region_index_for(ENGINE)
+    logger.info(f"Predictor engine: {ENGINE.name} ({ENGINE.model_version})")
+    router = get_router()
+    if router.paths:
+        logger.info(f"Type models available: {sorted(router.paths)} "
+                    f"(cap {router.memory_cap_bytes / 1024 / 1024:.0f} MB)")
+    try:
+        SHADOW = ShadowEvaluator.from_environment()
+    except Exception as e:
+        logger.error(f"Failed to load shadow model: {e}")
+    if RISK_SWEEPER is None:
+        RISK_SWEEPER = SweepScheduler(sweep_risk_table, float(os.environ.get(RISK_SWEEP_ENV_VAR, DEFAULT_SWEEP_SECONDS)))
+        RISK_SWEEPER.start()
 
 @app.route('/', methods=['GET'])
 def api_documentation():
@@ -233,6 +511,41 @@ def api_documentation():
             "GET /api/model/info": "Model information",
             "POST /api/equipment/predict": "Single equipment prediction",
             "POST /api/equipment/batch-predict": "Batch equipment prediction",
+            "POST /api/equipment/featurize": "Compute model features from raw equipment records and maintenance logs",
+            "POST /api/equipment/counterfactual": "Smallest temperature/dust/usage change that lowers predicted risk below a target",
+            "POST /api/equipment/predict-by-id": "Predict one equipment from its stored feature vector",
+            "POST /api/equipment/predict-by-ids": "Predict many equipment from their stored feature vectors",
+            "POST /api/features": "Create or partially update stored feature vectors",
+            "GET /api/features/<equipment_id>": "Stored feature vector of one equipment",
+            "DELETE /api/features/<equipment_id>": "Forget the stored feature vector of one equipment",
+            "GET /api/admission/stats": "Per-lane (interactive/bulk) queue depth, wait times and rejection counts",
+            "POST /api/jobs/batch-predict": "Start an asynchronous batch prediction job",
+            "GET /api/jobs/<job_id>": "Batch job progress",
+            "GET /api/jobs/<job_id>/results": "Paginated batch job results (offset, limit)",
+            "DELETE /api/jobs/<job_id>": "Cancel a batch job and delete its results",
+            "GET /api/risk/<equipment_id>": "Latest materialized risk for one equipment",
+            "POST /api/risk/lookup": "Latest materialized risk for a list of equipment IDs",
+            "POST /api/risk/sweep": "Re-score every known equipment now",
+            "GET /api/fleet/rollup": "Risk distribution and band counts by building, room or type (group_by, filters)",
+            "GET /api/fleet/top": "The k riskiest equipment (k, building, room, equipment_type, min_risk_level)",
+            "POST /api/rescore/sweep": "Rescore equipment changed since the last sweep; returns risk level changes only",
+            "POST /api/rescore/mark": "Mark equipment for the next incremental sweep",
+            "GET /api/rescore/status": "Pending changed equipment and the last incremental sweep",
+            "POST /api/maintenance/schedule": "Optimize maintenance tasks onto technician time slots",
+            "POST /api/timetables/extract": "Parse uploaded timetables (deduplicated by content hash) into room usage",
+            "GET /api/timetables/room-usage": "Per-room daily usage hours from the parsed timetables",
+            "POST /api/sensors/ingest": "Append sensor readings to per-equipment rolling windows",
+            "GET /api/sensors/<equipment_id>/features": "Rolling sensor features for one equipment",
+            "GET /api/sensors/<equipment_id>/history": "Stored sensor history (range scan or downsampled)",
+            "GET /api/anomalies/new": "Equipment that became anomalous since a sequence cursor",
+            "GET /api/anomalies/active": "Equipment currently flagged as anomalous",
+            "GET /api/shadow": "Shadow candidate vs production: probability deltas, risk level changes, latency",
+            "POST /api/shadow": "Load a candidate model as the shadow (model file name, sample_rate)",
+            "DELETE /api/shadow": "Stop shadow evaluation",
+            "POST /api/shadow/promote": "Serve the shadow candidate as the production model",
+            "GET /api/admin/memory": "Process RSS, model footprint per component/estimator and cache sizes",
+            "POST /api/admin/memory/snapshot": "Start tracemalloc or diff a new snapshot against the previous one",
+            "DELETE /api/admin/memory/snapshot": "Stop tracemalloc",
             "POST /model/retrain": "Simulate model retraining"
         }
     })
@@ -246,7 +559,9 @@ def health_check():
         "timestamp": datetime.datetime.utcnow().isoformat(),
         "version": "2.0.0",
         "model_loaded": MODEL_SYSTEM is not None,
-        "model_type": "Random Forest (Production)" if MODEL_SYSTEM else "Fallback"
+        "model_type": "Random Forest (Production)" if MODEL_SYSTEM else "Fallback",
+        "engine": get_engine().name,
+        "type_models": sorted(get_router().paths)
     })
 
 @app.route('/api/model/info', methods=['GET'])
@@ -312,30 +627,35 @@ def model_info():
         }), 500
 
 @app.route('/api/equipment/predict', methods=['POST'])
+@admission_controlled(INTERACTIVE)
 def predict_single():
     """Predict failure for a single equipment"""
+    request_started = g.get('request_arrived', time.perf_counter())
     try:
         data = request.get_json()
         
+        # Sensor fields may come from the rolling windows instead of the request
+        sensor_used = apply_sensor_features([data])[0]
+        
         # Validate required fields
-        required_fields = ['equipment_id', 'age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
-        if not all(field in data for field in required_fields):
+        if not all(field in data for field in REQUIRED_FIELDS):
             return jsonify({
                 "success": False,
-                "error": f"Missing required fields. Required: {required_fields}"
+                "error": f"Missing required fields. Required: {REQUIRED_FIELDS}"
             }), 400
         
-        # Create equipment data object
-        equipment_data = EquipmentData(
-            equipment_id=data['equipment_id'],
-            age_months=int(data['age_months']),
-            operating_temperature=float(data['operating_temperature']),
-            vibration_level=float(data['vibration_level']),
-            power_consumption=float(data['power_consumption'])
-        )
+        try:
+            anytime_options = parse_anytime_options(data, request_started)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
         # Generate prediction
-        prediction = predict_with_trained_model(equipment_data)
+        prediction = predict_records([parse_equipment_record(data)], **anytime_options)[0]
+        if sensor_used:
+            prediction["sensor_features"] = SENSOR_BUFFERS.feature_dicts([data['equipment_id']])[0]
         
         return jsonify(prediction)
         
@@ -346,8 +666,10 @@ def predict_single():
         }), 500
 
 @app.route('/api/equipment/batch-predict', methods=['POST'])
+@admission_controlled(BULK)
 def predict_batch():
     """Predict failure for multiple equipment items"""
+    request_started = g.get('request_arrived', time.perf_counter())
     try:
         data = request.get_json()
         
@@ -357,53 +679,922 @@ def predict_batch():
                 "error": "Missing 'equipment_list' field"
             }), 400
         
+        try:
+            anytime_options = parse_anytime_options(data, request_started)
+            shape_options = response_options(data)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        predictions = predict_equipment_list(data['equipment_list'], **anytime_options)
+        
+        return jsonify({
+            "success": True,
+            "processed_count": len(predictions),
+            **shape_rows(predictions, "predictions", **shape_options)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/equipment/featurize', methods=['POST'])
+@admission_controlled(BULK)
+def featurize_equipment():
+    """Compute features for raw equipment records and maintenance logs; optionally score them"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('equipment'), list):
+        return jsonify({
+            "success": False,
+            "error": "Missing 'equipment' list"
+        }), 400
+    
+    for field in ('equipment', 'maintenance_logs', 'semesters'):
+        items = data.get(field) or []
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return jsonify({
+                "success": False,
+                "error": f"'{field}' must be a list of objects"
+            }), 400
+    
+    started = time.perf_counter()
+    try:
+        room_usage = TIMETABLES.daily_usage_hours() if TIMETABLES is not None else None
+        features = featurize(data['equipment'], data.get('maintenance_logs') or [],
+                             data.get('semesters') or [], data.get('as_of'), room_usage=room_usage)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid featurization request: {e}"
+        }), 400
+    records = to_records(data['equipment'], features)
+    featurize_ms = round((time.perf_counter() - started) * 1000, 1)
+    
+    response = {
+        "success": True,
+        "processed_count": len(records),
+        "feature_names": FEATURE_COLUMNS,
+        "model_feature_coverage": model_feature_coverage(features),
+        "featurize_ms": featurize_ms,
+        "features": records
+    }
+    if data.get('store_features'):
+        try:
+            stored = store_features(records)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": f"Could not store features: {e}"
+            }), 400
+        response["stored"] = {key: value for key, value in stored.items() if key != "changed_ids"}
+    if data.get('predict'):
+        # Sensor fields absent from the records come from the rolling windows, else the C# defaults
+        response["predictions"] = predict_equipment_list([dict(record) for record in records],
+                                                         defaults=DEFAULT_SENSOR_VALUES)
+    return jsonify(response)
+
+def parse_counterfactual_bounds(value: Any) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """{feature: [low, high]} with null for a default end"""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError("bounds must map feature names to [low, high]")
+    bounds = {}
+    for feature, pair in value.items():
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            raise ValueError(f"bounds for {feature} must be [low, high]")
+        bounds[feature] = tuple(None if end is None else float(end) for end in pair)
+    return bounds
+
+@app.route('/api/equipment/counterfactual', methods=['POST'])
+@admission_controlled(INTERACTIVE)
+def counterfactual():
+    """
+    Smallest change to the controllable features (temperature, dust, usage hours) that brings
+    the predicted failure probability below target_probability (default: below High)
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({
+            "success": False,
+            "error": "Missing equipment record"
+        }), 400
+    
+    apply_sensor_features([data])
+    if not all(field in data for field in REQUIRED_FIELDS):
+        return jsonify({
+            "success": False,
+            "error": f"Missing required fields. Required: {REQUIRED_FIELDS}"
+        }), 400
+    
+    try:
+        record = parse_equipment_record(data)
+        target = float(data.get('target_probability', DEFAULT_COUNTERFACTUAL_TARGET))
+        if not 0.0 < target <= 1.0:
+            raise ValueError("target_probability must be in (0, 1]")
+        features = data.get('features')
+        if features is not None and not isinstance(features, list):
+            raise ValueError("features must be a list of feature names")
+        bounds = parse_counterfactual_bounds(data.get('bounds'))
+        # Type-routed equipment is explained by the model that scores it
+        engine = get_router().engine_for(record.get('equipment_type')) or get_engine()
+        result = search_for(engine).search(record, target=target, features=features, bounds=bounds)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid counterfactual request: {e}"
+        }), 400
+    except Exception as e:
+        logger.error(f"Counterfactual search error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    
+    return jsonify({"success": True, **result})
+
+@app.route('/api/equipment/predict-by-id', methods=['POST'])
+@admission_controlled(INTERACTIVE)
+def predict_by_id():
+    """Predict one equipment from its stored feature vector: {"equipment_id": "..."}"""
+    request_started = g.get('request_arrived', time.perf_counter())
+    data = request.get_json()
+    if not data or data.get('equipment_id') is None:
+        return jsonify({
+            "success": False,
+            "error": "Missing 'equipment_id'"
+        }), 400
+    try:
+        anytime_options = parse_anytime_options(data, request_started)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    prediction = predict_stored_equipment([data['equipment_id']], bool(data.get('use_sensor_features', False)),
+                                          **anytime_options)[0]
+    if not prediction.get("success", False) and "failure_probability" not in prediction:
+        # Unknown equipment, or a stored vector still missing required fields
+        status = 404 if prediction["error"].startswith("No stored features") else 400
+        return jsonify(prediction), status
+    return jsonify(prediction)
+
+@app.route('/api/equipment/predict-by-ids', methods=['POST'])
+@admission_controlled(BULK)
+def predict_by_ids():
+    """Predict many equipment from their stored feature vectors in one vectorized pass"""
+    request_started = g.get('request_arrived', time.perf_counter())
+    data = request.get_json()
+    if not data or not isinstance(data.get('equipment_ids'), list):
+        return jsonify({
+            "success": False,
+            "error": "Missing 'equipment_ids' list"
+        }), 400
+    try:
+        anytime_options = parse_anytime_options(data, request_started)
+        shape_options = response_options(data)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    predictions = predict_stored_equipment(data['equipment_ids'], bool(data.get('use_sensor_features', False)),
+                                           **anytime_options)
+    return jsonify({
+        "success": True,
+        "processed_count": len(predictions),
+        **shape_rows(predictions, "predictions", **shape_options)
+    })
+
+@app.route('/api/features', methods=['POST'])
+def upsert_features():
+    """
+    Create or partially update stored feature vectors: {"equipment": [{"equipment_id": "...", ...}]}.
+    Only the fields sent are changed.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get('equipment'), list):
+        return jsonify({
+            "success": False,
+            "error": "Missing 'equipment' list"
+        }), 400
+    try:
+        result = store_features(data['equipment'])
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    result.pop("changed_ids")
+    return jsonify({"success": True, **result, "equipment_count": len(get_feature_store().records)})
+
+@app.route('/api/features/<equipment_id>', methods=['GET'])
+def stored_features(equipment_id):
+    """Stored feature vector of one equipment"""
+    record = get_feature_store().get(equipment_id)
+    if record is None:
+        return jsonify({
+            "success": False,
+            "equipment_id": equipment_id,
+            "error": "No stored features for this equipment"
+        }), 404
+    
+    return jsonify({"success": True, **record})
+
+@app.route('/api/features/<equipment_id>', methods=['DELETE'])
+def delete_stored_features(equipment_id):
+    """Forget the stored feature vector of one equipment"""
+    if not get_feature_store().delete([equipment_id]):
+        return jsonify({
+            "success": False,
+            "equipment_id": equipment_id,
+            "error": "No stored features for this equipment"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "equipment_id": equipment_id,
+        "deleted": True
+    })
+
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_stats():
+    """Inference slot usage, queue wait times and rejection counts per priority lane"""
+    return jsonify({"success": True, **ADMISSION.describe()})
+
+@app.route('/api/jobs/batch-predict', methods=['POST'])
+def submit_batch_job():
+    """Start an asynchronous batch prediction job and return its ID"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'equipment_list' not in data:
+            return jsonify({
+                "success": False,
+                "error": "Missing 'equipment_list' field"
+            }), 400
+        
         equipment_list = data['equipment_list']
-        predictions = []
+        predictions, valid_positions, valid_records = parse_equipment_list(equipment_list)
+        errors = {position: response for position, response in enumerate(predictions) if response is not None}
+        job = get_batch_jobs().submit(len(equipment_list), list(zip(valid_positions, valid_records)), errors)
         
-        for equipment_data in equipment_list:
-            try:
-                # Validate each equipment item
-                required_fields = ['equipment_id', 'age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
-                if not all(field in equipment_data for field in required_fields):
-                    predictions.append({
-                        "success": False,
-                        "equipment_id": equipment_data.get('equipment_id', 'unknown'),
-                        "error": "Missing required fields"
-                    })
-                    continue
-                
-                # Create equipment data object
-                equipment = EquipmentData(
-                    equipment_id=equipment_data['equipment_id'],
-                    age_months=int(equipment_data['age_months']),
-                    operating_temperature=float(equipment_data['operating_temperature']),
-                    vibration_level=float(equipment_data['vibration_level']),
-                    power_consumption=float(equipment_data['power_consumption'])
-                )
-                
-                # Generate prediction
-                prediction = predict_with_trained_model(equipment)
-                predictions.append(prediction)
-                
-            except Exception as e:
-                predictions.append({
+        return jsonify({
+            "success": True,
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "total_rows": job["total_rows"],
+            "total_chunks": job["total_chunks"],
+            "status_url": f"/api/jobs/{job['job_id']}",
+            "results_url": f"/api/jobs/{job['job_id']}/results"
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Batch job submission error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def batch_job_status(job_id):
+    """Progress of a batch job"""
+    job = get_batch_jobs().status(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": f"Job {job_id} not found or expired"
+        }), 404
+    
+    return jsonify({"success": True, **job})
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def batch_job_results(job_id):
+    """
+    Page of batch job results.
+    Query parameters: offset (default 0) and limit (default 1000, max 10000).
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        if offset < 0 or limit <= 0:
+            raise ValueError("offset must be >= 0 and limit > 0")
+        shape_options = response_options()
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid query parameter: {e}"
+        }), 400
+    
+    page = get_batch_jobs().results(job_id, offset, limit)
+    if page is None:
+        return jsonify({
+            "success": False,
+            "error": f"Job {job_id} not found or expired"
+        }), 404
+    
+    page.update(shape_rows(page.pop("results"), "results", **shape_options))
+    return jsonify({"success": True, **page})
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_batch_job(job_id):
+    """Cancel a batch job and delete its results"""
+    if not get_batch_jobs().delete(job_id):
+        return jsonify({
+            "success": False,
+            "error": f"Job {job_id} not found or expired"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "deleted": True
+    })
+
+@app.route('/api/risk/<equipment_id>', methods=['GET'])
+def risk_lookup(equipment_id):
+    """Latest materialized risk for one equipment"""
+    row = get_risk_table().get(equipment_id)
+    if row is None:
+        return jsonify({
+            "success": False,
+            "equipment_id": equipment_id,
+            "error": "No risk computed for this equipment yet"
+        }), 404
+    
+    return jsonify({"success": True, **format_row(row)})
+
+@app.route('/api/risk/lookup', methods=['POST'])
+def risk_lookup_many():
+    """Latest materialized risk for a list of equipment IDs"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('equipment_ids'), list):
+        return jsonify({
+            "success": False,
+            "error": "Missing 'equipment_ids' list"
+        }), 400
+    try:
+        shape_options = response_options(data)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    now = time.time()
+    rows = get_risk_table().get_many(data['equipment_ids'])
+    return jsonify({
+        "success": True,
+        "found_count": sum(row is not None for row in rows),
+        **shape_rows([format_row(row, now) for row in rows if row is not None], "results", **shape_options),
+        "missing": [equipment_id for equipment_id, row in zip(data['equipment_ids'], rows) if row is None]
+    })
+
+@app.route('/api/risk/sweep', methods=['POST'])
+def risk_sweep():
+    """Re-score every known equipment now"""
+    try:
+        return jsonify({"success": True, **sweep_risk_table()})
+    except Exception as e:
+        logger.error(f"Risk sweep error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/fleet/rollup', methods=['GET'])
+def fleet_rollup():
+    """
+    Fleet totals and per-group risk distribution (?group_by=building,room), filtered by building,
+    room, equipment_type and min_risk_level, groups sorted by sort (descending) and cut to limit
+    """
+    try:
+        limit = request.args.get('limit')
+        result = get_fleet_rollups().rollup(
+            group_by=parse_group_by(request.args.get('group_by')),
+            sort=request.args.get('sort', DEFAULT_SORT),
+            limit=int(limit) if limit else None,
+            **fleet_filters())
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    return jsonify({"success": True, **result})
+
+@app.route('/api/fleet/top', methods=['GET'])
+def fleet_top():
+    """The k riskiest equipment (?k=10), with the same filters as /api/fleet/rollup"""
+    try:
+        shape_options = response_options()
+        rows, stats = get_fleet_rollups().top(k=int(request.args.get('k', DEFAULT_TOP_K)), **fleet_filters())
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    now = time.time()
+    return jsonify({
+        "success": True,
+        **stats,
+        **shape_rows([format_row(row, now) for row in rows], "results", **shape_options)
+    })
+
+@app.route('/api/rescore/sweep', methods=['POST'])
+@admission_controlled(BULK)
+def incremental_sweep():
+    """
+    Rescore only the equipment whose inputs changed since the last sweep (everything after a model
+    change) and return the rows whose risk level changed
+    """
+    try:
+        shape_options = response_options(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    try:
+        result = RESCORER.sweep(get_engine(), known_equipment_ids, rescoring_items, predict_equipment_list)
+    except Exception as e:
+        logger.error(f"Incremental sweep error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    
+    changes = result.pop("changes")
+    return jsonify({"success": True, **result, **shape_rows(changes, "changes", **shape_options)})
+
+@app.route('/api/rescore/mark', methods=['POST'])
+def mark_for_rescore():
+    """Mark equipment as changed so the next incremental sweep rescores it: {"equipment_ids": [...]}"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('equipment_ids'), list):
+        return jsonify({
+            "success": False,
+            "error": "Missing 'equipment_ids' list"
+        }), 400
+    
+    return jsonify({"success": True, "pending_count": RESCORER.mark(data['equipment_ids'])})
+
+@app.route('/api/rescore/status', methods=['GET'])
+def rescore_status():
+    """Pending dirty equipment, the model of the last sweep and its stats"""
+    return jsonify({
+        "success": True,
+        **RESCORER.describe(),
+        "model_change_pending": RESCORER.model_changed(get_engine())
+    })
+
+@app.route('/api/maintenance/schedule', methods=['POST'])
+def maintenance_schedule():
+    """Assign maintenance tasks to technician slots, highest risk first"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('tasks'), list) or not isinstance(data.get('technicians'), list):
+        return jsonify({
+            "success": False,
+            "error": "Missing 'tasks' or 'technicians' list"
+        }), 400
+    
+    # Tasks without a probability take it (and their location) from the materialized risk table
+    tasks = [dict(task) for task in data['tasks']]
+    missing = [task for task in tasks if task.get('failure_probability') is None]
+    rows = get_risk_table().get_many([task.get('equipment_id') for task in missing])
+    unknown = []
+    for task, row in zip(missing, rows):
+        if row is None:
+            unknown.append(task.get('equipment_id'))
+            continue
+        task['failure_probability'] = row['failure_probability']
+        for field in LOCATION_FIELDS:
+            if task.get(field) is None:
+                task[field] = row[field]
+    if unknown:
+        return jsonify({
+            "success": False,
+            "error": "No failure_probability given or materialized for some tasks",
+            "equipment_ids": unknown
+        }), 400
+    
+    try:
+        schedule = optimize_schedule(
+            tasks, data['technicians'], data.get('blackout_windows', []),
+            start=data.get('start'),
+            horizon_days=float(data.get('horizon_days', DEFAULT_HORIZON_DAYS)),
+            slot_minutes=int(data.get('slot_minutes', DEFAULT_SLOT_MINUTES)),
+            time_limit=float(data.get('time_limit_seconds', DEFAULT_TIME_LIMIT_SECONDS)))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid schedule request: {e}"
+        }), 400
+    except Exception as e:
+        logger.error(f"Schedule optimization error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    
+    return jsonify({"success": True, **schedule})
+
+@app.route('/api/timetables/extract', methods=['POST'])
+def extract_timetables():
+    """Parse the uploaded timetables; identical files are parsed once and cached by content hash"""
+    directory = os.environ.get(TIMETABLE_DIR_ENV_VAR, DEFAULT_TIMETABLE_DIR)
+    if not os.path.isdir(directory):
+        return jsonify({
+            "success": False,
+            "error": f"Timetable directory not found: {directory}"
+        }), 404
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        if isinstance(data.get('files'), list):
+            # Only names inside the timetable directory are accepted
+            paths = [os.path.join(directory, os.path.basename(str(name))) for name in data['files']]
+            missing = [os.path.basename(path) for path in paths if not os.path.isfile(path)]
+            if missing:
+                return jsonify({
                     "success": False,
-                    "equipment_id": equipment_data.get('equipment_id', 'unknown'),
-                    "error": str(e)
+                    "error": "Timetable files not found",
+                    "files": missing
+                }), 404
+            report = get_timetables().extract(paths)
+        else:
+            report = get_timetables().extract_directory(directory)
+    except Exception as e:
+        logger.error(f"Timetable extraction error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    
+    return jsonify({"success": True, **report})
+
+@app.route('/api/timetables/room-usage', methods=['GET'])
+def timetable_room_usage():
+    """Per-room daily usage hours from the last timetable extraction"""
+    if TIMETABLES is None or TIMETABLES.last_run is None:
+        return jsonify({
+            "success": False,
+            "error": "No timetables extracted yet; POST /api/timetables/extract first"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "last_run": TIMETABLES.last_run,
+        "rooms": TIMETABLES.usage
+    })
+
+@app.route('/api/sensors/ingest', methods=['POST'])
+def ingest_sensor_readings():
+    """Append sensor readings to the per-equipment ring buffers"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'readings' not in data:
+            return jsonify({
+                "success": False,
+                "error": "Missing 'readings' field"
+            }), 400
+        
+        readings = data['readings']
+        required_fields = ['equipment_id'] + REQUIRED_SENSOR_CHANNELS
+        valid = []
+        rejected = []
+        for position, reading in enumerate(readings):
+            missing_fields = [field for field in required_fields if field not in reading]
+            if missing_fields:
+                rejected.append({
+                    "index": position,
+                    "equipment_id": reading.get('equipment_id', 'unknown'),
+                    "error": f"Missing fields: {missing_fields}"
                 })
+            else:
+                valid.append(reading)
+        
+        try:
+            equipment_ids, timestamps, values = SENSOR_BUFFERS.readings_matrix(valid)
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                "success": False,
+                "error": f"Invalid reading values: {e}"
+            }), 400
+        
+        accepted = SENSOR_BUFFERS.append(equipment_ids, timestamps, values)
+        if SENSOR_STORE is not None:
+            SENSOR_STORE.append(equipment_ids, timestamps, values)
+        anomalies = ANOMALY_DETECTOR.update(equipment_ids, timestamps, values)
+        RESCORER.mark(set(equipment_ids))
         
         return jsonify({
             "success": True,
-            "processed_count": len(predictions),
-            "predictions": predictions
+            "accepted_count": accepted,
+            "rejected_count": len(rejected),
+            "rejected": rejected,
+            "equipment_tracked": len(SENSOR_BUFFERS.index),
+            "newly_anomalous": [event["equipment_id"] for event in anomalies]
         })
         
     except Exception as e:
+        logger.error(f"Sensor ingestion error: {e}")
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
+@app.route('/api/sensors/<equipment_id>/features', methods=['GET'])
+def sensor_features(equipment_id):
+    """Rolling sensor features for one equipment"""
+    features = SENSOR_BUFFERS.feature_dicts([equipment_id])[0]
+    if features is None:
+        return jsonify({
+            "success": False,
+            "equipment_id": equipment_id,
+            "error": "No sensor readings for this equipment"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "equipment_id": equipment_id,
+        "window": SENSOR_BUFFERS.window,
+        "features": features
+    })
+
+@app.route('/api/sensors/<equipment_id>/history', methods=['GET'])
+def sensor_history(equipment_id):
+    """
+    Stored sensor history for one equipment.
+    Query parameters: start, end (ISO-8601 or epoch seconds), interval (seconds, downsamples to bucket means)
+    and limit (maximum raw rows, default 10000).
+    """
+    if SENSOR_STORE is None:
+        return jsonify({
+            "success": False,
+            "error": "Sensor history store not configured (set ML_SENSOR_STORE_DIR)"
+        }), 503
+    
+    try:
+        start = parse_timestamp(request.args['start']) if 'start' in request.args else None
+        end = parse_timestamp(request.args['end']) if 'end' in request.args else None
+        interval = float(request.args['interval']) if 'interval' in request.args else None
+        limit = int(request.args.get('limit', 10000))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid query parameter: {e}"
+        }), 400
+    
+    try:
+        if interval is not None:
+            history = SENSOR_STORE.downsample(equipment_id, interval, start, end)
+        else:
+            history = SENSOR_STORE.scan(equipment_id, start, end)
+            history = {column: values[:limit] for column, values in history.items()}
+        
+        return jsonify({
+            "success": True,
+            "equipment_id": equipment_id,
+            "rows": int(len(next(iter(history.values())))),
+            "interval_seconds": interval,
+            "columns": {column: [None if np.isnan(value) else value for value in values.tolist()]
+                        for column, values in history.items()}
+        })
+        
+    except Exception as e:
+        logger.error(f"Sensor history error for {equipment_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/anomalies/new', methods=['GET'])
+def new_anomalies():
+    """
+    Equipment that became anomalous since a cursor.
+    Query parameters: since (last sequence number seen, default 0) and limit.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid query parameter: {e}"
+        }), 400
+    
+    events = ANOMALY_DETECTOR.events_since(since, limit)
+    return jsonify({
+        "success": True,
+        "events": events,
+        "equipment_ids": [event["equipment_id"] for event in events],
+        "next_since": events[-1]["sequence"] if events else max(since, 0)
+    })
+
+@app.route('/api/anomalies/active', methods=['GET'])
+def active_anomalies():
+    """Equipment currently flagged as anomalous"""
+    active = ANOMALY_DETECTOR.active()
+    return jsonify({
+        "success": True,
+        "count": len(active),
+        "anomalies": active,
+        "detector": ANOMALY_DETECTOR.describe()
+    })
+
+@app.route('/api/shadow', methods=['GET'])
+def shadow_status():
+    """Running comparison of the shadow candidate against production"""
+    if SHADOW is None:
+        return jsonify({
+            "success": False,
+            "error": "No shadow model loaded"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "production_model_version": get_engine().model_version,
+        **SHADOW.describe()
+    })
+
+@app.route('/api/shadow', methods=['POST'])
+def load_shadow_model():
+    """Load a candidate model file as the shadow, replacing any current one"""
+    global SHADOW
+    data = request.get_json(silent=True) or {}
+    if not data.get('model'):
+        return jsonify({
+            "success": False,
+            "error": "Missing 'model' (file name in the shadow model directory)"
+        }), 400
+    
+    try:
+        path = resolve_model_path(data['model'])
+        shadow = ShadowEvaluator.from_path(path, float(data.get('sample_rate', DEFAULT_SHADOW_SAMPLE_RATE)))
+    except FileNotFoundError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 404
+    except Exception as e:
+        logger.error(f"Shadow model load error: {e}")
+        return jsonify({
+            "success": False,
+            "error": f"Could not load shadow model: {e}"
+        }), 400
+    
+    previous, SHADOW = SHADOW, shadow
+    if previous is not None:
+        previous.stop()
+    return jsonify({"success": True, **shadow.describe()})
+
+@app.route('/api/shadow', methods=['DELETE'])
+def stop_shadow_model():
+    """Stop shadow evaluation and drop the candidate"""
+    global SHADOW
+    previous, SHADOW = SHADOW, None
+    if previous is None:
+        return jsonify({
+            "success": False,
+            "error": "No shadow model loaded"
+        }), 404
+    
+    previous.stop()
+    return jsonify({"success": True, **previous.describe()})
+
+@app.route('/api/shadow/promote', methods=['POST'])
+def promote_shadow_model():
+    """Serve the shadow candidate as the production engine; returns the final comparison"""
+    global MODEL_SYSTEM, ENGINE, SHADOW
+    if SHADOW is None:
+        return jsonify({
+            "success": False,
+            "error": "No shadow model loaded"
+        }), 404
+    
+    if SHADOW.model_path is None:
+        return jsonify({
+            "success": False,
+            "error": "Shadow model has no file for batch job workers to load"
+        }), 400
+    
+    # Batch workers load their model once per process; restart them on the promoted file
+    try:
+        get_batch_jobs().use_model(SHADOW.model_path)
+    except RuntimeError as e:
+        return jsonify({
+            "success": False,
+            "error": f"Cannot promote while batch jobs are running: {e}"
+        }), 409
+    
+    shadow, SHADOW = SHADOW, None
+    shadow.stop()
+    previous_version = get_engine().model_version
+    engine = shadow.engine
+    if isinstance(engine, ForestEngine):
+        engine.region_index = load_region_index_for(engine)
+    MODEL_SYSTEM, ENGINE = shadow.model_system, engine
+    logger.info(f"Promoted shadow model {engine.model_version} (was {previous_version})")
+    return jsonify({
+        "success": True,
+        "previous_model_version": previous_version,
+        "model_version": engine.model_version,
+        "evaluation": shadow.describe()
+    })
+
+def cache_sizes() -> Dict[str, Any]:
+    """Approximate bytes held by each in-process cache and state store"""
+    caches: Dict[str, Any] = {
+        "sensor_buffers": {"bytes": SENSOR_BUFFERS.nbytes},
+        "anomaly_detector": {"bytes": ANOMALY_DETECTOR.nbytes},
+        "academic_calendar": calendar_cache_info()
+    }
+    if RISK_TABLE is not None:
+        caches["risk_table"] = {
+            "equipment_count": len(RISK_TABLE.rows),
+            "bytes": estimate_mapping_bytes(RISK_TABLE.rows) + estimate_mapping_bytes(RISK_TABLE.records)
+        }
+    if FEATURE_STORE is not None:
+        caches["feature_store"] = {
+            "equipment_count": len(FEATURE_STORE.records),
+            "bytes": estimate_mapping_bytes(FEATURE_STORE.records)
+        }
+    if FLEET_ROLLUPS is not None:
+        caches["fleet_rollups"] = {"rows": FLEET_ROLLUPS.describe()["frame_rows"],
+                                   "bytes": FLEET_ROLLUPS.describe()["frame_bytes"]}
+    if MODEL_ROUTER is not None:
+        caches["type_models"] = {
+            "loaded_types": len(MODEL_ROUTER.describe()["loaded_types"]),
+            "bytes": MODEL_ROUTER.loaded_bytes,
+            "memory_cap_bytes": MODEL_ROUTER.memory_cap_bytes
+        }
+    if TIMETABLES is not None:
+        caches["timetable_usage"] = {"rooms": len(TIMETABLES.usage), "bytes": deep_sizeof(TIMETABLES.usage)}
+    if SHADOW is not None:
+        caches["shadow_model"] = {"bytes": model_footprint(SHADOW.model_system, SHADOW.engine,
+                                                           per_estimator=False)["total_bytes"]}
+    return caches
+
+@app.route('/api/admin/memory', methods=['GET'])
+def memory_report():
+    """Process RSS, model footprint per component and per estimator, and cache sizes"""
+    started = time.perf_counter()
+    per_estimator = request.args.get('per_estimator', 'true').lower() not in ('0', 'false', 'no')
+    try:
+        report = {
+            "process": process_memory(),
+            "model": model_footprint(MODEL_SYSTEM, get_engine(), per_estimator=per_estimator),
+            "caches": cache_sizes(),
+            "tracemalloc": MEMORY_TRACER.describe()
+        }
+    except Exception as e:
+        logger.error(f"Memory report error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    
+    report["report_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return jsonify({"success": True, **report})
+
+@app.route('/api/admin/memory/snapshot', methods=['POST'])
+def memory_snapshot():
+    """
+    Take a tracemalloc snapshot. The first call starts tracing and records the baseline;
+    later calls return the top allocation differences against the previous snapshot (or the baseline).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        result = MEMORY_TRACER.snapshot(
+            frames=int(data.get('frames', DEFAULT_TRACE_FRAMES)),
+            limit=int(data.get('limit', DEFAULT_TOP_STATS)),
+            group_by=str(data.get('group_by', 'lineno')),
+            compare_to=str(data.get('compare_to', 'previous'))
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    return jsonify({"success": True, **result})
+
+@app.route('/api/admin/memory/snapshot', methods=['DELETE'])
+def stop_memory_tracing():
+    """Stop tracemalloc and drop the stored snapshots"""
+    return jsonify({"success": True, **MEMORY_TRACER.stop()})
+
 @app.route('/model/retrain', methods=['POST'])
 def retrain_model():
     """Simulate model retraining (placeholder)"""
@@ -414,6 +1605,11 @@ def retrain_model():
         "new_version": "test-v1.1"
     })
 
+@app.after_request
+def compress_json(response):
+    """gzip/zstd-compress JSON responses when the client sends a matching Accept-Encoding"""
+    return compress_response(response, request.headers.get('Accept-Encoding', ''))
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -435,9 +1631,45 @@ if __name__ == '__main__':
     print("   GET  /api/model/info                - Model information")
     print("   POST /api/equipment/predict         - Single equipment prediction")
     print("   POST /api/equipment/batch-predict   - Batch equipment predictions")
+    print("   POST /api/equipment/featurize       - Features from raw equipment records")
+    print("   POST /api/equipment/counterfactual  - Smallest change that lowers the risk")
+    print("   POST /api/equipment/predict-by-id   - Predict from the stored feature vector")
+    print("   POST /api/equipment/predict-by-ids  - Predict many from stored feature vectors")
+    print("   POST /api/features                  - Upsert stored feature vectors (partial)")
+    print("   GET  /api/features/<id>             - Stored feature vector")
+    print("   DELETE /api/features/<id>           - Forget a stored feature vector")
+    print("   GET  /api/admission/stats           - Prediction queue and rejection metrics")
+    print("   POST /api/jobs/batch-predict        - Start an asynchronous batch job")
+    print("   GET  /api/jobs/<id>                 - Batch job progress")
+    print("   GET  /api/jobs/<id>/results         - Paginated batch job results")
+    print("   GET  /api/risk/<id>                 - Materialized risk lookup")
+    print("   POST /api/risk/lookup               - Materialized risk for many IDs")
+    print("   POST /api/risk/sweep                - Re-score the known fleet")
+    print("   GET  /api/fleet/rollup              - Fleet risk by building/room/type")
+    print("   GET  /api/fleet/top                 - Riskiest equipment (top K)")
+    print("   POST /api/rescore/sweep             - Rescore changed equipment only")
+    print("   POST /api/rescore/mark              - Mark equipment as changed")
+    print("   GET  /api/rescore/status            - Incremental rescoring state")
+    print("   POST /api/maintenance/schedule      - Optimize the maintenance schedule")
+    print("   POST /api/timetables/extract        - Parse timetables into room usage")
+    print("   GET  /api/timetables/room-usage     - Per-room daily usage hours")
+    print("   POST /api/sensors/ingest            - Ingest sensor readings")
+    print("   GET  /api/sensors/<id>/features     - Rolling sensor features")
+    print("   GET  /api/sensors/<id>/history      - Stored sensor history")
+    print("   GET  /api/anomalies/new             - Newly anomalous equipment")
+    print("   GET  /api/anomalies/active          - Currently anomalous equipment")
+    print("   GET  /api/shadow                    - Shadow model comparison")
+    print("   POST /api/shadow                    - Load a shadow candidate model")
+    print("   DELETE /api/shadow                  - Stop shadow evaluation")
+    print("   POST /api/shadow/promote            - Promote the shadow model")
+    print("   GET  /api/admin/memory              - Memory footprint of the model and caches")
+    print("   POST /api/admin/memory/snapshot     - tracemalloc snapshot diff")
+    print("   DELETE /api/admin/memory/snapshot   - Stop tracemalloc")
     print("   POST /model/retrain                 - Simulate model retraining")
-    print("Server starting on http://localhost:5001")
+    print(f"Listening on {os.environ.get(LISTEN_ENV_VAR, DEFAULT_LISTEN)} "
+          f"(set {LISTEN_ENV_VAR}=tcp://host:port,unix:///path/ml.sock to change)")
     print("Using REAL trained Random Forest model (91% R2 accuracy, 8 features)")
+    print("Set ML_ENGINE=forest|heuristic|auto to choose the predictor engine")
     print("Ready for .NET ProactED integration with production model!")
     print("")
     
@@ -445,8 +1677,8 @@ if __name__ == '__main__':
     try:
         initialize_model()
         print("Starting Flask server...")
-        # Use a more stable Flask configuration
-        app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False, threaded=True, processes=1)
+        # Threaded keep-alive servers on TCP and/or a Unix domain socket (see transport.py)
+        serve(app)
     except Exception as e:
         print(f"Error starting Flask server: {e}")
         import traceback
@@ -0,0 +1,392 @@
+"""
+Asynchronous batch prediction jobs for the ProactED ML API
+A submitted batch is split into fixed-size chunks scored by a pool of worker processes. Each chunk's
+results are written to local disk as soon as it finishes, so clients can poll progress and page through
+results without holding an HTTP connection open. Finished jobs are deleted after a TTL.
+"""
+
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from engines import ForestEngine, create_engine, load_engine, load_model_file
+from model_router import ModelRouter
+from region_index import load_region_index_for
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR_ENV_VAR = 'ML_JOBS_DIR'
+DEFAULT_JOBS_DIR = os.path.join(tempfile.gettempdir(), 'proacted_ml_jobs')
+
+JOB_WORKERS_ENV_VAR = 'ML_JOB_WORKERS'
+JOB_CHUNK_ROWS_ENV_VAR = 'ML_JOB_CHUNK_ROWS'
+JOB_TTL_ENV_VAR = 'ML_JOB_TTL_SECONDS'
+
+DEFAULT_CHUNK_ROWS = 5000
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# Minimum seconds between sweeps for expired jobs
+CLEANUP_INTERVAL_SECONDS = 60
+
+META_FILENAME = 'job.json'
+
+# Job IDs are uuid4().hex; anything else never names a job directory
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+INTERRUPTED = 'interrupted'
+
+# Per-process scoring state, built once by the pool initializer
+_WORKER_ROUTER: Optional[ModelRouter] = None
+
+
+def _init_worker(model_path: Optional[str] = None) -> None:
+    """
+    Build the same engine stack the server uses (engine, region index, type models).
+    model_path, when given, is a promoted model file to serve instead of the configured model.
+    """
+    global _WORKER_ROUTER
+    engine = create_engine(ForestEngine.name, load_model_file(model_path)) if model_path else load_engine()
+    if isinstance(engine, ForestEngine):
+        engine.region_index = load_region_index_for(engine)
+    _WORKER_ROUTER = ModelRouter.from_environment(engine)
+
+
+def chunk_path(job_dir: str, chunk: int) -> str:
+    return os.path.join(job_dir, f"chunk-{chunk:06d}.json")
+
+
+def write_json(path: str, payload: Any) -> None:
+    """Write via a temporary file so readers never see a partial file"""
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(payload, f)
+    os.replace(temporary, path)
+
+
+def score_chunk(job_dir: str, chunk: int, size: int, records: List[Tuple[int, Dict[str, Any]]],
+                errors: Dict[int, Dict[str, Any]], timestamp: Optional[str] = None) -> Tuple[int, int, str]:
+    """
+    Score one chunk in a worker process and write its results, ordered by position.
+    records are (position, parsed record) pairs; errors are precomputed responses for invalid rows.
+    timestamp is the job's prediction timestamp, shared by every chunk.
+    Returns (rows written, rows failed, model version of the worker's default engine).
+    """
+    base = chunk * size
+    results: List[Optional[Dict[str, Any]]] = [None] * (len(records) + len(errors))
+    for position, response in errors.items():
+        results[position - base] = response
+
+    if records:
+        positions = [position for position, _ in records]
+        try:
+            predictions = _WORKER_ROUTER.predict_records([record for _, record in records], timestamp=timestamp)
+        except Exception as e:
+            predictions = [{
+                "success": False,
+                "equipment_id": record['equipment_id'],
+                "error": f"Prediction failed: {e}"
+            } for _, record in records]
+        for position, (_, record), prediction in zip(positions, records, predictions):
+            if record.get('sensor_features_used'):
+                prediction["sensor_features_used"] = True
+            results[position - base] = prediction
+
+    write_json(chunk_path(job_dir, chunk), results)
+    failed = sum(1 for result in results if not result.get("success", False))
+    return len(results), failed, _WORKER_ROUTER.default_engine.model_version
+
+
+class BatchJobManager:
+    """
+    Submits chunked jobs to a process pool and serves their status and results from disk.
+    on_results(records, results), when given, is called in the server process for every finished chunk.
+    """
+
+    def __init__(self, jobs_dir: str = DEFAULT_JOBS_DIR, workers: Optional[int] = None,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 on_results: Optional[Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], Any]] = None):
+        self.jobs_dir = jobs_dir
+        self.on_results = on_results
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.chunk_rows = chunk_rows
+        self.ttl_seconds = ttl_seconds
+        # Model file the workers load in place of the configured model, set when a model is promoted
+        self.model_path: Optional[str] = None
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._futures: Dict[str, List[concurrent.futures.Future]] = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls, on_results=None) -> 'BatchJobManager':
+        workers = os.environ.get(JOB_WORKERS_ENV_VAR)
+        return cls(
+            jobs_dir=os.environ.get(JOBS_DIR_ENV_VAR, DEFAULT_JOBS_DIR),
+            workers=int(workers) if workers else None,
+            chunk_rows=int(os.environ.get(JOB_CHUNK_ROWS_ENV_VAR, DEFAULT_CHUNK_ROWS)),
+            ttl_seconds=float(os.environ.get(JOB_TTL_ENV_VAR, DEFAULT_TTL_SECONDS)),
+            on_results=on_results
+        )
+
+    def _pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                                   initializer=_init_worker,
+                                                                   initargs=(self.model_path,))
+        return self._executor
+
+    def use_model(self, model_path: str) -> None:
+        """
+        Score later jobs with the model file at model_path. The worker pool is replaced so its
+        initializer loads the new model; raises RuntimeError while jobs are running on the old one.
+        """
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job["status"] == RUNNING)
+            if active:
+                raise RuntimeError(f"{active} batch job(s) still running on the current model")
+            self.model_path = model_path
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def job_dir(self, job_id: str) -> Optional[str]:
+        """Directory of a job, or None when job_id is not a generated ID directly under jobs_dir"""
+        if not isinstance(job_id, str) or not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        path = os.path.realpath(os.path.join(self.jobs_dir, job_id))
+        if os.path.dirname(path) != os.path.realpath(self.jobs_dir):
+            return None
+        return path
+
+    def submit(self, total: int, records: List[Tuple[int, Dict[str, Any]]],
+               errors: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Start a job over `total` rows: records are (position, parsed record) pairs for valid rows,
+        errors map positions of invalid rows to their error responses.
+        """
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir)
+
+        n_chunks = (total + self.chunk_rows - 1) // self.chunk_rows
+        job = {
+            "job_id": job_id,
+            "status": RUNNING if n_chunks else COMPLETED,
+            "total_rows": total,
+            "chunk_rows": self.chunk_rows,
+            "total_chunks": n_chunks,
+            "completed_chunks": 0,
+            "completed_rows": 0,
+            "failed_rows": 0,
+            "created_at": time.time(),
+            "finished_at": None if n_chunks else time.time(),
+            "model_version": None,
+            "error": None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._futures[job_id] = []
+        write_json(os.path.join(job_dir, META_FILENAME), job)
+
+        chunk_records: List[List[Tuple[int, Dict[str, Any]]]] = [[] for _ in range(n_chunks)]
+        chunk_errors: List[Dict[int, Dict[str, Any]]] = [{} for _ in range(n_chunks)]
+        for position, record in records:
+            chunk_records[position // self.chunk_rows].append((position, record))
+        for position, response in errors.items():
+            chunk_errors[position // self.chunk_rows][position] = response
+
+        timestamp = datetime.datetime.utcfromtimestamp(job["created_at"]).isoformat()
+        pool = self._pool()
+        for chunk in range(n_chunks):
+            future = pool.submit(score_chunk, job_dir, chunk, self.chunk_rows, chunk_records[chunk],
+                                 chunk_errors[chunk], timestamp)
+            future.add_done_callback(lambda done, job_id=job_id, chunk=chunk, records=chunk_records[chunk]:
+                                     self._chunk_done(job_id, chunk, records, done))
+            self._futures[job_id].append(future)
+
+        logger.info(f"Job {job_id}: {total} rows in {n_chunks} chunk(s) of {self.chunk_rows}")
+        return self.status(job_id)
+
+    def _chunk_done(self, job_id: str, chunk: int, records: List[Tuple[int, Dict[str, Any]]],
+                    future: concurrent.futures.Future) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != RUNNING or future.cancelled():
+                return
+            try:
+                rows, failed, model_version = future.result()
+            except Exception as e:
+                logger.error(f"Job {job_id} chunk failed: {e}")
+                job["status"] = FAILED
+                job["error"] = str(e)
+                job["finished_at"] = time.time()
+                for pending in self._futures.get(job_id, []):
+                    pending.cancel()
+            else:
+                job["completed_chunks"] += 1
+                job["completed_rows"] += rows
+                job["failed_rows"] += failed
+                job["model_version"] = model_version
+                if job["completed_chunks"] == job["total_chunks"]:
+                    job["status"] = COMPLETED
+                    job["finished_at"] = time.time()
+            finished = job["status"] in (COMPLETED, FAILED)
+            succeeded = job["error"] is None
+            snapshot = dict(job)
+
+        if succeeded and records and self.on_results is not None:
+            try:
+                with open(chunk_path(self.job_dir(job_id), chunk)) as f:
+                    results = json.load(f)
+                base = chunk * snapshot["chunk_rows"]
+                self.on_results([record for _, record in records],
+                                [results[position - base] for position, _ in records])
+            except Exception as e:
+                logger.error(f"Job {job_id} chunk {chunk} results hook failed: {e}")
+
+        if finished:
+            write_json(os.path.join(self.job_dir(job_id), META_FILENAME), snapshot)
+            logger.info(f"Job {job_id} {snapshot['status']} ({snapshot['completed_rows']} rows)")
+
+    def _job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """In-memory state, or the state on disk for jobs from an earlier process"""
+        with self._lock:
+            if job_id in self._jobs:
+                return dict(self._jobs[job_id])
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None
+        path = os.path.join(job_dir, META_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            job = json.load(f)
+        if job["status"] == RUNNING:
+            # The process that ran it is gone; completed chunks are still readable
+            job["status"] = INTERRUPTED
+        return job
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self.cleanup()
+        job = self._job(job_id)
+        if job is None:
+            return None
+        now = time.time()
+        elapsed = (job["finished_at"] or now) - job["created_at"]
+        progress = job["completed_rows"] / job["total_rows"] if job["total_rows"] else 1.0
+        status = {
+            **job,
+            "progress": round(progress, 4),
+            "elapsed_seconds": round(elapsed, 3),
+            "estimated_seconds_remaining": (round(elapsed * (1 - progress) / progress, 1)
+                                            if 0 < progress < 1 and job["status"] == RUNNING else None),
+            "expires_at": (job["finished_at"] + self.ttl_seconds) if job["finished_at"] else None
+        }
+        for field in ("created_at", "finished_at", "expires_at"):
+            if status[field] is not None:
+                status[field] = datetime.datetime.fromtimestamp(status[field], datetime.timezone.utc).isoformat()
+        return status
+
+    def results(self, job_id: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Optional[Dict[str, Any]]:
+        """
+        Results for rows [offset, offset + limit) that are ready. Chunks finish out of order,
+        so a page stops at the first chunk still being scored.
+        """
+        job = self._job(job_id)
+        if job is None:
+            return None
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        end = min(offset + limit, job["total_rows"])
+        rows: List[Dict[str, Any]] = []
+        position = offset
+        while position < end:
+            chunk = position // job["chunk_rows"]
+            path = chunk_path(self.job_dir(job_id), chunk)
+            if not os.path.exists(path):
+                break
+            with open(path) as f:
+                chunk_results = json.load(f)
+            start = position - chunk * job["chunk_rows"]
+            taken = chunk_results[start:start + (end - position)]
+            rows.extend(taken)
+            position += len(taken)
+
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "offset": offset,
+            "count": len(rows),
+            "total_rows": job["total_rows"],
+            "next_offset": position if position < job["total_rows"] else None,
+            "results": rows
+        }
+
+    def delete(self, job_id: str) -> bool:
+        """Cancel pending chunks and remove the job's files"""
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return False
+        with self._lock:
+            for future in self._futures.pop(job_id, []):
+                future.cancel()
+            known = self._jobs.pop(job_id, None) is not None
+        if os.path.isdir(job_dir):
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return True
+        return known
+
+    def cleanup(self, force: bool = False) -> int:
+        """Delete finished jobs older than the TTL; returns the number removed"""
+        now = time.time()
+        if not force and now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return 0
+        self._last_cleanup = now
+
+        removed = 0
+        for job_id in os.listdir(self.jobs_dir):
+            job = self._job(job_id)
+            if job is None:
+                continue
+            finished = job["finished_at"]
+            if job["status"] == INTERRUPTED:
+                finished = finished or os.path.getmtime(os.path.join(self.job_dir(job_id), META_FILENAME))
+            if finished is not None and now - finished > self.ttl_seconds:
+                self.delete(job_id)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} expired job(s)")
+        return removed
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job["status"] == RUNNING)
+        return {
+            "jobs_dir": self.jobs_dir,
+            "workers": self.workers,
+            "chunk_rows": self.chunk_rows,
+            "ttl_seconds": self.ttl_seconds,
+            "model_path": self.model_path,
+            "active_jobs": active
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
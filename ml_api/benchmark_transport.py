@@ -0,0 +1,177 @@
+"""
+Single-prediction latency over TCP and a Unix domain socket
+Starts the API in a subprocess listening on both transports (or uses a running server) and times
+sequential POST /api/equipment/predict calls, over one kept-alive connection and with a new
+connection per request, so the transports can be compared the way the .NET client uses them.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from transport import KEEPALIVE_ENV_VAR, LISTEN_ENV_VAR, UnixHTTPConnection
+
+ML_API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_REQUESTS = 2000
+DEFAULT_WARMUP = 200
+STARTUP_TIMEOUT_SECONDS = 60
+
+PREDICT_BODY = json.dumps({
+    "equipment_id": "BENCH-1",
+    "age_months": 36,
+    "operating_temperature": 58.0,
+    "vibration_level": 3.2,
+    "power_consumption": 850.0
+}).encode()
+HEADERS = {"Content-Type": "application/json"}
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def connection_factory(tcp_port: Optional[int], socket_path: Optional[str]) -> Callable[[], http.client.HTTPConnection]:
+    if socket_path:
+        return lambda: UnixHTTPConnection(socket_path)
+    return lambda: http.client.HTTPConnection('127.0.0.1', tcp_port, timeout=30)
+
+
+def predict(connection: http.client.HTTPConnection) -> None:
+    connection.request('POST', '/api/equipment/predict', body=PREDICT_BODY, headers=HEADERS)
+    response = connection.getresponse()
+    body = response.read()
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status}: {body[:200]!r}")
+
+
+def time_requests(connect: Callable[[], http.client.HTTPConnection], requests: int, warmup: int,
+                  keep_alive: bool) -> Dict[str, Any]:
+    """Latency percentiles of sequential single predictions"""
+    latencies = np.empty(requests)
+    connection = connect() if keep_alive else None
+    try:
+        for i in range(-warmup, requests):
+            started = time.perf_counter()
+            if keep_alive:
+                predict(connection)
+            else:
+                fresh = connect()
+                try:
+                    predict(fresh)
+                finally:
+                    fresh.close()
+            if i >= 0:
+                latencies[i] = time.perf_counter() - started
+    finally:
+        if connection is not None:
+            connection.close()
+    latencies *= 1000.0
+    return {
+        "requests": requests,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "requests_per_second": round(float(requests / latencies.sum() * 1000.0), 1)
+    }
+
+
+def start_server(tcp_port: int, socket_path: str, workdir: str) -> subprocess.Popen:
+    """Run app.py listening on both transports, with its state files in a scratch directory"""
+    environment = dict(os.environ)
+    environment.update({
+        LISTEN_ENV_VAR: f"tcp://127.0.0.1:{tcp_port},unix://{socket_path}",
+        'ML_RISK_TABLE_PATH': os.path.join(workdir, 'risk_table.db'),
+        'ML_JOBS_DIR': os.path.join(workdir, 'jobs')
+    })
+    environment.setdefault(KEEPALIVE_ENV_VAR, '75')
+    server = subprocess.Popen([sys.executable, os.path.join(ML_API_DIR, 'app.py')], cwd=ML_API_DIR,
+                              env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"API exited during startup with code {server.returncode}")
+        try:
+            for connect in (connection_factory(tcp_port, None), connection_factory(None, socket_path)):
+                connection = connect()
+                connection.request('GET', '/api/health')
+                connection.getresponse().read()
+                connection.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("API did not start listening in time")
+
+
+def benchmark(tcp_port: int, socket_path: str, requests: int, warmup: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for transport, connect in (('tcp', connection_factory(tcp_port, None)),
+                               ('unix', connection_factory(None, socket_path))):
+        results[transport] = {
+            "keep_alive": time_requests(connect, requests, warmup, keep_alive=True),
+            "new_connection": time_requests(connect, requests, warmup, keep_alive=False)
+        }
+    for mode in ('keep_alive', 'new_connection'):
+        tcp, unix = results['tcp'][mode], results['unix'][mode]
+        results.setdefault('unix_vs_tcp', {})[mode] = {
+            "p50_saved_ms": round(tcp["p50_ms"] - unix["p50_ms"], 3),
+            "p50_speedup": round(tcp["p50_ms"] / unix["p50_ms"], 3) if unix["p50_ms"] else None
+        }
+    return results
+
+
+def print_table(results: Dict[str, Any]) -> None:
+    print(f"{'transport':<10}{'connection':<16}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for transport in ('tcp', 'unix'):
+        for mode, stats in results[transport].items():
+            print(f"{transport:<10}{mode:<16}{stats['mean_ms']:>10.3f}{stats['p50_ms']:>10.3f}"
+                  f"{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['requests_per_second']:>10.1f}")
+    for mode, delta in results['unix_vs_tcp'].items():
+        print(f"unix vs tcp ({mode}): p50 {delta['p50_saved_ms']:+.3f} ms saved, {delta['p50_speedup']}x")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare single-prediction latency over TCP and a Unix socket")
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--port', type=int, default=None,
+                        help="TCP port of a running API (with --socket); starts a server when omitted")
+    parser.add_argument('--socket', default=None, help="Unix socket path of a running API")
+    parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    server: Optional[subprocess.Popen] = None
+    with tempfile.TemporaryDirectory(prefix='ml_transport_bench_') as workdir:
+        tcp_port, socket_path = args.port, args.socket
+        if tcp_port is None or socket_path is None:
+            tcp_port, socket_path = free_port(), os.path.join(workdir, 'ml.sock')
+            server = start_server(tcp_port, socket_path, workdir)
+        try:
+            results = benchmark(tcp_port, socket_path, args.requests, args.warmup)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Compact array representation of the trained Random Forest
+Thresholds are stored as float32 in raw feature units (the StandardScaler is folded in),
+child indices use the smallest unsigned type that fits, and prediction is a vectorized
+walk over all trees at once. Produced by optimize_model.py and loaded by engines.load_model_system.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+COMPACT_FORMAT_VERSION = 1
+
+# Rows per traversal chunk; bounds the (rows x trees) index matrices
+PREDICT_CHUNK_ROWS = 4096
+
+LEAF = -1
+
+
+def smallest_uint(max_value: int) -> np.dtype:
+    """Smallest unsigned integer dtype able to hold max_value"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def smallest_int(min_value: int, max_value: int) -> np.dtype:
+    """Smallest signed integer dtype able to hold [min_value, max_value]"""
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class TreeNodes:
+    """
+    Mutable per-tree node lists used while simplifying a tree before compaction.
+    Children are local node indices; leaves have feature == LEAF.
+    """
+
+    def __init__(self, feature: List[int], threshold: List[float], left: List[int], right: List[int],
+                 value: List[float]):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+
+    @classmethod
+    def from_sklearn(cls, estimator: Any, scale: Optional[np.ndarray] = None,
+                     offset: Optional[np.ndarray] = None) -> 'TreeNodes':
+        """
+        Copy an sklearn tree, folding x_scaled = (x - offset) / scale into the thresholds:
+        x_scaled <= t  <=>  x <= t * scale + offset   (scale > 0)
+        """
+        tree = estimator.tree_
+        feature = tree.feature.astype(np.int64)
+        threshold = tree.threshold.astype(np.float64)
+        internal = feature >= 0
+        if scale is not None:
+            threshold[internal] = threshold[internal] * scale[feature[internal]] + offset[feature[internal]]
+        value = tree.value.reshape(tree.node_count, -1)[:, 0].astype(np.float64)
+        feature[~internal] = LEAF
+        return cls(feature.tolist(), threshold.tolist(), tree.children_left.tolist(),
+                   tree.children_right.tolist(), value.tolist())
+
+    def simplify(self, n_features: int) -> Tuple['TreeNodes', int]:
+        """
+        Rebuild the tree without redundant splits:
+        - splits whose outcome is already decided by an ancestor's bounds are bypassed
+        - internal nodes whose two subtrees collapse to the same float32 leaf value become leaves
+        Returns the new tree and the number of splits removed.
+        """
+        feature, threshold, value = [], [], []
+        left, right = [], []
+        removed = 0
+
+        def emit_leaf(leaf_value: float) -> int:
+            feature.append(LEAF)
+            threshold.append(0.0)
+            left.append(0)
+            right.append(0)
+            value.append(leaf_value)
+            return len(feature) - 1
+
+        def build(node: int, lower: np.ndarray, upper: np.ndarray) -> int:
+            nonlocal removed
+            # Bypass splits decided by the path: lower < x <= upper
+            while self.feature[node] != LEAF:
+                f, t = self.feature[node], self.threshold[node]
+                if upper[f] <= t:
+                    node = self.left[node]
+                elif lower[f] >= t:
+                    node = self.right[node]
+                else:
+                    break
+                removed += 1
+
+            if self.feature[node] == LEAF:
+                return emit_leaf(self.value[node])
+
+            f, t = self.feature[node], self.threshold[node]
+            index = emit_leaf(self.value[node])
+            saved_upper, saved_lower = upper[f], lower[f]
+            upper[f] = t
+            left_index = build(self.left[node], lower, upper)
+            upper[f] = saved_upper
+            lower[f] = t
+            right_index = build(self.right[node], lower, upper)
+            lower[f] = saved_lower
+
+            if (feature[left_index] == LEAF and feature[right_index] == LEAF
+                    and np.float32(value[left_index]) == np.float32(value[right_index])):
+                # Both branches give the same answer: drop them and keep a leaf
+                leaf_value = value[left_index]
+                del feature[index + 1:], threshold[index + 1:], left[index + 1:], right[index + 1:], value[index + 1:]
+                value[index] = leaf_value
+                removed += 1
+                return index
+
+            feature[index], threshold[index] = f, t
+            left[index], right[index] = left_index, right_index
+            return index
+
+        lower = np.full(n_features, -np.inf)
+        upper = np.full(n_features, np.inf)
+        build(0, lower, upper)
+        return TreeNodes(feature, threshold, left, right, value), removed
+
+    def depth(self) -> int:
+        deepest = 0
+        stack = [(0, 0)]
+        while stack:
+            node, level = stack.pop()
+            if self.feature[node] == LEAF:
+                deepest = max(deepest, level)
+            else:
+                stack.append((self.left[node], level + 1))
+                stack.append((self.right[node], level + 1))
+        return deepest
+
+    def __len__(self) -> int:
+        return len(self.feature)
+
+
+class CompactForest:
+    """
+    Averaging regression forest over flat node arrays.
+    Duck-types the parts of the sklearn forest used by ForestEngine (predict,
+    feature_importances_) and adds tree_predictions() for anytime inference.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, max_depth: int, n_features: int,
+                 feature_importances: Optional[np.ndarray] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.feature_importances_ = (feature_importances if feature_importances is not None
+                                     else np.zeros(n_features, dtype=np.float32))
+
+    @classmethod
+    def from_trees(cls, trees: Sequence[TreeNodes], n_features: int,
+                   feature_importances: Optional[np.ndarray] = None) -> 'CompactForest':
+        sizes = np.array([len(tree) for tree in trees], dtype=np.int64)
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        child_dtype = smallest_uint(int(sizes.max()) - 1)
+        feature_dtype = smallest_int(LEAF, n_features - 1)
+
+        def concat(attribute: str, dtype: np.dtype) -> np.ndarray:
+            return np.concatenate([np.asarray(getattr(tree, attribute), dtype=dtype) for tree in trees])
+
+        return cls(
+            feature=concat('feature', feature_dtype),
+            threshold=concat('threshold', np.float32),
+            left=concat('left', child_dtype),
+            right=concat('right', child_dtype),
+            value=concat('value', np.float32),
+            roots=roots.astype(smallest_uint(int(roots.max()))),
+            max_depth=max(tree.depth() for tree in trees),
+            n_features=n_features,
+            feature_importances=feature_importances
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.feature)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.feature, self.threshold, self.left, self.right,
+                                              self.value, self.roots))
+
+    def select_trees(self, keep: Sequence[int]) -> 'CompactForest':
+        """New forest containing only the given trees (in the given order)"""
+        keep = np.asarray(keep, dtype=np.int64)
+        ends = np.append(self.roots[1:].astype(np.int64), self.node_count)
+        starts = self.roots.astype(np.int64)
+        node_index = np.concatenate([np.arange(starts[i], ends[i]) for i in keep])
+        sizes = ends[keep] - starts[keep]
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        return CompactForest(
+            feature=self.feature[node_index],
+            threshold=self.threshold[node_index],
+            left=self.left[node_index],
+            right=self.right[node_index],
+            value=self.value[node_index],
+            roots=roots.astype(smallest_uint(int(roots.max()))),
+            max_depth=self.max_depth,
+            n_features=self.n_features_in_,
+            feature_importances=self.feature_importances_
+        )
+
+    def _leaf_values(self, X: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """(n_rows, stop - start) leaf values reached by each row in trees start..stop-1"""
+        roots = self.roots[start:stop].astype(np.int64)
+        out = np.empty((len(X), len(roots)), dtype=np.float32)
+        for row_start in range(0, len(X), PREDICT_CHUNK_ROWS):
+            chunk = X[row_start:row_start + PREDICT_CHUNK_ROWS]
+            node = np.broadcast_to(roots, (len(chunk), len(roots))).copy()
+            for _ in range(self.max_depth):
+                feature = self.feature[node]
+                internal = feature >= 0
+                if not internal.any():
+                    break
+                x = np.take_along_axis(chunk, np.maximum(feature, 0).astype(np.intp), axis=1)
+                child = np.where(x <= self.threshold[node], self.left[node], self.right[node])
+                node = np.where(internal, child.astype(np.int64) + roots, node)
+            out[row_start:row_start + len(chunk)] = self.value[node]
+        return out
+
+    def tree_predictions(self, X: np.ndarray, start: int, stop: int) -> np.ndarray:
+        return self._leaf_values(np.asarray(X, dtype=np.float64), start, stop).astype(np.float64)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.tree_predictions(X, 0, self.n_trees).mean(axis=1)
+
+    def save(self, path: str, metadata: Dict[str, Any]) -> None:
+        """Write the arrays plus JSON metadata (model_info fields) to an .npz file"""
+        header = dict(metadata, format_version=COMPACT_FORMAT_VERSION, max_depth=self.max_depth,
+                      n_features=self.n_features_in_)
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                feature=self.feature,
+                threshold=self.threshold,
+                left=self.left,
+                right=self.right,
+                value=self.value,
+                roots=self.roots,
+                feature_importances=np.asarray(self.feature_importances_, dtype=np.float32),
+                metadata=np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8)
+            )
+
+    @classmethod
+    def load(cls, path: str) -> Tuple['CompactForest', Dict[str, Any]]:
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(data['metadata'].tobytes().decode('utf-8'))
+            if metadata.get('format_version') != COMPACT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported compact model format: {metadata.get('format_version')}")
+            forest = cls(
+                feature=data['feature'],
+                threshold=data['threshold'],
+                left=data['left'],
+                right=data['right'],
+                value=data['value'],
+                roots=data['roots'],
+                max_depth=metadata['max_depth'],
+                n_features=metadata['n_features'],
+                feature_importances=data['feature_importances']
+            )
+        return forest, metadata
+
+
+def load_compact_model_system(path: str) -> Dict[str, Any]:
+    """Load a compact .npz model in the same dict layout as the pickled model system"""
+    forest, metadata = CompactForest.load(path)
+    return {
+        'model_info': {
+            'model_name': metadata.get('model_name', 'Random Forest'),
+            'model_object': forest,
+            'features': metadata['features'],
+            'optimal_threshold': metadata.get('optimal_threshold', 0.5),
+            'performance_metrics': metadata.get('performance_metrics', {}),
+            'optimization': metadata.get('optimization', {})
+        }
+    }
@@ -0,0 +1,299 @@
+"""
+Counterfactual search for the ProactED ML API: the smallest change to the controllable features
+(operating temperature, dust accumulation, daily usage hours) that brings an equipment's predicted
+failure probability below a target.
+With the other features fixed, a forest's output only changes when a feature crosses one of its
+split thresholds, so the candidate values are the points of each threshold interval nearest the
+current value. Single-feature changes are scored first, then pairs and triples over the cheapest
+candidates, each stage as one vectorized predict call, and the best answer is refined one feature
+at a time. Engines without trees fall back to an evenly spaced grid.
+"""
+
+import itertools
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from engines import RISK_BOUNDARIES, ForestEngine, PredictorEngine, build_feature_matrix, risk_level
+
+logger = logging.getLogger(__name__)
+
+# Features maintenance staff can act on: cooling/ventilation, cleaning, rescheduling usage
+CONTROLLABLE_FEATURES = ['operating_temperature', 'dust_accumulation', 'daily_usage_hours']
+
+# Cost of changing each feature by one unit; a 10 °C drop, a full clean from the default dust
+# level and a 4 hour cut in daily use all cost 1.0
+COST_PER_UNIT = {
+    'operating_temperature': 0.1,
+    'dust_accumulation': 0.4,
+    'daily_usage_hours': 0.25
+}
+
+# Lowest value the search proposes by default; the default upper bound is the current value,
+# so only reductions are suggested unless the caller passes bounds
+DEFAULT_FLOORS = {
+    'operating_temperature': 20.0,
+    'dust_accumulation': 0.0,
+    'daily_usage_hours': 0.0
+}
+
+# Below the Medium/High boundary
+DEFAULT_TARGET = float(RISK_BOUNDARIES[1])
+
+# Rows scored per feature combination (k candidates per feature with k ** n_features <= budget)
+GRID_BUDGET = 8192
+
+# Candidate spacing for engines without split thresholds
+FALLBACK_GRID_POINTS = 64
+
+# Proposed values are rounded to this many decimals (up to two more for narrow intervals)
+DECIMALS = 2
+
+MAX_REFINE_ROUNDS = 3
+MAX_ALTERNATIVES = 3
+
+
+def split_points(engine: PredictorEngine) -> Dict[str, np.ndarray]:
+    """Sorted unique split thresholds of every controllable feature, mapped back to raw units"""
+    if not isinstance(engine, ForestEngine):
+        return {}
+    offset, scale, _ = engine.comparison_transform()
+    columns = {engine.features.index(feature): feature for feature in CONTROLLABLE_FEATURES
+               if feature in engine.features}
+    thresholds: Dict[int, List[np.ndarray]] = {column: [] for column in columns}
+    for feature, threshold, _, _, _ in engine.tree_structures():
+        for column in columns:
+            thresholds[column].append(threshold[feature == column])
+    return {name: np.unique(np.concatenate(thresholds[column])) * scale[column] + offset[column]
+            for column, name in columns.items() if thresholds[column]}
+
+
+def thin(values: np.ndarray, costs: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    At most k candidates (already sorted by cost): the cheaper half is kept as is and the rest is
+    sampled evenly up to the most expensive, so far-away values stay reachable
+    """
+    if len(values) <= k:
+        return values, costs
+    near = k // 2
+    far = np.unique(np.linspace(near, len(values) - 1, k - near).round().astype(int))
+    keep = np.concatenate([np.arange(near), far])
+    return values[keep], costs[keep]
+
+
+class CounterfactualSearch:
+    """Counterfactual queries against one engine; split points are collected once per engine"""
+
+    def __init__(self, engine: PredictorEngine):
+        self.engine = engine
+        started = time.perf_counter()
+        self.split_points = split_points(engine)
+        self.prepare_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def candidates(self, feature: str, current: float, low: float, high: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Values of one feature worth trying, sorted by change cost: for every threshold interval
+        inside [low, high] other than the current one, the point of the interval nearest the
+        current value
+        """
+        unit_cost = COST_PER_UNIT[feature]
+        if low > high:
+            return np.empty(0), np.empty(0)
+        edges = self.split_points.get(feature)
+        if edges is None:
+            values = np.unique(np.linspace(low, high, FALLBACK_GRID_POINTS).round(DECIMALS))
+            values = values[values != current]
+        else:
+            # Interval i is (edges[i-1], edges[i]]; the current value lies in interval `home`
+            home = int(np.searchsorted(edges, current, side='left'))
+            below = edges[:home]                  # Upper edges of the intervals below
+            above = edges[home:]                  # Lower edges of the intervals above
+            down, up = below - 1e-6, above + 1e-6
+            # Coarsest rounding that stays inside each interval; narrow intervals get more decimals
+            for decimals in range(DECIMALS + 2, DECIMALS - 1, -1):
+                scale = 10.0 ** decimals
+                rounded = np.floor((below - 0.1 / scale) * scale) / scale
+                down = np.where(rounded > np.append(-np.inf, below[:-1]), rounded, down)
+                rounded = np.ceil((above + 0.1 / scale) * scale) / scale
+                up = np.where(rounded <= np.append(above[1:], np.inf), rounded, up)
+            values = np.concatenate([down, up])
+            values = values[(values >= low) & (values <= high)]
+            # A bound inside an interval is a valid (and cheapest) point of it
+            for bound in (low, high):
+                if bound != current and np.isfinite(bound):
+                    values = np.append(values, bound)
+            values = np.unique(values)
+        costs = np.abs(values - current) * unit_cost
+        order = np.argsort(costs, kind='stable')
+        return values[order], costs[order]
+
+    def search(self, record: Dict[str, Any], target: float = DEFAULT_TARGET,
+               features: Optional[Sequence[str]] = None,
+               bounds: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None) -> Dict[str, Any]:
+        """
+        Cheapest change to the controllable features with predicted probability below target.
+        bounds maps a feature to (low, high) in raw units; either end may be None for the default.
+        """
+        started = time.perf_counter()
+        engine = self.engine
+        features = list(features or CONTROLLABLE_FEATURES)
+        unknown = [feature for feature in features if feature not in CONTROLLABLE_FEATURES]
+        if unknown:
+            raise ValueError(f"Features {unknown} are not controllable; expected a subset of {CONTROLLABLE_FEATURES}")
+        features = [feature for feature in features if feature in engine.features]
+        bounds = bounds or {}
+
+        equipment_id = record.get('equipment_id')
+        x0 = build_feature_matrix([record], engine.features)[0]
+        columns = [engine.features.index(feature) for feature in features]
+        current_probability = float(engine.predict(x0[None, :], [equipment_id])[0])
+
+        candidates = {}
+        for feature, column in zip(features, columns):
+            low, high = bounds.get(feature, (None, None))
+            low = min(DEFAULT_FLOORS[feature], x0[column]) if low is None else float(low)
+            high = x0[column] if high is None else float(high)
+            candidates[feature] = self.candidates(feature, float(x0[column]), low, high)
+
+        state = {"evaluated": 0, "best": None, "closest": None, "per_subset": {}}
+
+        def evaluate(subset: Tuple[str, ...], grid: np.ndarray, costs: np.ndarray, prune: bool = True) -> None:
+            """Score rows of subset values; keep the cheapest feasible row overall and per subset"""
+            best = state["best"]
+            if prune and best is not None:
+                # Rows costing more than the best answer cannot replace it
+                keep = costs < best["cost"]
+                grid, costs = grid[keep], costs[keep]
+            if len(grid) == 0:
+                return
+            X = np.repeat(x0[None, :], len(grid), axis=0)
+            for k, feature in enumerate(subset):
+                X[:, engine.features.index(feature)] = grid[:, k]
+            probabilities = engine.predict(X, [equipment_id] * len(X))
+            state["evaluated"] += len(X)
+
+            lowest = int(np.argmin(probabilities))
+            closest = state["closest"]
+            if closest is None or probabilities[lowest] < closest["failure_probability"]:
+                state["closest"] = self._answer(subset, grid[lowest], probabilities[lowest], x0, engine)
+
+            feasible = np.flatnonzero(probabilities < target)
+            if len(feasible) == 0:
+                return
+            # Cheapest, then lowest probability
+            choice = feasible[np.lexsort((probabilities[feasible], costs[feasible]))[0]]
+            answer = self._answer(subset, grid[choice], probabilities[choice], x0, engine)
+            changed = tuple(change["feature"] for change in answer["changes"])
+            previous = state["per_subset"].get(changed)
+            if previous is None or answer["cost"] < previous["cost"]:
+                state["per_subset"][changed] = answer
+            if best is None or answer["cost"] < best["cost"]:
+                state["best"] = answer
+
+        if current_probability >= target:
+            for size in range(1, len(features) + 1):
+                k = max(2, int(GRID_BUDGET ** (1.0 / size))) if size > 1 else GRID_BUDGET
+                for subset in itertools.combinations(features, size):
+                    pools = [thin(*candidates[feature], k) for feature in subset]
+                    if any(len(values) == 0 for values, _ in pools):
+                        continue
+                    grid = np.array(list(itertools.product(*(values for values, _ in pools))), dtype=np.float64)
+                    costs = np.array(list(itertools.product(*(cost for _, cost in pools)))).sum(axis=1)
+                    # Single-feature answers are all kept as alternatives ("or clean it instead")
+                    evaluate(subset, grid, costs, prune=size > 1)
+            self._refine(state, candidates, evaluate)
+
+        best = state["best"]
+        alternatives = sorted((answer for subset, answer in state["per_subset"].items()
+                               if best is None or tuple(change["feature"] for change in best["changes"]) != subset),
+                              key=lambda answer: answer["cost"])[:MAX_ALTERNATIVES]
+        result = {
+            "equipment_id": equipment_id,
+            "model_version": engine.model_version,
+            "target_probability": target,
+            "current": {
+                "failure_probability": round(current_probability, 4),
+                "risk_level": risk_level(current_probability)
+            },
+            "already_below_target": current_probability < target,
+            "found": current_probability < target or best is not None,
+            "counterfactual": best,
+            "alternatives": alternatives,
+            "search": {
+                "features": features,
+                "candidates": {feature: int(len(candidates[feature][0])) for feature in features},
+                "rows_evaluated": state["evaluated"],
+                "split_points": bool(self.split_points),
+                "search_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+        }
+        if best is None and current_probability >= target:
+            # Nothing reaches the target inside the bounds; report the lowest risk found instead
+            result["closest"] = state["closest"]
+        return result
+
+    @staticmethod
+    def _refine(state: Dict[str, Any], candidates: Dict[str, Tuple[np.ndarray, np.ndarray]], evaluate) -> None:
+        """
+        Coordinate descent on the best answer: retry each changed feature over all of its cheaper
+        candidates (including no change) with the other changes held, until nothing improves
+        """
+        for _ in range(MAX_REFINE_ROUNDS):
+            best = state["best"]
+            if best is None:
+                return
+            for change in best["changes"]:
+                subset = tuple(change["feature"] for change in best["changes"])
+                position = subset.index(change["feature"])
+                values, costs = candidates[change["feature"]]
+                values = np.append(change["from"], values)
+                costs = np.append(0.0, costs)
+                held = np.array([c["to"] for c in best["changes"]], dtype=np.float64)
+                held_cost = best["cost"] - change["cost"]
+                grid = np.repeat(held[None, :], len(values), axis=0)
+                grid[:, position] = values
+                evaluate(subset, grid, costs + held_cost)
+                if state["best"] is not best:
+                    break
+            if state["best"] is best:
+                return
+
+    @staticmethod
+    def _answer(subset: Sequence[str], values: np.ndarray, probability: float, x0: np.ndarray,
+                engine: PredictorEngine) -> Dict[str, Any]:
+        changes = []
+        for feature, value in zip(subset, values):
+            current = float(x0[engine.features.index(feature)])
+            if value == current:
+                continue
+            changes.append({
+                "feature": feature,
+                "from": current,
+                "to": float(value),
+                "delta": round(float(value) - current, 4),
+                "cost": round(abs(float(value) - current) * COST_PER_UNIT[feature], 4)
+            })
+        return {
+            "changes": changes,
+            "cost": round(float(sum(change["cost"] for change in changes)), 4),
+            "failure_probability": round(float(probability), 4),
+            "risk_level": risk_level(float(probability))
+        }
+
+
+_SEARCHES: 'weakref.WeakKeyDictionary[PredictorEngine, CounterfactualSearch]' = weakref.WeakKeyDictionary()
+_SEARCHES_LOCK = threading.Lock()
+
+
+def search_for(engine: PredictorEngine) -> CounterfactualSearch:
+    """Shared search for an engine; split points are collected on first use and dropped with the engine"""
+    with _SEARCHES_LOCK:
+        search = _SEARCHES.get(engine)
+        if search is None:
+            search = _SEARCHES[engine] = CounterfactualSearch(engine)
+            logger.info(f"Counterfactual split points for {engine.model_version} collected in {search.prepare_ms} ms")
+        return search
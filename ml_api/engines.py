@@ -0,0 +1,540 @@
+"""
+Pluggable predictor engines for the ProactED ML API
+Every server mode scores a whole feature matrix at once through the same interface,
+so batches cost one vectorized call whether the trained forest or the heuristic fallback is active
+"""
+
+import datetime
+import logging
+import os
+import pickle
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Feature layout of the trained model (see predict_with_trained_model in app.py)
+MODEL_FEATURES = [
+    'age_months',
+    'operating_temperature',
+    'vibration_level',
+    'power_consumption',
+    'humidity_level',
+    'dust_accumulation',
+    'performance_score',
+    'daily_usage_hours'
+]
+
+REQUIRED_FIELDS = ['equipment_id', 'age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
+
+# Values used for model features the caller does not send
+FEATURE_DEFAULTS = {
+    'humidity_level': 45.0,
+    'dust_accumulation': 2.5,
+    'performance_score': 0.85,
+    'daily_usage_hours': 8.0
+}
+
+# Model features a request may send to override the defaults
+OPTIONAL_FEATURES = list(FEATURE_DEFAULTS)
+
+MODEL_FILENAME = 'complete_equipment_failure_prediction_system.pkl'
+
+# Output of optimize_model.py; preferred over the pickle when present
+COMPACT_MODEL_FILENAME = 'complete_equipment_failure_prediction_system.compact.npz'
+
+# Environment variable pointing at a specific model file (pickle or compact .npz)
+MODEL_PATH_ENV_VAR = 'ML_MODEL_PATH'
+
+MODEL_SEARCH_PATHS = [
+    COMPACT_MODEL_FILENAME,
+    MODEL_FILENAME,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), MODEL_FILENAME),
+    os.path.join('..', 'Predictive Model', MODEL_FILENAME),
+    '../Predictive Model/equipment_failure_model_deployment.pkl',
+    'equipment_failure_model_deployment.pkl'
+]
+
+# Environment variable used by every server to pick its engine at startup
+ENGINE_ENV_VAR = 'ML_ENGINE'
+
+# Anytime inference: trees evaluated before the convergence test is trusted
+ANYTIME_MIN_TREES = 5
+
+RISK_LEVELS = np.array(['Low', 'Medium', 'High', 'Critical'])
+RISK_BOUNDARIES = np.array([0.3, 0.5, 0.7])
+
+
+def risk_levels(probabilities: np.ndarray) -> np.ndarray:
+    """Map failure probabilities to Low/Medium/High/Critical in one pass"""
+    return RISK_LEVELS[np.searchsorted(RISK_BOUNDARIES, probabilities, side='right')]
+
+
+def risk_level(probability: float) -> str:
+    """Risk level for a single failure probability"""
+    return str(risk_levels(np.asarray([probability]))[0])
+
+
+def feature_default(feature: str) -> float:
+    """Default value for a model feature missing from a request"""
+    return FEATURE_DEFAULTS.get(feature, 0.0)
+
+
+def build_feature_matrix(records: Sequence[Dict[str, Any]], features: Sequence[str]) -> np.ndarray:
+    """Build an (n_records, n_features) float matrix, filling missing features with defaults"""
+    n = len(records)
+    X = np.empty((n, len(features)), dtype=np.float64)
+    for j, feature in enumerate(features):
+        default = feature_default(feature)
+        column = (record.get(feature) for record in records)
+        X[:, j] = np.fromiter((default if value is None else value for value in column), dtype=np.float64, count=n)
+    # Mirror the old DataFrame.fillna(0) behaviour
+    np.nan_to_num(X, copy=False, nan=0.0)
+    return X
+
+
+def id_uniform(equipment_ids: Iterable[Any], low: float, high: float, salt: int = 0) -> np.ndarray:
+    """
+    Deterministic uniform draws keyed by equipment_id.
+    The same ID always gets the same value, without touching the global RNG.
+    """
+    keys = np.fromiter((zlib.crc32(str(equipment_id).encode('utf-8')) for equipment_id in equipment_ids), dtype=np.uint64)
+    # splitmix64 finaliser so nearby CRCs and different salts give unrelated streams
+    with np.errstate(over='ignore'):
+        z = keys + np.uint64(0x9E3779B97F4A7C15) * np.uint64(salt + 1)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    unit = (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+    return low + (high - low) * unit
+
+
+class PredictorEngine:
+    """
+    Common interface for all prediction backends.
+    Subclasses implement predict() and confidence() over a feature matrix whose
+    columns follow self.features.
+    """
+
+    name = 'base'
+    model_version = 'unknown'
+    note = ''
+
+    def __init__(self, features: Optional[Sequence[str]] = None):
+        self.features = list(features or MODEL_FEATURES)
+
+    def predict(self, X: np.ndarray, equipment_ids: Sequence[Any]) -> np.ndarray:
+        """Failure probability for every row of X"""
+        raise NotImplementedError
+
+    def confidence(self, X: np.ndarray, equipment_ids: Sequence[Any], probabilities: np.ndarray) -> np.ndarray:
+        """Confidence score for every row of X"""
+        raise NotImplementedError
+
+    def feature_importance(self) -> Dict[str, float]:
+        return {}
+
+    def response_metadata(self) -> Dict[str, Any]:
+        """Fields shared by every prediction this engine produces"""
+        return {
+            "model_version": self.model_version,
+            "feature_importance": self.feature_importance(),
+            "model_features_used": len(self.features),
+            "note": self.note
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "engine": self.name,
+            "model_version": self.model_version,
+            "features": self.features
+        }
+
+    def predict_anytime(self, X: np.ndarray, equipment_ids: Sequence[Any], deadline: Optional[float] = None,
+                        tolerance: Optional[float] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Failure probabilities computed under a deadline (time.perf_counter() value) and/or
+        convergence tolerance. Engines without incremental evaluation score fully.
+        """
+        return self.predict(X, equipment_ids), {"stop_reason": "complete"}
+
+    def score(self, X: np.ndarray, equipment_ids: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """Clipped failure probabilities and confidence scores for a feature matrix"""
+        probabilities = np.clip(self.predict(X, equipment_ids), 0.01, 0.99)
+        confidences = self.confidence(X, equipment_ids, probabilities)
+        return probabilities, confidences
+
+    def score_anytime(self, X: np.ndarray, equipment_ids: Sequence[Any], deadline: Optional[float] = None,
+                      tolerance: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+        """Like score(), but through predict_anytime(); also returns the early-exit report"""
+        raw, anytime = self.predict_anytime(X, equipment_ids, deadline=deadline, tolerance=tolerance)
+        probabilities = np.clip(raw, 0.01, 0.99)
+        confidences = self.confidence(X, equipment_ids, probabilities)
+        return probabilities, confidences, anytime
+
+    def predict_records(self, records: Sequence[Dict[str, Any]], deadline: Optional[float] = None,
+                        tolerance: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Score already-validated request records and build the API response rows.
+        Passing a deadline or tolerance switches to anytime evaluation and adds its report to every row.
+        """
+        if not records:
+            return []
+
+        equipment_ids = [record['equipment_id'] for record in records]
+        X = build_feature_matrix(records, self.features)
+        if deadline is None and tolerance is None:
+            probabilities, confidences = self.score(X, equipment_ids)
+            return self.build_responses(equipment_ids, probabilities, confidences)
+
+        probabilities, confidences, anytime = self.score_anytime(X, equipment_ids, deadline, tolerance)
+        responses = self.build_responses(equipment_ids, probabilities, confidences)
+        for response in responses:
+            response.update(anytime)
+        return responses
+
+    def build_responses(self, equipment_ids: Sequence[Any], probabilities: np.ndarray,
+                        confidences: np.ndarray) -> List[Dict[str, Any]]:
+        levels = risk_levels(probabilities)
+        metadata = self.response_metadata()
+        timestamp = datetime.datetime.utcnow().isoformat()
+        return [
+            {
+                "success": True,
+                "equipment_id": equipment_id,
+                "failure_probability": round(float(probability), 3),
+                "risk_level": str(level),
+                "confidence_score": round(float(confidence), 3),
+                "prediction_timestamp": timestamp,
+                **metadata
+            }
+            for equipment_id, probability, confidence, level in zip(equipment_ids, probabilities, confidences, levels)
+        ]
+
+
+class HeuristicEngine(PredictorEngine):
+    """
+    Vectorized rule-based scorer used when the trained model is unavailable.
+    Replaces the per-row `random`-based scorers of the test servers; the noise term
+    is derived from equipment_id so repeated calls give identical answers.
+    """
+
+    name = 'heuristic'
+    model_version = 'heuristic-v1.0'
+    note = 'Deterministic heuristic fallback (trained model not in use)'
+
+    NORMAL_POWER = 1500.0
+
+    def factor_contributions(self, X: np.ndarray) -> Dict[str, np.ndarray]:
+        """Per-factor risk contributions, one array per factor"""
+        age, temp, vibration, power = self._columns(X)
+        return {
+            'age': np.minimum(age / 120.0, 0.4),
+            'temperature': np.where(temp > 80, np.minimum((temp - 80) / 50.0, 0.25),
+                                    np.where(temp > 60, np.minimum((temp - 60) / 100.0, 0.15), 0.0)),
+            'vibration': np.where(vibration > 5.0, np.minimum((vibration - 5.0) / 10.0, 0.2),
+                                  np.where(vibration > 3.0, np.minimum((vibration - 3.0) / 20.0, 0.1), 0.0)),
+            'power': np.minimum(np.abs(power - self.NORMAL_POWER) / self.NORMAL_POWER * 0.15, 0.15)
+        }
+
+    def predict(self, X: np.ndarray, equipment_ids: Sequence[Any]) -> np.ndarray:
+        risk = sum(self.factor_contributions(X).values())
+        return risk + id_uniform(equipment_ids, -0.05, 0.05)
+
+    def confidence(self, X: np.ndarray, equipment_ids: Sequence[Any], probabilities: np.ndarray) -> np.ndarray:
+        age, temp, vibration, _ = self._columns(X)
+        confidence = np.full(len(X), 0.85)
+        confidence -= 0.1 * (age < 6)  # New equipment is harder to predict
+        confidence -= 0.1 * ((temp > 90) | (temp < 10))  # So are extreme temperatures
+        confidence -= 0.05 * (vibration > 8)
+        confidence += id_uniform(equipment_ids, -0.05, 0.05, salt=1)
+        return np.clip(confidence, 0.6, 0.95)
+
+    def feature_importance(self) -> Dict[str, float]:
+        return {
+            'age_months': 0.4,
+            'operating_temperature': 0.25,
+            'vibration_level': 0.2,
+            'power_consumption': 0.15
+        }
+
+    def _columns(self, X: np.ndarray):
+        index = {feature: j for j, feature in enumerate(self.features)}
+        return (X[:, index['age_months']], X[:, index['operating_temperature']],
+                X[:, index['vibration_level']], X[:, index['power_consumption']])
+
+
+class ForestEngine(PredictorEngine):
+    """Trained Random Forest regressor loaded from the model pickle"""
+
+    name = 'forest'
+
+    def __init__(self, model_system: Dict[str, Any]):
+        if isinstance(model_system, dict) and 'model_info' in model_system:
+            model_info = model_system['model_info']
+            self.model = model_info['model_object']
+            features = model_info['features']
+            self.threshold = model_info.get('optimal_threshold', 0.5)
+            self.model_name = model_info.get('model_name', 'Random Forest')
+            self.performance_metrics = model_info.get('performance_metrics', {})
+        else:
+            # Fallback if model structure is different
+            self.model = model_system.get('best_model', model_system)
+            features = model_system.get('features', ['age_months', 'operating_temperature', 'vibration_level', 'power_consumption'])
+            self.threshold = 0.5
+            self.model_name = 'Random Forest'
+            self.performance_metrics = {}
+
+        super().__init__(features)
+        self.scaler = model_system.get('scaler') if isinstance(model_system, dict) else None
+        # Optional RegionIndex (region_index.py) answering default-feature rows by table lookup
+        self.region_index = None
+        self.model_version = f"{self.model_name}-production-v1.0" + ("-compact" if self.is_compact else "")
+        self.note = f"Using trained Random Forest model with {len(self.features)} features"
+        self._importance = self._compute_feature_importance()
+
+    def _compute_feature_importance(self) -> Dict[str, float]:
+        importance = {}
+        if hasattr(self.model, 'feature_importances_'):
+            for i, feature in enumerate(self.features):
+                if i < len(self.model.feature_importances_):
+                    importance[feature] = float(self.model.feature_importances_[i])
+        return importance
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Apply the fitted scaler (if any) to a raw feature matrix"""
+        if self.scaler is None:
+            return X
+        return self.scaler.transform(self._named(self.scaler, X))
+
+    def _named(self, estimator: Any, X: np.ndarray):
+        # Estimators fitted on DataFrames warn when handed bare arrays
+        if hasattr(estimator, 'feature_names_in_'):
+            import pandas as pd
+            return pd.DataFrame(X, columns=self.features)
+        return X
+
+    def forest_predict(self, X: np.ndarray) -> np.ndarray:
+        """Evaluate the full forest, bypassing the region index"""
+        return np.asarray(self.model.predict(self._named(self.model, self.transform(X))), dtype=np.float64)
+
+    def predict(self, X: np.ndarray, equipment_ids: Sequence[Any]) -> np.ndarray:
+        if self.region_index is None:
+            return self.forest_predict(X)
+
+        covered = self.region_index.covers(X)
+        if covered.all():
+            return self.region_index.lookup(X)
+        predictions = np.empty(len(X))
+        predictions[covered] = self.region_index.lookup(X[covered])
+        predictions[~covered] = self.forest_predict(X[~covered])
+        return predictions
+
+    @property
+    def is_compact(self) -> bool:
+        """True when serving a CompactForest produced by optimize_model.py"""
+        return hasattr(self.model, 'tree_predictions')
+
+    @property
+    def n_trees(self) -> int:
+        if self.is_compact:
+            return self.model.n_trees
+        return len(getattr(self.model, 'estimators_', []))
+
+    def prepare_tree_input(self, X: np.ndarray) -> np.ndarray:
+        """Matrix accepted by the individual trees (scaled float32 for sklearn trees)"""
+        if self.is_compact:
+            return np.asarray(X, dtype=np.float64)
+        return np.ascontiguousarray(self.transform(X), dtype=np.float32)
+
+    def tree_predictions(self, X_tree: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """(n_rows, stop - start) matrix of raw outputs for trees start..stop-1"""
+        if self.is_compact:
+            return self.model.tree_predictions(X_tree, start, stop)
+        estimators = self.model.estimators_[start:stop]
+        return np.column_stack([estimator.predict(X_tree, check_input=False) for estimator in estimators])
+
+    def tree_structures(self) -> Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Yield (feature, threshold, left, right, value) arrays for every tree, with local child
+        indices and feature == -1 at leaves. Thresholds are in the trees' own input space
+        (see comparison_transform).
+        """
+        if self.is_compact:
+            forest = self.model
+            ends = np.append(forest.roots[1:].astype(np.int64), forest.node_count)
+            for start, end in zip(forest.roots.astype(np.int64), ends):
+                yield (forest.feature[start:end].astype(np.int64), forest.threshold[start:end].astype(np.float64),
+                       forest.left[start:end].astype(np.int64), forest.right[start:end].astype(np.int64),
+                       forest.value[start:end].astype(np.float64))
+            return
+
+        for estimator in self.model.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            yield (np.where(leaf, -1, tree.feature).astype(np.int64), tree.threshold.astype(np.float64),
+                   tree.children_left.astype(np.int64), tree.children_right.astype(np.int64),
+                   tree.value.reshape(tree.node_count, -1)[:, 0].astype(np.float64))
+
+    def comparison_transform(self) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """
+        (offset, scale, cast_float32) such that a tree compares
+        v = float32((x - offset) / scale) (or the uncast value) against its thresholds.
+        """
+        n = len(self.features)
+        if self.is_compact:
+            return np.zeros(n), np.ones(n), False
+        if self.scaler is None:
+            return np.zeros(n), np.ones(n), True
+        if not hasattr(self.scaler, 'scale_'):
+            raise ValueError(f"Unsupported scaler {type(self.scaler).__name__}; only StandardScaler can be mapped")
+        offset = self.scaler.mean_ if getattr(self.scaler, 'with_mean', True) else np.zeros(n)
+        scale = self.scaler.scale_ if getattr(self.scaler, 'with_std', True) else np.ones(n)
+        return np.asarray(offset, dtype=np.float64), np.asarray(scale, dtype=np.float64), True
+
+    def predict_anytime(self, X: np.ndarray, equipment_ids: Sequence[Any], deadline: Optional[float] = None,
+                        tolerance: Optional[float] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Evaluate trees one at a time, keeping a running mean per row.
+        Stops when the next tree would overrun the deadline (projected from the measured
+        per-tree cost) or when every row's standard error is within tolerance.
+        """
+        total = self.n_trees
+        if total == 0:
+            return super().predict_anytime(X, equipment_ids, deadline, tolerance)
+        if self.region_index is not None and self.region_index.covers(X).all():
+            # The lookup is exact and cheaper than any partial evaluation
+            return self.region_index.lookup(X), {
+                "trees_used": total,
+                "trees_total": total,
+                "stop_reason": "region_index"
+            }
+
+        X_tree = self.prepare_tree_input(X)
+        running_sum = np.zeros(len(X))
+        running_sq = np.zeros(len(X))
+        used = 0
+        stop_reason = "complete"
+        started = time.perf_counter()
+
+        while used < total:
+            if used > 0 and deadline is not None:
+                now = time.perf_counter()
+                per_tree = (now - started) / used
+                if now + per_tree > deadline:
+                    stop_reason = "budget"
+                    break
+            if used >= ANYTIME_MIN_TREES and tolerance is not None:
+                mean = running_sum / used
+                variance = np.maximum(running_sq / used - mean * mean, 0.0)
+                if np.sqrt(variance.max() / used) <= tolerance:
+                    stop_reason = "converged"
+                    break
+
+            outputs = self.tree_predictions(X_tree, used, used + 1)[:, 0]
+            running_sum += outputs
+            running_sq += outputs * outputs
+            used += 1
+
+        return running_sum / used, {
+            "trees_used": used,
+            "trees_total": total,
+            "stop_reason": stop_reason
+        }
+
+    def confidence(self, X: np.ndarray, equipment_ids: Sequence[Any], probabilities: np.ndarray) -> np.ndarray:
+        r2_score = self.performance_metrics.get('r2_score', 0.91)
+        base_confidence = min(0.95, r2_score + 0.04)  # Convert R² to confidence
+        return np.clip(base_confidence + id_uniform(equipment_ids, -0.05, 0.05), 0.65, 0.98)
+
+    def feature_importance(self) -> Dict[str, float]:
+        return self._importance
+
+    def response_metadata(self) -> Dict[str, Any]:
+        metadata = super().response_metadata()
+        metadata.update({
+            "model_threshold": self.threshold,
+            "r2_score": self.performance_metrics.get('r2_score', 0.91)
+        })
+        return metadata
+
+    def describe(self) -> Dict[str, Any]:
+        description = super().describe()
+        description.update({
+            "model_name": self.model_name,
+            "threshold": self.threshold,
+            "n_estimators": self.n_trees,
+            "compact": self.is_compact,
+            "region_index": self.region_index.describe() if self.region_index is not None else None
+        })
+        return description
+
+
+ENGINES = {
+    HeuristicEngine.name: HeuristicEngine,
+    ForestEngine.name: ForestEngine
+}
+
+
+def load_model_file(path: str) -> Any:
+    """Load one model file; compact .npz models are returned in the same dict layout as the pickle"""
+    if path.endswith('.npz'):
+        from compact_forest import load_compact_model_system
+        return load_compact_model_system(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def load_model_system(paths: Optional[Sequence[str]] = None) -> Tuple[Optional[Any], Optional[str]]:
+    """Load the first model system found on the search paths (ML_MODEL_PATH first when set)"""
+    search_paths = list(paths or MODEL_SEARCH_PATHS)
+    if os.environ.get(MODEL_PATH_ENV_VAR):
+        search_paths.insert(0, os.environ[MODEL_PATH_ENV_VAR])
+
+    for path in search_paths:
+        try:
+            if os.path.exists(path):
+                model_system = load_model_file(path)
+                logger.info(f"Model loaded successfully from: {path}")
+                return model_system, path
+        except Exception as e:
+            logger.warning(f"Failed to load from {path}: {e}")
+            continue
+    return None, None
+
+
+def create_engine(name: Optional[str] = None, model_system: Optional[Any] = None) -> PredictorEngine:
+    """
+    Build the engine selected by name (or the ML_ENGINE environment variable).
+    'auto' uses the trained forest when a model system is available and the heuristic otherwise.
+    """
+    name = (name or os.environ.get(ENGINE_ENV_VAR) or 'auto').lower()
+
+    if name == 'auto':
+        name = ForestEngine.name if model_system is not None else HeuristicEngine.name
+
+    if name not in ENGINES:
+        raise ValueError(f"Unknown predictor engine '{name}'. Available: {['auto'] + sorted(ENGINES)}")
+
+    if name == ForestEngine.name:
+        if model_system is None:
+            raise ValueError("The 'forest' engine requires a loaded model system")
+        return ForestEngine(model_system)
+
+    return ENGINES[name]()
+
+
+def load_engine(name: Optional[str] = None, default: str = 'auto',
+                paths: Optional[Sequence[str]] = None) -> PredictorEngine:
+    """
+    Resolve the engine name (argument, then ML_ENGINE, then default) and build it,
+    unpickling the model system only when the selected engine can use it.
+    """
+    name = (name or os.environ.get(ENGINE_ENV_VAR) or default).lower()
+    model_system = None
+    if name != HeuristicEngine.name:
+        model_system, _ = load_model_system(paths)
+    return create_engine(name, model_system)
@@ -0,0 +1,167 @@
+"""
+Local equipment feature store for the ProactED ML API
+Keeps the latest model input per equipment_id in a SQLite file, mirrored in memory like the risk
+table. Callers upsert only the fields that changed (a new temperature reading, a cleaning that reset
+dust) and predict by ID, instead of recomputing and resending the full feature vector every time.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from engines import MODEL_FEATURES
+from model_router import equipment_type_of
+from risk_table import DESCRIPTIVE_FIELDS, LOCATION_FIELDS
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_PATH_ENV_VAR = 'ML_FEATURE_STORE_PATH'
+DEFAULT_FEATURE_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feature_store.sqlite')
+
+NUMERIC_FIELDS = list(MODEL_FEATURES)
+TEXT_FIELDS = list(DESCRIPTIVE_FIELDS)
+STORE_FIELDS = NUMERIC_FIELDS + TEXT_FIELDS
+
+# IDs per DELETE statement (below SQLite's bound-parameter limit)
+ID_CHUNK = 500
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS features (
+    equipment_id TEXT PRIMARY KEY,
+    {', '.join(f'{field} REAL' for field in NUMERIC_FIELDS)},
+    {', '.join(f'{field} TEXT' for field in TEXT_FIELDS)},
+    updated_at REAL NOT NULL
+)
+"""
+
+UPSERT = f"""
+INSERT OR REPLACE INTO features (equipment_id, {', '.join(STORE_FIELDS)}, updated_at)
+VALUES ({', '.join('?' * (len(STORE_FIELDS) + 2))})
+"""
+
+
+def parse_update(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validated partial update: equipment_id plus the store fields present in the item.
+    Absent or null fields are left unchanged; other fields are ignored.
+    """
+    if not isinstance(item, dict) or item.get('equipment_id') in (None, ''):
+        raise ValueError("every item needs an equipment_id")
+    update: Dict[str, Any] = {"equipment_id": str(item['equipment_id'])}
+    for field in NUMERIC_FIELDS:
+        if item.get(field) is not None:
+            value = float(item[field])
+            if not math.isfinite(value):
+                raise ValueError(f"{field} must be a finite number")
+            update[field] = value
+    equipment_type = equipment_type_of(item)
+    if equipment_type:
+        update['equipment_type'] = equipment_type
+    for field in LOCATION_FIELDS:
+        if item.get(field) is not None:
+            update[field] = str(item[field])
+    return update
+
+
+class FeatureStore:
+    """
+    Latest feature vector per equipment. Reads come from `records` (equipment_id -> field dict
+    with updated_at); every write goes to both the dict and SQLite in one transaction.
+    """
+
+    def __init__(self, path: str = DEFAULT_FEATURE_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(SCHEMA)
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    @classmethod
+    def from_environment(cls) -> 'FeatureStore':
+        return cls(os.environ.get(FEATURE_STORE_PATH_ENV_VAR, DEFAULT_FEATURE_STORE_PATH))
+
+    def _load(self) -> None:
+        cursor = self._connection.execute(f"SELECT equipment_id, {', '.join(STORE_FIELDS)}, updated_at FROM features")
+        for row in cursor:
+            record = {"equipment_id": row[0]}
+            record.update((field, value) for field, value in zip(STORE_FIELDS, row[1:-1]) if value is not None)
+            record["updated_at"] = row[-1]
+            self.records[row[0]] = record
+        if self.records:
+            logger.info(f"Feature store loaded {len(self.records)} equipment from {self.path}")
+
+    def upsert(self, items: Sequence[Dict[str, Any]], updated_at: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Merge partial updates into the stored vectors (new IDs are created). Returns the counts of
+        created, updated and unchanged equipment and the IDs whose stored values changed.
+        """
+        updates = []
+        for position, item in enumerate(items):
+            try:
+                updates.append(parse_update(item))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Item {position}: {e}") from None
+
+        updated_at = time.time() if updated_at is None else updated_at
+        created = updated = unchanged = 0
+        changed: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for update in updates:
+                equipment_id = update["equipment_id"]
+                current = changed.get(equipment_id) or self.records.get(equipment_id)
+                if current is None:
+                    created += 1
+                    merged = update
+                elif all(current.get(field) == value for field, value in update.items()):
+                    unchanged += 1
+                    continue
+                else:
+                    if equipment_id not in changed:
+                        updated += 1
+                    merged = {**current, **update}
+                changed[equipment_id] = {**merged, "updated_at": updated_at}
+
+            if changed:
+                with self._connection:
+                    self._connection.executemany(UPSERT, [
+                        (equipment_id, *(record.get(field) for field in STORE_FIELDS), updated_at)
+                        for equipment_id, record in changed.items()])
+                self.records.update(changed)
+        return {
+            "created_count": created,
+            "updated_count": updated,
+            "unchanged_count": unchanged,
+            "changed_ids": list(changed)
+        }
+
+    def get(self, equipment_id: Any) -> Optional[Dict[str, Any]]:
+        return self.records.get(str(equipment_id))
+
+    def get_many(self, equipment_ids: Sequence[Any]) -> List[Optional[Dict[str, Any]]]:
+        records = self.records
+        return [records.get(str(equipment_id)) for equipment_id in equipment_ids]
+
+    def delete(self, equipment_ids: Sequence[Any]) -> int:
+        """Forget equipment; returns how many were stored"""
+        equipment_ids = [str(equipment_id) for equipment_id in equipment_ids]
+        with self._lock:
+            with self._connection:
+                for start in range(0, len(equipment_ids), ID_CHUNK):
+                    chunk = equipment_ids[start:start + ID_CHUNK]
+                    self._connection.execute(
+                        f"DELETE FROM features WHERE equipment_id IN ({', '.join('?' * len(chunk))})", chunk)
+            return sum(self.records.pop(equipment_id, None) is not None for equipment_id in equipment_ids)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "equipment_count": len(self.records),
+            "fields": STORE_FIELDS
+        }
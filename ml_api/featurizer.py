@@ -0,0 +1,329 @@
+"""
+Server-side featurizer for the ProactED ML API
+Turns raw equipment records and maintenance logs into the feature set ModelInterpretabilityService
+prepares in C# (age, maintenance history, academic usage, stress factors, type encodings) plus the model
+features. The whole fleet is built in one pass: logs are grouped with sort/bincount, and the academic
+calendar is precomputed as a daily multiplier table with a running sum for lifetime usage.
+"""
+
+import datetime
+import functools
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from engines import MODEL_FEATURES, feature_default
+from model_router import EQUIPMENT_TYPES, TYPE_FLAGS, normalize_equipment_type
+from sensor_buffers import SENSOR_CHANNELS
+from timetable_usage import room_key as timetable_room_key
+
+DAYS_PER_MONTH = 30.44
+
+# Usage multipliers of GetAcademicUsageMultiplier: term time vs. breaks
+TERM_MULTIPLIER = 1.2
+BREAK_MULTIPLIER = 0.8
+# Term months used when no semester dates are given (September to May)
+DEFAULT_TERM_MONTHS = [9, 10, 11, 12, 1, 2, 3, 4, 5]
+
+# Calendar table range around the reference date, in years
+CALENDAR_YEARS_BACK = 30
+CALENDAR_YEARS_AHEAD = 2
+
+# Defaults of the C# feature helpers, used when a record does not carry the value
+DEFAULT_INSTALLATION_AGE_MONTHS = 12
+DEFAULT_DAILY_USAGE_HOURS = 8.0
+DEFAULT_ROOM_TEMPERATURE = 22.0
+DEFAULT_DUST_FACTOR = 0.3
+DEFAULT_HUMIDITY = 45.0
+DEFAULT_MAINTENANCE_INTERVAL_MONTHS = 6.0
+
+# Sensor snapshots of GetOperatingTemperature, GetVibrationLevel and GetPowerConsumption, used to score
+# equipment that sends no readings and has no rolling sensor window
+DEFAULT_SENSOR_VALUES = {'operating_temperature': 65.0, 'vibration_level': 1.5, 'power_consumption': 150.0}
+
+# Rated daily operating hours per equipment type (usage_vs_capacity denominator)
+DAILY_CAPACITY_HOURS = {'projector': 10.0, 'air_conditioner': 16.0, 'podium': 12.0}
+DEFAULT_CAPACITY_HOURS = 12.0
+
+ROOM_TYPES = ['lecture_hall', 'classroom', 'laboratory', 'office']
+
+# Maintenance types counted as failures for the corrective history features
+CORRECTIVE_TYPES = ['corrective', 'emergency']
+
+# Feature columns in output order (the C# set, then the remaining model features)
+FEATURE_COLUMNS = [
+    'age_months', 'week_of_year', 'academic_usage_multiplier', 'daily_usage_hours', 'total_usage_hours',
+    'last_maintenance_days', 'maintenance_count', 'room_temperature', 'dust_factor', 'humidity',
+    'operating_temperature', 'power_consumption', 'vibration_level', 'dust_accumulation', 'humidity_level',
+    'usage_per_day', 'usage_vs_capacity', 'maintenance_frequency', 'maintenance_overdue', 'temperature_stress',
+    'environmental_stress', 'is_projector', 'is_air_conditioner', 'is_podium', 'equipment_type_encoded',
+    'room_type_encoded', 'age_category_encoded', 'corrective_count', 'performance_score'
+]
+
+# Descriptive fields copied through to the output records
+PASSTHROUGH_FIELDS = ['equipment_type', 'building', 'room']
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def epoch_days(values: Sequence[Any]) -> np.ndarray:
+    """Days since 1970-01-01 UTC for ISO-8601 strings or epoch seconds; NaN where missing or invalid"""
+    import pandas as pd
+    values = list(values)
+    days = np.full(len(values), np.nan)
+    numeric = np.fromiter((isinstance(value, (int, float)) and not isinstance(value, bool) for value in values),
+                          dtype=bool, count=len(values))
+    if numeric.any():
+        days[numeric] = np.array([values[i] for i in np.flatnonzero(numeric)], dtype=np.float64) / 86400.0
+    text = ~numeric
+    if text.any():
+        parsed = pd.to_datetime(pd.Series([values[i] for i in np.flatnonzero(text)], dtype=object),
+                                utc=True, errors='coerce', format='ISO8601')
+        days[text] = ((parsed - pd.Timestamp(_EPOCH)) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)
+    return days
+
+
+def day_of_year(day: float) -> int:
+    """1-based day of the year of an epoch day (DateTime.DayOfYear)"""
+    date = np.datetime64(int(np.floor(day)), 'D')
+    return int((date - date.astype('datetime64[Y]')).astype(np.int64)) + 1
+
+
+def category_key(value: Any) -> Optional[str]:
+    """Lower-case, underscore-separated key of a free-text category ("Lecture Hall" -> "lecture_hall")"""
+    if value is None:
+        return None
+    return str(value).strip().lower().replace('-', '_').replace(' ', '_') or None
+
+
+def category_codes(values: Sequence[Any], normalize=category_key) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """Per-row codes into the normalized distinct values, normalizing each distinct value once"""
+    raw, codes = np.unique(np.array(['' if value is None else str(value) for value in values], dtype=object),
+                           return_inverse=True)
+    return codes.reshape(-1), [normalize(value) if value else None for value in raw]
+
+
+def column(records: Sequence[Dict[str, Any]], field: str, default: float = np.nan) -> np.ndarray:
+    """Float column of a record field, `default` where absent or not numeric"""
+    values = np.full(len(records), default, dtype=np.float64)
+    for i, record in enumerate(records):
+        value = record.get(field)
+        if value is not None:
+            try:
+                values[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+    return values
+
+
+class AcademicCalendar:
+    """
+    Daily usage multiplier table (term vs. break) with its running sum, so a multiplier lookup and the
+    multiplier-weighted number of days between two dates are both O(1) array reads.
+    """
+
+    def __init__(self, semesters: Sequence[Dict[str, Any]] = (), reference_day: Optional[float] = None):
+        if reference_day is None:
+            reference_day = datetime.datetime.now(datetime.timezone.utc).timestamp() / 86400.0
+        self.first_day = int(reference_day) - CALENDAR_YEARS_BACK * 366
+        n_days = (CALENDAR_YEARS_BACK + CALENDAR_YEARS_AHEAD) * 366
+        days = self.first_day + np.arange(n_days)
+        self.semester_count = len(semesters)
+
+        if semesters:
+            multiplier = np.full(n_days, BREAK_MULTIPLIER)
+            starts = epoch_days([semester['start_date'] for semester in semesters])
+            weeks = np.array([float(semester.get('number_of_weeks', 0)) for semester in semesters])
+            for start, length in zip(starts, weeks):
+                if np.isnan(start):
+                    continue
+                low = max(int(np.floor(start)) - self.first_day, 0)
+                high = min(int(np.floor(start + 7 * length)) - self.first_day, n_days)
+                if high > low:
+                    multiplier[low:high] = TERM_MULTIPLIER
+        else:
+            months = (days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12) + 1
+            multiplier = np.where(np.isin(months, DEFAULT_TERM_MONTHS), TERM_MULTIPLIER, BREAK_MULTIPLIER)
+
+        self.multiplier = multiplier
+        self.cumulative = np.concatenate([[0.0], np.cumsum(multiplier)])
+
+    def _index(self, days: np.ndarray) -> np.ndarray:
+        return np.clip(np.floor(days).astype(np.int64) - self.first_day, 0, len(self.multiplier) - 1)
+
+    def multiplier_on(self, days: np.ndarray) -> np.ndarray:
+        return self.multiplier[self._index(np.asarray(days, dtype=np.float64))]
+
+    def weighted_days(self, start_days: np.ndarray, end_days: np.ndarray) -> np.ndarray:
+        """Sum of daily multipliers over [start, end) per row"""
+        start = self._index(np.asarray(start_days, dtype=np.float64))
+        end = self._index(np.asarray(end_days, dtype=np.float64))
+        return np.maximum(self.cumulative[end] - self.cumulative[start], 0.0)
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_calendar(semesters_key: Tuple[Tuple[str, float], ...], reference_day: int) -> AcademicCalendar:
+    semesters = [{"start_date": start, "number_of_weeks": weeks} for start, weeks in semesters_key]
+    return AcademicCalendar(semesters, reference_day)
+
+
+def academic_calendar(semesters: Sequence[Dict[str, Any]] = (), reference_day: Optional[float] = None) -> AcademicCalendar:
+    """Calendar for a semester list, reused across requests with the same semesters and day"""
+    if reference_day is None:
+        reference_day = datetime.datetime.now(datetime.timezone.utc).timestamp() / 86400.0
+    key = tuple((str(semester['start_date']), float(semester.get('number_of_weeks', 0))) for semester in semesters)
+    return _cached_calendar(key, int(reference_day))
+
+
+def calendar_cache_info() -> Dict[str, int]:
+    """Hits, misses and size of the academic calendar cache"""
+    return _cached_calendar.cache_info()._asdict()
+
+
+def group_logs(equipment_ids: Sequence[Any], logs: Sequence[Dict[str, Any]],
+               as_of_day: float) -> Dict[str, np.ndarray]:
+    """
+    Per-equipment maintenance aggregates from a flat log list: count, last log day, mean interval
+    between logs in days, and corrective/emergency count. Logs after as_of or for unknown IDs are ignored.
+    """
+    n = len(equipment_ids)
+    index = {str(equipment_id): i for i, equipment_id in enumerate(equipment_ids)}
+    owner = np.fromiter((index.get(str(log.get('equipment_id')), -1) for log in logs), dtype=np.int64, count=len(logs))
+    day = epoch_days([log.get('log_date') for log in logs])
+    status_codes, statuses = category_codes([log.get('status', 'completed') for log in logs])
+    kind_codes, kinds = category_codes([log.get('maintenance_type') for log in logs])
+    completed = np.array([status == 'completed' for status in statuses], dtype=bool)[status_codes]
+    is_corrective = np.array([kind in CORRECTIVE_TYPES for kind in kinds], dtype=bool)[kind_codes]
+
+    keep = (owner >= 0) & ~np.isnan(day) & (day <= as_of_day) & completed
+    owner, day = owner[keep], day[keep]
+
+    count = np.bincount(owner, minlength=n).astype(np.float64)
+    corrective = np.bincount(owner, weights=is_corrective[keep].astype(np.float64), minlength=n)
+
+    # Sort by (equipment, day): the last row of each group is the latest log, and gaps within a group are intervals
+    order = np.lexsort((day, owner))
+    owner, day = owner[order], day[order]
+    last = np.full(n, np.nan)
+    if len(owner):
+        ends = np.flatnonzero(np.r_[owner[1:] != owner[:-1], True])
+        last[owner[ends]] = day[ends]
+    same = owner[1:] == owner[:-1]
+    gaps = np.diff(day)[same]
+    gap_owner = owner[1:][same]
+    gap_total = np.bincount(gap_owner, weights=gaps, minlength=n)
+    gap_count = np.bincount(gap_owner, minlength=n)
+    mean_interval = np.where(gap_count > 0, gap_total / np.maximum(gap_count, 1), np.nan)
+    return {"count": count, "last_day": last, "mean_interval_days": mean_interval, "corrective": corrective}
+
+
+def featurize(equipment: Sequence[Dict[str, Any]], maintenance_logs: Sequence[Dict[str, Any]] = (),
+              semesters: Sequence[Dict[str, Any]] = (), as_of: Any = None,
+              calendar: Optional[AcademicCalendar] = None,
+              room_usage: Optional[Dict[str, float]] = None) -> Dict[str, np.ndarray]:
+    """
+    Feature columns (FEATURE_COLUMNS) for every equipment record, computed in one vectorized pass.
+    room_usage maps timetable room keys to daily usage hours (see timetable_usage.py).
+    """
+    n = len(equipment)
+    as_of_day = float(epoch_days([as_of])[0]) if as_of is not None else \
+        datetime.datetime.now(datetime.timezone.utc).timestamp() / 86400.0
+    if np.isnan(as_of_day):
+        raise ValueError(f"Invalid as_of date: {as_of}")
+    calendar = calendar or academic_calendar(semesters, as_of_day)
+    equipment_ids = [record.get('equipment_id') for record in equipment]
+
+    # Age: installation date, else age_months, else the C# default of 12 months
+    installed = epoch_days([record.get('installation_date') for record in equipment])
+    sent_age = column(equipment, 'age_months')
+    installed = np.where(np.isnan(installed),
+                         as_of_day - np.where(np.isnan(sent_age), DEFAULT_INSTALLATION_AGE_MONTHS, sent_age) * DAYS_PER_MONTH,
+                         installed)
+    age_months = np.floor(np.maximum(as_of_day - installed, 0.0) / DAYS_PER_MONTH)
+
+    type_codes, types = category_codes([record.get('equipment_type') for record in equipment], normalize_equipment_type)
+    type_code = np.array([EQUIPMENT_TYPES.index(t) + 1 if t in EQUIPMENT_TYPES else 0 for t in types],
+                         dtype=np.int64)[type_codes]
+    room_codes, room_types = category_codes([record.get('room_type') for record in equipment])
+    room_code = np.array([ROOM_TYPES.index(t) + 1 if t in ROOM_TYPES else 0 for t in room_types],
+                         dtype=np.int64)[room_codes]
+
+    # Usage: explicit daily hours, else weekly hours / 7, else the room's timetable hours, else the C# default of 8
+    daily = column(equipment, 'daily_usage_hours')
+    daily = np.where(np.isnan(daily), column(equipment, 'average_weekly_usage_hours') / 7.0, daily)
+    if room_usage:
+        location_codes, locations = category_codes([record.get('room') for record in equipment], timetable_room_key)
+        # A bare room number ("101") matches the timetable's "Room 101"
+        timetable = np.array([room_usage.get(key, room_usage.get('room' + key, np.nan)) if key else np.nan
+                              for key in locations], dtype=np.float64)[location_codes]
+        daily = np.where(np.isnan(daily), timetable, daily)
+    daily = np.where(np.isnan(daily), DEFAULT_DAILY_USAGE_HOURS, daily)
+    multiplier = float(calendar.multiplier_on(np.array([as_of_day]))[0])
+    total_usage = daily * calendar.weighted_days(installed, np.full(n, as_of_day))
+    capacity = np.array([DAILY_CAPACITY_HOURS.get(t, DEFAULT_CAPACITY_HOURS) for t in types], dtype=np.float64)[type_codes]
+
+    logs = group_logs(equipment_ids, maintenance_logs, as_of_day)
+    last_maintenance_day = np.where(np.isnan(logs["last_day"]), installed, logs["last_day"])
+    last_maintenance_days = np.floor(as_of_day - last_maintenance_day)
+    frequency = np.where(np.isnan(logs["mean_interval_days"]), DEFAULT_MAINTENANCE_INTERVAL_MONTHS,
+                         logs["mean_interval_days"] / DAYS_PER_MONTH)
+
+    room_temperature = column(equipment, 'room_temperature', DEFAULT_ROOM_TEMPERATURE)
+    dust_factor = column(equipment, 'dust_factor', DEFAULT_DUST_FACTOR)
+    humidity = column(equipment, 'humidity', DEFAULT_HUMIDITY)
+
+    features = {
+        'age_months': age_months,
+        'week_of_year': np.full(n, float(day_of_year(as_of_day) // 7)),
+        'academic_usage_multiplier': np.full(n, multiplier),
+        'daily_usage_hours': daily,
+        'total_usage_hours': np.round(total_usage, 1),
+        'last_maintenance_days': last_maintenance_days,
+        'maintenance_count': logs["count"],
+        'room_temperature': room_temperature,
+        'dust_factor': dust_factor,
+        'humidity': humidity,
+        'usage_per_day': daily,
+        'usage_vs_capacity': np.round(daily * multiplier / capacity, 4),
+        'maintenance_frequency': np.round(frequency, 2),
+        'maintenance_overdue': (last_maintenance_days > frequency * DAYS_PER_MONTH).astype(np.float64),
+        # Both stress factors reproduce the C# defaults (0.2 and 0.3) at the default room conditions
+        'temperature_stress': np.round(np.clip((room_temperature - 18.0) / 20.0, 0.0, 1.0), 4),
+        'environmental_stress': np.round(np.clip(dust_factor + np.abs(humidity - DEFAULT_HUMIDITY) / 50.0, 0.0, 1.0), 4),
+        'equipment_type_encoded': type_code.astype(np.float64),
+        'room_type_encoded': room_code.astype(np.float64),
+        'age_category_encoded': np.select([age_months < 24, age_months < 60], [1.0, 2.0], 3.0),
+        'corrective_count': logs["corrective"]
+    }
+    for flag, equipment_type in TYPE_FLAGS.items():
+        features[flag] = (type_code == EQUIPMENT_TYPES.index(equipment_type) + 1).astype(np.float64)
+
+    # Sensor snapshots stay NaN when absent so the rolling sensor means can fill them later
+    for channel in SENSOR_CHANNELS:
+        features[channel] = column(equipment, channel)
+    features['performance_score'] = column(equipment, 'performance_score', feature_default('performance_score'))
+    return {name: features[name] for name in FEATURE_COLUMNS}
+
+
+def to_records(equipment: Sequence[Dict[str, Any]], features: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Per-equipment dicts (equipment_id, descriptive fields, features) ready for the prediction endpoints"""
+    names = list(features)
+    matrix = np.column_stack([features[name] for name in names]) if names else np.empty((len(equipment), 0))
+    integral = {name for name in names if name.startswith('is_') or name.endswith(('_encoded', '_count', '_overdue'))}
+    records = []
+    for record, row in zip(equipment, matrix.tolist()):
+        output = {"equipment_id": record.get('equipment_id')}
+        for field in PASSTHROUGH_FIELDS:
+            if record.get(field) is not None:
+                output[field] = record[field]
+        for name, value in zip(names, row):
+            if value != value:  # NaN: feature not available for this equipment
+                continue
+            output[name] = int(value) if name in integral or name == 'age_months' else value
+        records.append(output)
+    return records
+
+
+def model_feature_coverage(features: Dict[str, np.ndarray]) -> Dict[str, float]:
+    """Share of rows with a value for each model feature"""
+    return {name: float(np.mean(~np.isnan(features[name]))) for name in MODEL_FEATURES if name in features}
@@ -0,0 +1,246 @@
+"""
+Fleet risk rollups for the ProactED ML API
+Aggregates the latest prediction of every equipment in the materialized risk table: risk
+distribution per building, room or equipment type, counts per risk band, and the K riskiest items.
+The table rows are copied once into column arrays (rebuilt after the table changes, at most every few
+seconds), so every rollup is a handful of vectorized group-by passes and dashboards receive kilobytes,
+not the fleet.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engines import RISK_LEVELS
+from risk_table import DESCRIPTIVE_FIELDS, RiskTable
+
+GROUP_FIELDS = DESCRIPTIVE_FIELDS
+
+SORT_KEYS = ('mean_probability', 'max_probability', 'count', 'at_risk_count')
+DEFAULT_SORT = 'mean_probability'
+
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 1000
+
+# Seconds a frame is served after the table changed before it is rebuilt; every prediction writes to
+# the table, so rebuilding on each version change would copy the whole fleet on every query under load
+FRAME_MAX_AGE_SECONDS = 10.0
+
+# Bands counted as at risk (High and Critical)
+AT_RISK_FROM = 2
+
+_LEVEL_INDEX = {str(level): i for i, level in enumerate(RISK_LEVELS)}
+
+
+def parse_group_by(value: Any) -> List[str]:
+    """Grouping fields from a comma-separated string or a list; empty for fleet totals only"""
+    if value is None or value == '':
+        return []
+    fields = value.split(',') if isinstance(value, str) else list(value)
+    fields = [str(field).strip() for field in fields if str(field).strip()]
+    unknown = [field for field in fields if field not in GROUP_FIELDS]
+    if unknown:
+        raise ValueError(f"Cannot group by {unknown}; expected fields from {GROUP_FIELDS}")
+    return list(dict.fromkeys(fields))
+
+
+def parse_risk_level(value: Any) -> Optional[int]:
+    """Band index of a risk level name (case-insensitive), or None when absent"""
+    if value is None or value == '':
+        return None
+    for name, index in _LEVEL_INDEX.items():
+        if name.lower() == str(value).strip().lower():
+            return index
+    raise ValueError(f"Unknown risk level {value!r}; expected one of {list(_LEVEL_INDEX)}")
+
+
+class FleetFrame:
+    """Column arrays of the risk table rows at one table version"""
+
+    def __init__(self, version: int, rows: Sequence[Dict[str, Any]]):
+        n = len(rows)
+        self.version = version
+        self.built_at = time.monotonic()
+        self.rows = list(rows)
+        self.probabilities = np.fromiter((row["failure_probability"] for row in rows), dtype=np.float64, count=n)
+        self.bands = np.fromiter((_LEVEL_INDEX.get(row["risk_level"], 0) for row in rows), dtype=np.int64, count=n)
+        self.computed_at = np.fromiter((row["computed_at"] for row in rows), dtype=np.float64, count=n)
+        # Factorized descriptive fields: codes index into the unique values, -1 where missing
+        self.codes: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, np.ndarray] = {}
+        for field in GROUP_FIELDS:
+            codes, uniques = pd.factorize(np.array([row.get(field) for row in rows], dtype=object))
+            self.codes[field] = codes.astype(np.int64)
+            self.values[field] = np.asarray(uniques, dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the column arrays (the row dicts are shared with the risk table)"""
+        arrays = [self.probabilities, self.bands, self.computed_at, *self.codes.values(), *self.values.values()]
+        return int(sum(array.nbytes for array in arrays))
+
+    def mask(self, filters: Optional[Dict[str, Any]] = None, min_band: Optional[int] = None) -> np.ndarray:
+        """Rows whose descriptive fields equal the filter values and whose band is at least min_band"""
+        selected = np.ones(len(self), dtype=bool)
+        for field, value in (filters or {}).items():
+            matches = np.flatnonzero(self.values[field] == value)
+            selected &= self.codes[field] == (matches[0] if len(matches) else -2)
+        if min_band is not None:
+            selected &= self.bands >= min_band
+        return selected
+
+    def group_ids(self, fields: Sequence[str], selected: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (group index per selected row, index of one representative row per group); missing
+        values form their own group
+        """
+        keys = np.zeros(int(selected.sum()), dtype=np.int64)
+        for field in fields:
+            # Shift so missing (-1) becomes 0 and combine as a mixed-radix number
+            keys = keys * (len(self.values[field]) + 1) + self.codes[field][selected] + 1
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        return inverse.reshape(-1), np.flatnonzero(selected)[first]
+
+
+def band_counts(bands: np.ndarray) -> Dict[str, int]:
+    counts = np.bincount(bands, minlength=len(RISK_LEVELS))
+    return {str(level): int(count) for level, count in zip(RISK_LEVELS, counts)}
+
+
+class FleetRollups:
+    """
+    Rollup and top-K queries over a risk table, sharing one column snapshot. The snapshot is rebuilt
+    when the table has changed and it is at least max_age_seconds old, so results may lag the table
+    by that long (their table_version says which version they reflect).
+    """
+
+    def __init__(self, table: RiskTable, max_age_seconds: float = FRAME_MAX_AGE_SECONDS):
+        self.table = table
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._frame: Optional[FleetFrame] = None
+        self.builds = 0
+        self.last_build_ms: Optional[float] = None
+
+    def frame(self) -> FleetFrame:
+        with self._lock:
+            frame = self._frame
+            if frame is None or (frame.version != self.table.version
+                                 and time.monotonic() - frame.built_at >= self.max_age_seconds):
+                started = time.perf_counter()
+                frame = self._frame = FleetFrame(*self.table.snapshot_rows())
+                self.builds += 1
+                self.last_build_ms = round((time.perf_counter() - started) * 1000, 2)
+            return frame
+
+    def totals(self, frame: FleetFrame, selected: np.ndarray) -> Dict[str, Any]:
+        probabilities = frame.probabilities[selected]
+        computed_at = frame.computed_at[selected]
+        bands = frame.bands[selected]
+        return {
+            "equipment_count": int(len(probabilities)),
+            "mean_probability": round(float(probabilities.mean()), 4) if len(probabilities) else None,
+            "risk_levels": band_counts(bands),
+            "at_risk_count": int((bands >= AT_RISK_FROM).sum()),
+            "oldest_computed_at": float(computed_at.min()) if len(computed_at) else None,
+            "newest_computed_at": float(computed_at.max()) if len(computed_at) else None
+        }
+
+    def rollup(self, group_by: Sequence[str] = (), filters: Optional[Dict[str, Any]] = None,
+               min_band: Optional[int] = None, sort: str = DEFAULT_SORT,
+               limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Fleet totals plus, when group_by is given, per-group count, mean and max probability,
+        band counts and the riskiest equipment, sorted by `sort` (descending)
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort {sort!r}; expected one of {list(SORT_KEYS)}")
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        started = time.perf_counter()
+        frame = self.frame()
+        selected = frame.mask(filters, min_band)
+        result: Dict[str, Any] = {"table_version": frame.version, "totals": self.totals(frame, selected)}
+        if group_by:
+            result["group_by"] = list(group_by)
+            groups = self._groups(frame, selected, group_by)
+            groups.sort(key=lambda group: group[sort], reverse=True)
+            result["group_count"] = len(groups)
+            result["groups"] = groups[:limit] if limit is not None else groups
+        result["rollup_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    @staticmethod
+    def _groups(frame: FleetFrame, selected: np.ndarray, group_by: Sequence[str]) -> List[Dict[str, Any]]:
+        if not selected.any():
+            return []
+        group, representative = frame.group_ids(group_by, selected)
+        n_groups = len(representative)
+        probabilities = frame.probabilities[selected]
+        bands = frame.bands[selected]
+
+        counts = np.bincount(group, minlength=n_groups)
+        means = np.bincount(group, weights=probabilities, minlength=n_groups) / counts
+        bands_by_group = np.bincount(group * len(RISK_LEVELS) + bands,
+                                     minlength=n_groups * len(RISK_LEVELS)).reshape(n_groups, len(RISK_LEVELS))
+        # Last row of each group after sorting by (group, probability) is its riskiest
+        order = np.lexsort((probabilities, group))
+        last = order[np.append(np.flatnonzero(np.diff(group[order])), len(order) - 1)]
+        selected_rows = np.flatnonzero(selected)
+
+        return [
+            {
+                "key": {field: frame.rows[representative[g]].get(field) for field in group_by},
+                "count": int(counts[g]),
+                "mean_probability": round(float(means[g]), 4),
+                "max_probability": round(float(probabilities[last[g]]), 4),
+                "risk_levels": {str(level): int(count) for level, count in zip(RISK_LEVELS, bands_by_group[g])},
+                "at_risk_count": int(bands_by_group[g, AT_RISK_FROM:].sum()),
+                "riskiest_equipment_id": frame.rows[selected_rows[last[g]]]["equipment_id"]
+            }
+            for g in range(n_groups)
+        ]
+
+    def top(self, k: int = DEFAULT_TOP_K, filters: Optional[Dict[str, Any]] = None,
+            min_band: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """The k rows with the highest failure probability, highest first (then by equipment_id), and query stats"""
+        if not 1 <= k <= MAX_TOP_K:
+            raise ValueError(f"k must be between 1 and {MAX_TOP_K}")
+        started = time.perf_counter()
+        frame = self.frame()
+        candidates = np.flatnonzero(frame.mask(filters, min_band))
+        matched = len(candidates)
+        probabilities = frame.probabilities[candidates]
+        if len(candidates) > k:
+            # Linear-time selection of the k-th largest; only rows at or above it (ties included,
+            # so the equipment_id order is stable) are sorted
+            kth = probabilities[np.argpartition(-probabilities, k - 1)[k - 1]]
+            keep = probabilities >= kth
+            candidates, probabilities = candidates[keep], probabilities[keep]
+        order = sorted(range(len(candidates)),
+                       key=lambda i: (-probabilities[i], str(frame.rows[candidates[i]]["equipment_id"])))
+        rows = [frame.rows[candidates[i]] for i in order[:k]]
+        return rows, {
+            "table_version": frame.version,
+            "matched_count": matched,
+            "top_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        frame = self._frame
+        return {
+            "table_version": self.table.version,
+            "frame_version": frame.version if frame is not None else None,
+            "frame_rows": len(frame) if frame is not None else 0,
+            "frame_bytes": frame.nbytes if frame is not None else 0,
+            "frame_age_seconds": round(time.monotonic() - frame.built_at, 3) if frame is not None else None,
+            "max_age_seconds": self.max_age_seconds,
+            "builds": self.builds,
+            "last_build_ms": self.last_build_ms
+        }
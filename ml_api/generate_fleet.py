@@ -0,0 +1,299 @@
+"""
+Seeded synthetic fleet generator for the ProactED ML API
+Builds realistic equipment fleets (projectors, air conditioners, podiums) in vectorized NumPy, trains a
+Random Forest on them and writes the model pickle in the layout the API loads
+({'model_info': {model_name, model_object, features, optimal_threshold, performance_metrics}, 'scaler'}).
+The same seed always produces the same rows and the same model, so benchmarks are reproducible.
+
+Usage:
+    python generate_fleet.py --rows 1000000 --data fleet.npz
+    python generate_fleet.py --rows 2000000 --model complete_equipment_failure_prediction_system.pkl
+    python generate_fleet.py --model model.pkl --type-models models --seed 7
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from engines import MODEL_FEATURES, MODEL_FILENAME
+from model_router import EQUIPMENT_TYPES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEED = 42
+DEFAULT_ROWS = 100000
+
+# Rows are generated in fixed-size chunks, each from its own child seed, to bound memory
+GENERATION_CHUNK_ROWS = 1000000
+
+# Training uses a seeded subsample; forests gain little beyond a few hundred thousand rows
+DEFAULT_TRAIN_ROWS = 200000
+DEFAULT_TEST_FRACTION = 0.2
+DEFAULT_TREES = 100
+DEFAULT_MAX_DEPTH = 12
+MIN_SAMPLES_LEAF = 5
+
+TARGET_COLUMN = 'failure_probability'
+LABEL_COLUMN = 'failed'
+
+BUILDINGS = 20
+ROOMS_PER_BUILDING = 40
+
+# Share of each equipment type in the fleet, in EQUIPMENT_TYPES order
+TYPE_SHARES = [0.5, 0.3, 0.2]
+
+# Per-type operating profile: temperature (mean, sd), vibration scale, power (mean, sd), daily usage (mean, sd)
+TYPE_PROFILES = {
+    'projector': {"temperature": (62.0, 6.0), "vibration": 1.2, "power": (260.0, 50.0), "usage": (7.0, 2.0)},
+    'air_conditioner': {"temperature": (48.0, 7.0), "vibration": 2.4, "power": (1800.0, 350.0), "usage": (10.0, 3.0)},
+    'podium': {"temperature": (38.0, 4.0), "vibration": 0.5, "power": (120.0, 30.0), "usage": (6.0, 2.0)}
+}
+
+# Logistic hazard coefficients
+HAZARD_INTERCEPT = -4.4
+HAZARD_WEAR = 2.4
+HAZARD_OVERHEAT = 0.09      # per degree above the type's mean temperature
+HAZARD_VIBRATION = 0.9      # per unit of vibration relative to the type's scale
+HAZARD_DUST = 0.22          # per unit of dust
+HAZARD_PERFORMANCE = 4.0    # per unit of performance below 0.85
+HAZARD_HUMIDITY = 0.025     # per percent away from 45%
+HAZARD_NOISE = 0.35
+
+
+def _profile_arrays(type_codes: np.ndarray, key: str) -> np.ndarray:
+    """Per-row (n, k) parameters of a profile field, looked up by type code"""
+    table = np.array([np.atleast_1d(TYPE_PROFILES[equipment_type][key]) for equipment_type in EQUIPMENT_TYPES])
+    return table[type_codes]
+
+
+def generate_chunk(rng: np.random.Generator, n: int, first_id: int) -> Dict[str, np.ndarray]:
+    """One chunk of fleet rows with model features, descriptive fields and targets"""
+    type_codes = rng.choice(len(EQUIPMENT_TYPES), size=n, p=TYPE_SHARES)
+    temperature_profile = _profile_arrays(type_codes, "temperature")
+    vibration_scale = _profile_arrays(type_codes, "vibration")[:, 0]
+    power_profile = _profile_arrays(type_codes, "power")
+    usage_profile = _profile_arrays(type_codes, "usage")
+
+    age = rng.integers(0, 121, size=n).astype(np.float64)
+    usage = np.clip(rng.normal(usage_profile[:, 0], usage_profile[:, 1]), 0.5, 16.0)
+    humidity = np.clip(rng.normal(45.0, 10.0, size=n), 15.0, 90.0)
+    # Dust builds up between cleanings, faster in dry rooms
+    dust = rng.gamma(2.0, 1.0 + np.maximum(45.0 - humidity, 0.0) / 30.0)
+
+    # Wear grows with age and is accelerated by heavy use
+    wear = age / 120.0 * np.sqrt(usage / 8.0)
+    temperature = rng.normal(temperature_profile[:, 0], temperature_profile[:, 1]) + 8.0 * wear + 1.5 * dust
+    vibration = vibration_scale * rng.gamma(4.0, 0.25, size=n) * (1.0 + wear)
+    power = np.maximum(rng.normal(power_profile[:, 0], power_profile[:, 1]) * (1.0 + 0.15 * wear), 10.0)
+    performance = np.clip(1.0 - 0.3 * wear - 0.02 * dust + rng.normal(0.0, 0.04, size=n), 0.3, 1.0)
+
+    logit = (HAZARD_INTERCEPT + HAZARD_WEAR * wear
+             + HAZARD_OVERHEAT * (temperature - temperature_profile[:, 0])
+             + HAZARD_VIBRATION * (vibration / vibration_scale - 1.0)
+             + HAZARD_DUST * dust
+             + HAZARD_PERFORMANCE * (0.85 - performance)
+             + HAZARD_HUMIDITY * np.abs(humidity - 45.0)
+             + rng.normal(0.0, HAZARD_NOISE, size=n))
+    probability = 1.0 / (1.0 + np.exp(-logit))
+
+    ids = np.arange(first_id, first_id + n)
+    room_index = rng.integers(0, BUILDINGS * ROOMS_PER_BUILDING, size=n)
+    return {
+        "equipment_id": ids.astype(str),
+        "equipment_type": np.asarray(EQUIPMENT_TYPES)[type_codes],
+        "building": np.char.add('B', (room_index // ROOMS_PER_BUILDING + 1).astype(str)),
+        "room": np.char.add('R', (room_index % ROOMS_PER_BUILDING + 101).astype(str)),
+        "age_months": age,
+        "operating_temperature": np.round(temperature, 2),
+        "vibration_level": np.round(vibration, 3),
+        "power_consumption": np.round(power, 1),
+        "humidity_level": np.round(humidity, 1),
+        "dust_accumulation": np.round(dust, 3),
+        "performance_score": np.round(performance, 4),
+        "daily_usage_hours": np.round(usage, 2),
+        TARGET_COLUMN: probability,
+        LABEL_COLUMN: rng.random(n) < probability
+    }
+
+
+def generate_fleet(rows: int, seed: int = DEFAULT_SEED) -> Dict[str, np.ndarray]:
+    """Fleet of `rows` equipment as a dict of columns; deterministic for a given (rows, seed)"""
+    if rows <= 0:
+        raise ValueError("rows must be positive")
+    chunk_sizes = [min(GENERATION_CHUNK_ROWS, rows - start) for start in range(0, rows, GENERATION_CHUNK_ROWS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    chunks = []
+    first_id = 1
+    for size, child in zip(chunk_sizes, seeds):
+        chunks.append(generate_chunk(np.random.default_rng(child), size, first_id))
+        first_id += size
+    if len(chunks) == 1:
+        return chunks[0]
+    return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+
+
+def save_fleet(data: Dict[str, np.ndarray], path: str) -> None:
+    """Write the fleet as .npz (readable by optimize_model.py --data) or .csv"""
+    if path.endswith('.npz'):
+        np.savez(path, **data)
+    elif path.endswith('.csv'):
+        import pandas as pd
+        pd.DataFrame(data).to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unsupported fleet file type: {path} (use .npz or .csv)")
+
+
+def best_f1_threshold(probabilities: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    """Decision threshold maximizing F1 of predicted probabilities against failure labels"""
+    order = np.argsort(-probabilities, kind='stable')
+    hits = np.cumsum(labels[order])
+    predicted = np.arange(1, len(order) + 1)
+    positives = max(int(labels.sum()), 1)
+    f1 = 2 * hits / (predicted + positives)
+    best = int(np.argmax(f1))
+    return {
+        "threshold": float(probabilities[order[best]]),
+        "f1_score": float(f1[best]),
+        "precision": float(hits[best] / predicted[best]),
+        "recall": float(hits[best] / positives)
+    }
+
+
+def train_model_system(data: Dict[str, np.ndarray], seed: int = DEFAULT_SEED,
+                       train_rows: int = DEFAULT_TRAIN_ROWS, test_fraction: float = DEFAULT_TEST_FRACTION,
+                       n_estimators: int = DEFAULT_TREES, max_depth: Optional[int] = DEFAULT_MAX_DEPTH,
+                       min_samples_leaf: int = MIN_SAMPLES_LEAF, max_features: Any = 1.0,
+                       n_jobs: Optional[int] = None, model_name: str = 'Random Forest',
+                       synthetic: bool = True) -> Dict[str, Any]:
+    """
+    Train a scaled Random Forest on a seeded subsample and package it in the API's pickle layout.
+    Without a failure label column the decision threshold stays at 0.5.
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score, roc_auc_score
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(seed)
+    n = len(data[TARGET_COLUMN])
+    sample = rng.permutation(n)[:min(n, int(train_rows / (1.0 - test_fraction)))]
+    split = int(len(sample) * (1.0 - test_fraction))
+    train, test = np.sort(sample[:split]), np.sort(sample[split:])
+
+    X = np.column_stack([data[feature] for feature in MODEL_FEATURES]).astype(np.float64)
+    y = data[TARGET_COLUMN]
+    scaler = StandardScaler().fit(X[train])
+    model = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, min_samples_leaf=min_samples_leaf,
+                                  max_features=max_features, random_state=seed, n_jobs=n_jobs)
+    started = time.perf_counter()
+    model.fit(scaler.transform(X[train]), y[train])
+    train_seconds = time.perf_counter() - started
+
+    predicted = model.predict(scaler.transform(X[test]))
+    metrics = {
+        "r2_score": float(r2_score(y[test], predicted)),
+        "mse": float(mean_squared_error(y[test], predicted)),
+        "mae": float(mean_absolute_error(y[test], predicted))
+    }
+    threshold = 0.5
+    if LABEL_COLUMN in data:
+        labels = np.asarray(data[LABEL_COLUMN][test], dtype=bool)
+        classification = best_f1_threshold(predicted, labels)
+        threshold = classification.pop("threshold")
+        metrics["auc"] = float(roc_auc_score(labels, predicted)) if 0 < labels.sum() < len(labels) else None
+        metrics.update(classification)
+    metrics.update({
+        "train_rows": int(len(train)),
+        "test_rows": int(len(test)),
+        "train_seconds": round(train_seconds, 2),
+        "seed": int(seed),
+        "synthetic": synthetic
+    })
+    return {
+        'model_info': {
+            'model_name': model_name,
+            'model_object': model,
+            'features': list(MODEL_FEATURES),
+            'optimal_threshold': round(threshold, 4),
+            'performance_metrics': metrics
+        },
+        'scaler': scaler
+    }
+
+
+def subset(data: Dict[str, np.ndarray], mask: np.ndarray) -> Dict[str, np.ndarray]:
+    return {column: values[mask] for column, values in data.items()}
+
+
+def save_model_system(model_system: Dict[str, Any], path: str) -> None:
+    with open(path, 'wb') as f:
+        pickle.dump(model_system, f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic fleet and train a model artifact")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--data', help="Write the fleet to this .npz or .csv file")
+    parser.add_argument('--model', nargs='?', const=MODEL_FILENAME,
+                        help=f"Train and write the model pickle (default name: {MODEL_FILENAME})")
+    parser.add_argument('--type-models', metavar='DIR',
+                        help="Also train one model per equipment type into DIR (see ML_TYPE_MODEL_DIR)")
+    parser.add_argument('--train-rows', type=int, default=DEFAULT_TRAIN_ROWS)
+    parser.add_argument('--trees', type=int, default=DEFAULT_TREES)
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH)
+    parser.add_argument('--jobs', type=int, default=None, help="Training processes (scikit-learn n_jobs)")
+    args = parser.parse_args(argv)
+
+    if not (args.data or args.model or args.type_models):
+        parser.error("nothing to write: pass --data, --model and/or --type-models")
+
+    started = time.perf_counter()
+    data = generate_fleet(args.rows, args.seed)
+    report: Dict[str, Any] = {
+        "rows": args.rows,
+        "seed": args.seed,
+        "generate_seconds": round(time.perf_counter() - started, 2),
+        "mean_failure_probability": round(float(data[TARGET_COLUMN].mean()), 4),
+        "failure_rate": round(float(data[LABEL_COLUMN].mean()), 4)
+    }
+
+    if args.data:
+        save_fleet(data, args.data)
+        logger.info(f"Fleet written to {args.data}")
+        report["data"] = args.data
+
+    training = dict(seed=args.seed, train_rows=args.train_rows, n_estimators=args.trees,
+                    max_depth=args.max_depth, n_jobs=args.jobs)
+    if args.model:
+        model_system = train_model_system(data, **training)
+        save_model_system(model_system, args.model)
+        logger.info(f"Model written to {args.model}")
+        report["model"] = {"path": args.model, **model_system['model_info']['performance_metrics'],
+                           "optimal_threshold": model_system['model_info']['optimal_threshold']}
+
+    if args.type_models:
+        os.makedirs(args.type_models, exist_ok=True)
+        report["type_models"] = {}
+        for equipment_type in EQUIPMENT_TYPES:
+            model_system = train_model_system(subset(data, data["equipment_type"] == equipment_type),
+                                              model_name=f'Random Forest ({equipment_type})', **training)
+            path = os.path.join(args.type_models, f"{equipment_type}.pkl")
+            save_model_system(model_system, path)
+            report["type_models"][equipment_type] = {
+                "path": path, "r2_score": model_system['model_info']['performance_metrics']["r2_score"]}
+
+    report["total_seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Incremental rescoring for the ProactED ML API
+Tracks a dirty set of equipment whose inputs changed since the last sweep (feature store upserts,
+new sensor readings, explicit marks) together with the engine the last sweep used. A sweep rescores
+only the dirty equipment in one batch and reports only the rows whose risk level differs from the
+level the previous sweeps reported, so a polling client pays for the rate of change instead of the
+fleet size. When the serving model changes, every known equipment is rescored once.
+"""
+
+import datetime
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from engines import PredictorEngine
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalRescorer:
+    """
+    Dirty set, the model it was last swept with, and the risk level last reported per equipment.
+    Changes are diffed against the reported levels, not the risk table, because predictions served
+    between sweeps overwrite the table without the polling client seeing them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Serializes sweeps; marks keep landing in the dirty set while one runs
+        self._sweep_lock = threading.Lock()
+        self.dirty: set = set()
+        self._engine_ref: Optional[weakref.ref] = None
+        self.model_version: Optional[str] = None
+        # equipment_id -> {"risk_level", "failure_probability"} as last returned by a sweep
+        self.reported: Dict[str, Dict[str, Any]] = {}
+        self.sweeps = 0
+        self.last_sweep: Optional[Dict[str, Any]] = None
+
+    def mark(self, equipment_ids: Iterable[Any]) -> int:
+        """Add equipment to the dirty set; returns the number of pending equipment"""
+        with self._lock:
+            self.dirty.update(str(equipment_id) for equipment_id in equipment_ids)
+            return len(self.dirty)
+
+    @property
+    def pending(self) -> int:
+        return len(self.dirty)
+
+    def model_changed(self, engine: PredictorEngine) -> bool:
+        """True before the first sweep and whenever a different engine object serves predictions"""
+        return self._engine_ref is None or self._engine_ref() is not engine
+
+    def sweep(self, engine: PredictorEngine, known_ids: Callable[[], Iterable[str]],
+              load: Callable[[List[str]], List[Optional[Dict[str, Any]]]],
+              score: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Rescore the dirty equipment (every known equipment after a model change).
+        load(ids) returns the input items (None for unknown IDs) and score(items) one response per
+        item. Returns the sweep stats and, under "changes", the rows whose risk level differs from
+        the one last reported (equipment never reported before counts as changed).
+        """
+        with self._sweep_lock:
+            started = time.perf_counter()
+            with self._lock:
+                full = self.model_changed(engine)
+                taken = self.dirty
+                self.dirty = set()
+            equipment_ids = sorted(set(known_ids()) | taken if full else taken)
+
+            try:
+                items = load(equipment_ids)
+                known = [(equipment_id, item) for equipment_id, item in zip(equipment_ids, items) if item is not None]
+                predictions = score([item for _, item in known]) if known else []
+            except Exception:
+                # Nothing was rescored; keep the work for the next sweep
+                self.mark(taken)
+                raise
+            scored = time.perf_counter()
+
+            changes = []
+            failed = []
+            retry = []
+            reported = {}
+            for (equipment_id, _), prediction in zip(known, predictions):
+                if not prediction.get("success", False):
+                    failed.append({"equipment_id": equipment_id, "error": prediction.get("error")})
+                    # Scoring failures (fallback rows) are retried; invalid inputs wait for their next update
+                    if "failure_probability" in prediction:
+                        retry.append(equipment_id)
+                    continue
+                before = self.reported.get(equipment_id)
+                previous_level = before["risk_level"] if before is not None else None
+                if prediction["risk_level"] != previous_level:
+                    reported[equipment_id] = {"risk_level": prediction["risk_level"],
+                                              "failure_probability": prediction["failure_probability"]}
+                    changes.append({
+                        "equipment_id": equipment_id,
+                        "previous_risk_level": previous_level,
+                        "risk_level": prediction["risk_level"],
+                        "previous_failure_probability": before["failure_probability"] if before is not None else None,
+                        "failure_probability": prediction["failure_probability"],
+                        "model_version": prediction.get("model_version")
+                    })
+            self.mark(retry)
+            self.reported.update(reported)
+
+            with self._lock:
+                self._engine_ref = weakref.ref(engine)
+                self.model_version = engine.model_version
+            self.sweeps += 1
+            self.last_sweep = {
+                "completed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "model_version": engine.model_version,
+                "full_rescore": full,
+                "dirty_count": len(taken),
+                "rescored_count": len(known) - len(failed),
+                "unknown_count": len(equipment_ids) - len(known),
+                "failed_count": len(failed),
+                "changed_count": len(changes),
+                "score_ms": round((scored - started) * 1000, 1),
+                "sweep_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            logger.info(f"Incremental sweep: {len(known)} rescored ({'full' if full else 'dirty'}), "
+                        f"{len(changes)} risk level changes in {self.last_sweep['sweep_ms']} ms")
+            return {**self.last_sweep, "failed": failed, "changes": changes}
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "pending_count": self.pending,
+            "reported_count": len(self.reported),
+            "model_version": self.model_version,
+            "sweeps": self.sweeps,
+            "last_sweep": self.last_sweep
+        }
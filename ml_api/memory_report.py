@@ -0,0 +1,276 @@
+"""
+Memory introspection for the ProactED ML API
+Reports process RSS, the footprint of the loaded model system per component and per estimator,
+and sizes of the in-process caches, so containers and workers can be sized from measurements.
+tracemalloc snapshots can be taken on demand and diffed against the previous or the first one
+to find what keeps growing between two points in time.
+"""
+
+import gc
+import linecache
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Objects visited per deep_sizeof call before giving up (the result is then a lower bound)
+MAX_OBJECTS = 2_000_000
+
+DEFAULT_TRACE_FRAMES = 10
+DEFAULT_TOP_STATS = 25
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# Entries measured when estimating the size of a large mapping
+SAMPLE_ENTRIES = 256
+
+_PROC_STATUS_FIELDS = ('VmRSS', 'VmHWM', 'VmSize', 'RssAnon', 'RssFile', 'Threads')
+
+
+def process_memory() -> Dict[str, Any]:
+    """Resident and virtual size of this process (from /proc where available)"""
+    report: Dict[str, Any] = {"pid": os.getpid()}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in _PROC_STATUS_FIELDS:
+                    parts = value.split()
+                    if key == 'Threads':
+                        report["threads"] = int(parts[0])
+                    else:
+                        report[f"{key.lower()}_bytes"] = int(parts[0]) * 1024
+    except OSError:
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report["vmhwm_bytes"] = peak if sys.platform == 'darwin' else peak * 1024
+        report["threads"] = threading.active_count()
+    report["gc_objects"] = len(gc.get_objects())
+    return report
+
+
+def tree_bytes(tree: Any) -> int:
+    """Bytes of a fitted sklearn Tree's node and value arrays (invisible to sys.getsizeof)"""
+    state = tree.__getstate__()
+    return int(state['nodes'].nbytes + state['values'].nbytes)
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Approximate bytes reachable from obj: containers and instance attributes are followed,
+    numpy arrays count their buffers, pandas objects their deep memory usage and sklearn trees
+    their node arrays. Objects already counted (through seen) are skipped.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    visited = 0
+    while stack and visited < MAX_OBJECTS:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        visited += 1
+
+        if isinstance(current, np.ndarray):
+            # getsizeof includes the buffer only when the array owns it, so views count their header
+            total += sys.getsizeof(current)
+            continue
+        if type(current).__name__ == 'Tree' and hasattr(current, 'node_count'):
+            total += sys.getsizeof(current) + tree_bytes(current)
+            continue
+        memory_usage = getattr(current, 'memory_usage', None)
+        if callable(memory_usage) and type(current).__module__.startswith('pandas'):
+            usage = memory_usage(deep=True)
+            total += int(usage.sum() if hasattr(usage, 'sum') else usage)
+            continue
+
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        else:
+            attributes = getattr(current, '__dict__', None)
+            if isinstance(attributes, dict):
+                stack.append(attributes)
+            for slot in getattr(type(current), '__slots__', ()):
+                if isinstance(slot, str) and hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+    return total
+
+
+def estimate_mapping_bytes(mapping: Dict[Any, Any], sample: int = SAMPLE_ENTRIES) -> int:
+    """Size of a large dict extrapolated from its first entries (keeps the endpoint cheap)"""
+    if not mapping:
+        return sys.getsizeof(mapping)
+    items = []
+    for i, item in enumerate(mapping.items()):
+        if i >= sample:
+            break
+        items.append(item)
+    per_entry = sum(deep_sizeof(key) + deep_sizeof(value) for key, value in items) / len(items)
+    return int(sys.getsizeof(mapping) + per_entry * len(mapping))
+
+
+def summarize(values: Iterable[float]) -> Dict[str, Any]:
+    values = np.asarray(list(values), dtype=float)
+    if len(values) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "total": int(values.sum()),
+        "min": int(values.min()),
+        "median": int(np.median(values)),
+        "max": int(values.max())
+    }
+
+
+def estimator_footprint(model: Any) -> List[Dict[str, Any]]:
+    """Nodes, depth and array bytes of every tree in a sklearn or compact forest"""
+    if hasattr(model, 'roots') and hasattr(model, 'node_count'):
+        starts = model.roots.astype(np.int64)
+        ends = np.append(starts[1:], model.node_count)
+        node_bytes = sum(array.itemsize for array in (model.feature, model.threshold, model.left,
+                                                      model.right, model.value))
+        return [{"index": i, "nodes": int(end - start), "bytes": int((end - start) * node_bytes)}
+                for i, (start, end) in enumerate(zip(starts, ends))]
+    return [{"index": i, "nodes": int(estimator.tree_.node_count), "depth": int(estimator.tree_.max_depth),
+             "bytes": tree_bytes(estimator.tree_)}
+            for i, estimator in enumerate(getattr(model, 'estimators_', []))]
+
+
+def model_footprint(model_system: Any, engine: Any = None, per_estimator: bool = True) -> Dict[str, Any]:
+    """
+    Bytes held by each part of the loaded model system (model object, scaler, metadata) and
+    by the engine's derived state, plus per-estimator tree sizes.
+    """
+    report: Dict[str, Any] = {}
+    seen: set = set()
+    components: Dict[str, int] = {}
+    if isinstance(model_system, dict):
+        for key, value in model_system.items():
+            if key == 'model_info' and isinstance(value, dict):
+                for info_key, info_value in value.items():
+                    components[f"model_info.{info_key}"] = deep_sizeof(info_value, seen)
+            else:
+                components[key] = deep_sizeof(value, seen)
+    elif model_system is not None:
+        components["model_system"] = deep_sizeof(model_system, seen)
+    if engine is not None:
+        region_index = getattr(engine, 'region_index', None)
+        if region_index is not None:
+            components["engine.region_index"] = deep_sizeof(region_index, seen)
+        # Anything the engine holds beyond the model system (importance dict, cached arrays)
+        components["engine.other"] = deep_sizeof(engine, seen)
+    report["components"] = components
+    report["total_bytes"] = int(sum(components.values()))
+
+    model = getattr(engine, 'model', None)
+    if model is None and isinstance(model_system, dict):
+        model = model_system.get('model_info', {}).get('model_object')
+    if model is not None:
+        estimators = estimator_footprint(model)
+        report["estimators"] = {
+            "bytes": summarize(estimator["bytes"] for estimator in estimators),
+            "nodes": summarize(estimator["nodes"] for estimator in estimators)
+        }
+        if per_estimator:
+            report["estimators"]["per_estimator"] = estimators
+    return report
+
+
+class MemoryTracer:
+    """On-demand tracemalloc snapshots, each diffed against the previous one or the first one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self.snapshots = 0
+        self.started_at: Optional[float] = None
+        self.started_here = False
+
+    @staticmethod
+    def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, __file__)
+        ))
+
+    def snapshot(self, frames: int = DEFAULT_TRACE_FRAMES, limit: int = DEFAULT_TOP_STATS,
+                 group_by: str = 'lineno', compare_to: str = 'previous') -> Dict[str, Any]:
+        """
+        Start tracing and take the baseline on the first call; later calls return the top
+        allocation differences against the previous (or baseline) snapshot.
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {list(GROUP_BY)}")
+        if compare_to not in ('previous', 'baseline'):
+            raise ValueError("compare_to must be 'previous' or 'baseline'")
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, int(frames)))
+                self.started_here = True
+                self.started_at = time.time()
+                self.baseline = self.previous = self._filtered(tracemalloc.take_snapshot())
+                self.snapshots = 1
+                return {"started": True, **self.describe()}
+
+            started = time.perf_counter()
+            current = self._filtered(tracemalloc.take_snapshot())
+            reference = self.baseline if compare_to == 'baseline' else self.previous
+            if reference is None:
+                self.baseline = reference = current
+            differences = current.compare_to(reference, group_by)
+            self.previous = current
+            self.snapshots += 1
+            return {
+                "started": False,
+                "compared_to": compare_to,
+                "snapshot_ms": round((time.perf_counter() - started) * 1000, 1),
+                "size_diff_bytes": int(sum(stat.size_diff for stat in differences)),
+                "count_diff": int(sum(stat.count_diff for stat in differences)),
+                "top": [
+                    {
+                        "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                        "size_bytes": stat.size,
+                        "size_diff_bytes": stat.size_diff,
+                        "count": stat.count,
+                        "count_diff": stat.count_diff
+                    }
+                    for stat in differences[:max(1, int(limit))]
+                ],
+                **self.describe()
+            }
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            if self.started_here and tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.baseline = self.previous = None
+            self.started_here = False
+            self.started_at = None
+            self.snapshots = 0
+            return self.describe()
+
+    def describe(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "snapshots": self.snapshots,
+            "started_at": self.started_at,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0
+        }
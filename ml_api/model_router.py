@@ -0,0 +1,206 @@
+"""
+Per-equipment-type model routing for the ProactED ML API
+Rows tagged as projector, air conditioner or podium are scored by a type-specific model when one
+exists in the type model directory, and by the global engine otherwise. Type models load on first
+use and are evicted least-recently-used once their combined size exceeds a memory cap.
+"""
+
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from engines import COMPACT_MODEL_FILENAME, ForestEngine, PredictorEngine, load_model_file
+
+logger = logging.getLogger(__name__)
+
+# Equipment types, matching the is_* flags of the .NET featurizer
+EQUIPMENT_TYPES = ['projector', 'air_conditioner', 'podium']
+
+TYPE_FLAGS = {f"is_{equipment_type}": equipment_type for equipment_type in EQUIPMENT_TYPES}
+
+# Directory holding <type>.compact.npz or <type>.pkl; 'off' disables routing
+TYPE_MODEL_DIR_ENV_VAR = 'ML_TYPE_MODEL_DIR'
+DEFAULT_TYPE_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# Memory cap for loaded type models, in megabytes
+TYPE_MODEL_MEMORY_ENV_VAR = 'ML_TYPE_MODEL_MEMORY_MB'
+DEFAULT_MEMORY_CAP_MB = 256
+
+# Extensions tried for each type, in order of preference
+TYPE_MODEL_EXTENSIONS = ['.compact.npz', '.pkl']
+
+GLOBAL_ROUTE = 'global'
+
+
+def normalize_equipment_type(value: Any) -> Optional[str]:
+    """
+    Map a free-text type name ("Air Conditioner", "air-conditioner", "LCD Projector") to a routing key.
+    Like the .NET featurizer, a known type name anywhere in the text counts.
+    """
+    if value is None:
+        return None
+    text = str(value).strip().lower().replace('-', '_').replace(' ', '_')
+    for equipment_type in EQUIPMENT_TYPES:
+        if equipment_type in text:
+            return equipment_type
+    return text or None
+
+
+def equipment_type_of(record: Dict[str, Any]) -> Optional[str]:
+    """Routing key of a request record from 'equipment_type' or the is_* flags"""
+    if record.get('equipment_type'):
+        return normalize_equipment_type(record['equipment_type'])
+    for flag, equipment_type in TYPE_FLAGS.items():
+        try:
+            if float(record.get(flag) or 0) == 1:
+                return equipment_type
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def engine_nbytes(engine: PredictorEngine) -> int:
+    """Approximate memory held by an engine's model arrays"""
+    model = getattr(engine, 'model', None)
+    if model is None:
+        return 0
+    if hasattr(model, 'nbytes'):
+        return int(model.nbytes)
+    total = 0
+    for estimator in getattr(model, 'estimators_', []):
+        state = estimator.tree_.__getstate__()
+        total += state['nodes'].nbytes + state['values'].nbytes
+    return total
+
+
+class ModelRouter:
+    """Lazily loaded, LRU-evicted type models in front of a global fallback engine"""
+
+    def __init__(self, default_engine: PredictorEngine, model_dir: Optional[str] = DEFAULT_TYPE_MODEL_DIR,
+                 memory_cap_bytes: int = DEFAULT_MEMORY_CAP_MB * 1024 * 1024):
+        self.default_engine = default_engine
+        self.model_dir = model_dir
+        self.memory_cap_bytes = memory_cap_bytes
+        self._loaded: 'collections.OrderedDict[str, PredictorEngine]' = collections.OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "fallback_rows": 0, "routed_rows": 0}
+        self.paths = self.discover()
+
+    @classmethod
+    def from_environment(cls, default_engine: PredictorEngine) -> 'ModelRouter':
+        model_dir = os.environ.get(TYPE_MODEL_DIR_ENV_VAR, DEFAULT_TYPE_MODEL_DIR)
+        if model_dir.lower() == 'off':
+            model_dir = None
+        memory_cap_mb = float(os.environ.get(TYPE_MODEL_MEMORY_ENV_VAR, DEFAULT_MEMORY_CAP_MB))
+        return cls(default_engine, model_dir, int(memory_cap_mb * 1024 * 1024))
+
+    def discover(self) -> Dict[str, str]:
+        """Model file per equipment type found in the model directory"""
+        paths = {}
+        if not self.model_dir or not os.path.isdir(self.model_dir):
+            return paths
+        names = sorted(os.listdir(self.model_dir))
+        for extension in TYPE_MODEL_EXTENSIONS:
+            for name in names:
+                if name.endswith(extension) and name != COMPACT_MODEL_FILENAME:
+                    equipment_type = normalize_equipment_type(name[:-len(extension)])
+                    if equipment_type and equipment_type not in paths:
+                        paths[equipment_type] = os.path.join(self.model_dir, name)
+        return paths
+
+    def engine_for(self, equipment_type: Optional[str]) -> Optional[PredictorEngine]:
+        """Type model for the key, loading (and evicting) as needed; None means use the global engine"""
+        if equipment_type is None or equipment_type not in self.paths:
+            return None
+        with self._lock:
+            engine = self._loaded.get(equipment_type)
+            if engine is not None:
+                self._loaded.move_to_end(equipment_type)
+                self.stats["hits"] += 1
+                return engine
+            if equipment_type in self._failed:
+                return None
+
+            started = time.perf_counter()
+            try:
+                engine = ForestEngine(load_model_file(self.paths[equipment_type]))
+            except Exception as e:
+                logger.error(f"Type model '{equipment_type}' unavailable, using global model: {e}")
+                self._failed[equipment_type] = str(e)
+                return None
+
+            size = engine_nbytes(engine)
+            self._loaded[equipment_type] = engine
+            self._sizes[equipment_type] = size
+            self.stats["loads"] += 1
+            self._evict()
+            logger.info(f"Loaded type model '{equipment_type}' from {self.paths[equipment_type]} "
+                        f"({size / 1e6:.1f} MB, {(time.perf_counter() - started) * 1000:.0f} ms)")
+            return engine
+
+    def _evict(self) -> None:
+        """Drop least recently used models until the cap holds (the most recent one always stays)"""
+        while self.loaded_bytes > self.memory_cap_bytes and len(self._loaded) > 1:
+            victim = next(iter(self._loaded))
+            del self._loaded[victim]
+            self._sizes.pop(victim, None)
+            self.stats["evictions"] += 1
+            logger.info(f"Evicted type model '{victim}'")
+
+    @property
+    def loaded_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def predict_records(self, records: Sequence[Dict[str, Any]], deadline: Optional[float] = None,
+                        tolerance: Optional[float] = None, timestamp: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Score records grouped by route so every model runs once per batch.
+        Each prediction reports the model it was routed to; all carry one batch timestamp
+        (now, unless given) rather than one per routed call.
+        """
+        timestamp = timestamp or datetime.datetime.utcnow().isoformat()
+        types = [equipment_type_of(record) or GLOBAL_ROUTE for record in records]
+        type_names, type_codes = np.unique(np.asarray(types, dtype=str), return_inverse=True)
+
+        # Resolve each distinct type once; types without a model share the global engine
+        engines = {GLOBAL_ROUTE: self.default_engine}
+        route_of_type = []
+        for equipment_type in type_names.tolist():
+            engine = self.engine_for(equipment_type) if equipment_type != GLOBAL_ROUTE else None
+            route = equipment_type if engine is not None else GLOBAL_ROUTE
+            engines.setdefault(route, engine)
+            route_of_type.append(route)
+        routes = np.asarray(route_of_type, dtype=object)[type_codes.reshape(-1)]
+
+        predictions: List[Optional[Dict[str, Any]]] = [None] * len(records)
+        for route, engine in engines.items():
+            rows = np.flatnonzero(routes == route)
+            if len(rows) == 0:
+                continue
+            group = engine.predict_records([records[row] for row in rows], deadline=deadline, tolerance=tolerance)
+            for row, prediction in zip(rows, group):
+                prediction["routed_model"] = route
+                prediction["prediction_timestamp"] = timestamp
+                predictions[row] = prediction
+            self.stats["fallback_rows" if route == GLOBAL_ROUTE else "routed_rows"] += len(rows)
+        return predictions
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model_dir": self.model_dir,
+                "available_types": sorted(self.paths),
+                "loaded_types": list(self._loaded),
+                "loaded_bytes": self.loaded_bytes,
+                "memory_cap_bytes": self.memory_cap_bytes,
+                "failed_types": dict(self._failed),
+                **self.stats
+            }
@@ -0,0 +1,264 @@
+"""
+Offline optimizer for the trained Random Forest model
+Folds the StandardScaler into the tree thresholds, removes redundant splits, drops trees that
+contribute little within an accuracy tolerance, and writes a compact float32 .npz the API can load.
+
+Usage:
+    python optimize_model.py complete_equipment_failure_prediction_system.pkl
+    python optimize_model.py model.pkl --data fleet.csv --tolerance 0.002 --output model.compact.npz
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from compact_forest import CompactForest, TreeNodes
+from engines import MODEL_FILENAME, ForestEngine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COMPACT_SUFFIX = '.compact.npz'
+
+# Target column looked up in evaluation data files
+TARGET_COLUMN = 'failure_probability'
+
+# Share of the evaluation rows held out from tree pruning and used for the accuracy report
+DEFAULT_HOLDOUT_FRACTION = 0.3
+
+
+def default_output_path(model_path: str) -> str:
+    root, _ = os.path.splitext(model_path)
+    return root + COMPACT_SUFFIX
+
+
+def r2(reference: np.ndarray, predicted: np.ndarray) -> float:
+    total = float(((reference - reference.mean()) ** 2).sum())
+    residual = float(((reference - predicted) ** 2).sum())
+    return 1.0 - residual / total if total > 0 else float(residual == 0)
+
+
+def load_evaluation_data(path: Optional[str], engine: ForestEngine, samples: int,
+                         seed: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Raw feature matrix (and target if the file has one) used to measure accuracy.
+    Without a data file, rows are sampled around the scaler's mean and spread.
+    """
+    if path:
+        if path.endswith('.npz'):
+            with np.load(path, allow_pickle=False) as data:
+                X = np.column_stack([data[feature] for feature in engine.features]).astype(np.float64)
+                y = data[TARGET_COLUMN].astype(np.float64) if TARGET_COLUMN in data else None
+        else:
+            import pandas as pd
+            frame = pd.read_csv(path)
+            X = frame[engine.features].to_numpy(dtype=np.float64)
+            y = frame[TARGET_COLUMN].to_numpy(dtype=np.float64) if TARGET_COLUMN in frame else None
+        return X, y
+
+    if engine.scaler is None or not hasattr(engine.scaler, 'mean_'):
+        raise ValueError("No evaluation data given and the model has no StandardScaler to sample from; pass --data")
+
+    rng = np.random.default_rng(seed)
+    X = rng.normal(engine.scaler.mean_, engine.scaler.scale_, size=(samples, len(engine.features)))
+    return X, None
+
+
+def split_holdout(n_rows: int, fraction: float, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(pruning rows, held-out rows): a seeded random split so pruning never sees the reported rows"""
+    if not 0.0 < fraction < 1.0:
+        raise ValueError("holdout fraction must be between 0 and 1")
+    n_holdout = int(round(n_rows * fraction))
+    if n_holdout < 1 or n_holdout >= n_rows:
+        raise ValueError(f"{n_rows} evaluation rows are too few to hold out {fraction:.0%}")
+    order = np.random.default_rng(seed).permutation(n_rows)
+    return np.sort(order[n_holdout:]), np.sort(order[:n_holdout])
+
+
+def compact_from_engine(engine: ForestEngine) -> Tuple[CompactForest, Dict[str, int]]:
+    """Fold the scaler into every tree, simplify it and pack the forest into flat arrays"""
+    scale = offset = None
+    if engine.scaler is not None:
+        if not hasattr(engine.scaler, 'scale_'):
+            raise ValueError(f"Cannot fold scaler of type {type(engine.scaler).__name__}; only StandardScaler is supported")
+        n = len(engine.features)
+        scale = engine.scaler.scale_ if engine.scaler.scale_ is not None else np.ones(n)
+        offset = engine.scaler.mean_ if engine.scaler.mean_ is not None else np.zeros(n)
+
+    trees = []
+    stats = {"nodes_before": 0, "nodes_after": 0, "splits_removed": 0}
+    for estimator in engine.model.estimators_:
+        tree = TreeNodes.from_sklearn(estimator, scale, offset)
+        simplified, removed = tree.simplify(len(engine.features))
+        stats["nodes_before"] += len(tree)
+        stats["nodes_after"] += len(simplified)
+        stats["splits_removed"] += removed
+        trees.append(simplified)
+
+    importances = np.asarray(getattr(engine.model, 'feature_importances_', np.zeros(len(engine.features))),
+                             dtype=np.float32)
+    return CompactForest.from_trees(trees, len(engine.features), importances), stats
+
+
+def prune_trees(tree_outputs: np.ndarray, reference: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Greedy backward elimination: repeatedly drop the tree whose removal hurts R² against the
+    reference least, while R² stays within tolerance of the full forest. Returns kept tree indices.
+    """
+    n_trees = tree_outputs.shape[1]
+    kept = list(range(n_trees))
+    total = tree_outputs.sum(axis=1)
+    floor = r2(reference, total / n_trees) - tolerance
+
+    while len(kept) > 1:
+        k = len(kept)
+        # Ensemble mean with each candidate tree removed, all candidates at once
+        candidates = (total[:, None] - tree_outputs[:, kept]) / (k - 1)
+        residual = ((candidates - reference[:, None]) ** 2).sum(axis=0)
+        best = int(np.argmin(residual))
+        if r2(reference, candidates[:, best]) < floor:
+            break
+        total = total - tree_outputs[:, kept[best]]
+        kept.pop(best)
+
+    return np.asarray(kept)
+
+
+def time_call(function, repeats: int) -> float:
+    """Median wall time of function() in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return float(np.median(timings))
+
+
+def accuracy_report(X: np.ndarray, y: Optional[np.ndarray], original: np.ndarray,
+                    optimized: np.ndarray) -> Dict[str, Any]:
+    deviation = np.abs(optimized - original)
+    report = {
+        "fidelity_r2": round(r2(original, optimized), 6),
+        "mean_abs_deviation": float(deviation.mean()),
+        "max_abs_deviation": float(deviation.max()),
+        "evaluation_rows": int(len(X))
+    }
+    if y is not None:
+        report["original_r2"] = round(r2(y, original), 6)
+        report["optimized_r2"] = round(r2(y, optimized), 6)
+        report["r2_change"] = round(report["optimized_r2"] - report["original_r2"], 6)
+    return report
+
+
+def optimize(model_path: str, output_path: str, data_path: Optional[str] = None, tolerance: float = 0.001,
+             samples: int = 20000, seed: int = 42, prune: bool = True, repeats: int = 50,
+             holdout: float = DEFAULT_HOLDOUT_FRACTION) -> Dict[str, Any]:
+    """
+    Run the full optimization and return the comparison report. Trees are pruned on one part of
+    the evaluation rows and accuracy is reported on the held-out rest.
+    """
+    with open(model_path, 'rb') as f:
+        model_system = pickle.load(f)
+    engine = ForestEngine(model_system)
+    if not hasattr(engine.model, 'estimators_'):
+        raise ValueError(f"Model object {type(engine.model).__name__} is not a tree ensemble")
+
+    X_all, y_all = load_evaluation_data(data_path, engine, samples, seed)
+    pruning_rows, holdout_rows = split_holdout(len(X_all), holdout, seed)
+    X, y = X_all[holdout_rows], (y_all[holdout_rows] if y_all is not None else None)
+    ids = np.arange(len(X))
+    original = engine.predict(X, ids)
+
+    compact, stats = compact_from_engine(engine)
+    trees_before = compact.n_trees
+    if prune:
+        # Prune against the target when we have one, otherwise against the original forest
+        X_prune = X_all[pruning_rows]
+        reference = y_all[pruning_rows] if y_all is not None else engine.predict(X_prune, np.arange(len(X_prune)))
+        kept = prune_trees(compact.tree_predictions(X_prune, 0, compact.n_trees), reference, tolerance)
+        compact = compact.select_trees(kept)
+    optimized = compact.predict(X)
+
+    model_info = model_system['model_info'] if 'model_info' in model_system else {}
+    optimization = {
+        "source": os.path.basename(model_path),
+        "tolerance": tolerance,
+        "pruning_rows": int(len(pruning_rows)) if prune else 0,
+        "trees_before": trees_before,
+        "trees_after": compact.n_trees,
+        **stats,
+        "threshold_dtype": str(compact.threshold.dtype),
+        "child_index_dtype": str(compact.left.dtype),
+        "feature_index_dtype": str(compact.feature.dtype)
+    }
+    compact.save(output_path, {
+        "model_name": model_info.get('model_name', engine.model_name),
+        "features": engine.features,
+        "optimal_threshold": engine.threshold,
+        "performance_metrics": engine.performance_metrics,
+        "optimization": optimization
+    })
+
+    single = X[:1]
+    batch = X[:1000]
+    report = {
+        "output": output_path,
+        "optimization": optimization,
+        "size_bytes": {
+            "original_pickle": os.path.getsize(model_path),
+            "compact_file": os.path.getsize(output_path),
+            "compact_arrays_in_memory": compact.nbytes
+        },
+        "latency_ms": {
+            "original_single": time_call(lambda: engine.predict(single, [0]), repeats),
+            "compact_single": time_call(lambda: compact.predict(single), repeats),
+            "original_batch_1000": time_call(lambda: engine.predict(batch, ids[:len(batch)]), max(3, repeats // 10)),
+            "compact_batch_1000": time_call(lambda: compact.predict(batch), max(3, repeats // 10))
+        },
+        "accuracy": accuracy_report(X, y, original, optimized)
+    }
+    report["size_bytes"]["reduction_ratio"] = round(
+        report["size_bytes"]["original_pickle"] / max(report["size_bytes"]["compact_file"], 1), 2)
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compile the trained forest into a compact float32 model")
+    parser.add_argument('model', nargs='?', default=MODEL_FILENAME, help="Path to the model pickle")
+    parser.add_argument('--output', help=f"Output .npz path (default: <model>{COMPACT_SUFFIX})")
+    parser.add_argument('--data', help=f"CSV/.npz evaluation data with model features (and optional '{TARGET_COLUMN}')")
+    parser.add_argument('--tolerance', type=float, default=0.001,
+                        help="Maximum R² drop allowed when dropping trees (default: 0.001)")
+    parser.add_argument('--samples', type=int, default=20000, help="Rows sampled when --data is not given")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--holdout', type=float, default=DEFAULT_HOLDOUT_FRACTION,
+                        help="Share of the evaluation rows kept out of pruning and used for the accuracy report "
+                             f"(default: {DEFAULT_HOLDOUT_FRACTION})")
+    parser.add_argument('--no-prune', action='store_true', help="Keep every tree")
+    parser.add_argument('--report', help="Also write the report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    output = args.output or default_output_path(args.model)
+    try:
+        report = optimize(args.model, output, args.data, args.tolerance, args.samples, args.seed,
+                          prune=not args.no_prune, holdout=args.holdout)
+    except Exception as e:
+        logger.error(f"Optimization failed: {e}")
+        return 1
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""
+Decision-region lookup index for the four live input features
+With humidity, dust, performance and usage hours fixed at their defaults, the forest output is
+piecewise-constant over the grid formed by the split thresholds of age_months, operating_temperature,
+vibration_level and power_consumption. The index stores one value per grid cell, so a prediction is
+four binary searches and a table lookup. Rows outside the index's domain fall back to the forest.
+
+Build offline (the index is verified against the forest at one probe per cell before saving):
+    python region_index.py complete_equipment_failure_prediction_system.pkl
+    python region_index.py model.pkl --domain operating_temperature=20:110 --max-cells 4000000
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from engines import ForestEngine, feature_default, load_model_system
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LIVE_FEATURES = ['age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
+
+REGION_INDEX_FILENAME = 'region_index.npz'
+
+# Environment variable with the index path, or 'off' to disable it
+REGION_INDEX_ENV_VAR = 'ML_REGION_INDEX'
+
+DEFAULT_MAX_CELLS = 2_000_000
+
+# Rows per forest call while verifying
+VERIFY_CHUNK_ROWS = 65536
+
+# Largest difference between table and forest accepted by verification
+VERIFY_TOLERANCE = 1e-9
+
+INDEX_FORMAT_VERSION = 1
+
+
+class RegionIndexTooLarge(ValueError):
+    """The threshold grid has more cells than the configured maximum"""
+
+
+def model_fingerprint(engine: ForestEngine) -> str:
+    """Hash of the tree structure and input transform, used to match an index to its model"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps(engine.features).encode('utf-8'))
+    for array in engine.comparison_transform()[:2]:
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    for feature, threshold, left, right, value in engine.tree_structures():
+        for array in (feature, threshold, value):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class RegionIndex:
+    """Dense 4-D table of forest outputs over the live-feature threshold grid"""
+
+    def __init__(self, features: Sequence[str], thresholds: List[np.ndarray], table: np.ndarray,
+                 offset: np.ndarray, scale: np.ndarray, cast_float32: bool, fixed_values: np.ndarray,
+                 domain_low: np.ndarray, domain_high: np.ndarray, fingerprint: str):
+        self.features = list(features)
+        self.thresholds = thresholds
+        self.table = table
+        self.offset = offset
+        self.scale = scale
+        self.cast_float32 = bool(cast_float32)
+        self.fixed_values = fixed_values
+        self.domain_low = domain_low
+        self.domain_high = domain_high
+        self.fingerprint = fingerprint
+
+        self.live_columns = np.array([self.features.index(feature) for feature in LIVE_FEATURES])
+        self.fixed_columns = np.array([j for j in range(len(self.features)) if j not in self.live_columns],
+                                      dtype=np.intp)
+
+    @property
+    def n_cells(self) -> int:
+        return int(self.table.size)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.table.nbytes + sum(t.nbytes for t in self.thresholds))
+
+    def _compare_values(self, live: np.ndarray) -> np.ndarray:
+        """Map raw live-feature values into the space the trees compare in"""
+        values = (live - self.offset[self.live_columns]) / self.scale[self.live_columns]
+        if self.cast_float32:
+            values = values.astype(np.float32).astype(np.float64)
+        return values
+
+    def covers(self, X: np.ndarray) -> np.ndarray:
+        """Rows whose fixed features equal the defaults and whose live features lie in the domain"""
+        live = X[:, self.live_columns]
+        mask = np.all(X[:, self.fixed_columns] == self.fixed_values, axis=1)
+        mask &= np.all((live >= self.domain_low) & (live <= self.domain_high), axis=1)
+        return mask
+
+    def lookup(self, X: np.ndarray) -> np.ndarray:
+        """Forest output for rows already known to be covered"""
+        values = self._compare_values(X[:, self.live_columns])
+        cells = tuple(np.searchsorted(self.thresholds[k], values[:, k], side='left') for k in range(len(LIVE_FEATURES)))
+        return self.table[cells]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "cells": self.n_cells,
+            "shape": list(self.table.shape),
+            "bytes": self.nbytes,
+            "fingerprint": self.fingerprint,
+            "domain": {feature: [float(low), float(high)] for feature, low, high
+                       in zip(LIVE_FEATURES, self.domain_low, self.domain_high)}
+        }
+
+    def save(self, path: str) -> None:
+        metadata = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "features": self.features,
+            "cast_float32": self.cast_float32,
+            "fingerprint": self.fingerprint
+        }
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                table=self.table,
+                offset=self.offset,
+                scale=self.scale,
+                fixed_values=self.fixed_values,
+                domain_low=self.domain_low,
+                domain_high=self.domain_high,
+                metadata=np.frombuffer(json.dumps(metadata).encode('utf-8'), dtype=np.uint8),
+                **{f"thresholds_{k}": thresholds for k, thresholds in enumerate(self.thresholds)}
+            )
+
+    @classmethod
+    def load(cls, path: str) -> 'RegionIndex':
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(data['metadata'].tobytes().decode('utf-8'))
+            if metadata.get('format_version') != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported region index format: {metadata.get('format_version')}")
+            return cls(
+                features=metadata['features'],
+                thresholds=[data[f"thresholds_{k}"] for k in range(len(LIVE_FEATURES))],
+                table=data['table'],
+                offset=data['offset'],
+                scale=data['scale'],
+                cast_float32=metadata['cast_float32'],
+                fixed_values=data['fixed_values'],
+                domain_low=data['domain_low'],
+                domain_high=data['domain_high'],
+                fingerprint=metadata['fingerprint']
+            )
+
+
+def _specialized_leaves(tree: Tuple[np.ndarray, ...], live_position: Dict[int, int], fixed_compare: Dict[int, float]):
+    """
+    Walk one tree with the fixed features pinned, yielding (bounds, value) for every reachable leaf.
+    bounds is a list of (lower, upper) per live feature in comparison space: lower < v <= upper.
+    """
+    feature, threshold, left, right, value = tree
+    stack = [(0, [(-np.inf, np.inf)] * len(live_position))]
+    while stack:
+        node, bounds = stack.pop()
+        while feature[node] >= 0 and int(feature[node]) in fixed_compare:
+            f = int(feature[node])
+            node = left[node] if fixed_compare[f] <= threshold[node] else right[node]
+        if feature[node] < 0:
+            yield bounds, value[node]
+            continue
+        k = live_position[int(feature[node])]
+        lower, upper = bounds[k]
+        t = threshold[node]
+        if t >= upper:  # Every value on this path goes left
+            stack.append((left[node], bounds))
+        elif t <= lower:  # ... or right
+            stack.append((right[node], bounds))
+        else:
+            left_bounds = list(bounds)
+            left_bounds[k] = (lower, t)
+            right_bounds = list(bounds)
+            right_bounds[k] = (t, upper)
+            stack.append((left[node], left_bounds))
+            stack.append((right[node], right_bounds))
+
+
+def build_region_index(engine: ForestEngine, domain: Optional[Dict[str, Tuple[float, float]]] = None,
+                       max_cells: int = DEFAULT_MAX_CELLS) -> RegionIndex:
+    """
+    Build the table by adding every specialized leaf's value to the box of grid cells it covers.
+    Raises RegionIndexTooLarge when the grid would exceed max_cells.
+    """
+    missing = [feature for feature in LIVE_FEATURES if feature not in engine.features]
+    if missing:
+        raise ValueError(f"Model does not use live features {missing}")
+
+    offset, scale, cast_float32 = engine.comparison_transform()
+
+    def compare(column: int, raw: float) -> float:
+        value = (raw - offset[column]) / scale[column]
+        return float(np.float32(value)) if cast_float32 else float(value)
+
+    live_columns = [engine.features.index(feature) for feature in LIVE_FEATURES]
+    live_position = {column: k for k, column in enumerate(live_columns)}
+    fixed_columns = [j for j in range(len(engine.features)) if j not in live_position]
+    fixed_values = np.array([feature_default(engine.features[j]) for j in fixed_columns])
+    fixed_compare = {j: compare(j, raw) for j, raw in zip(fixed_columns, fixed_values)}
+
+    domain = domain or {}
+    domain_low = np.array([domain.get(feature, (-np.inf, np.inf))[0] for feature in LIVE_FEATURES], dtype=np.float64)
+    domain_high = np.array([domain.get(feature, (-np.inf, np.inf))[1] for feature in LIVE_FEATURES], dtype=np.float64)
+    compare_low = [compare(c, low) if np.isfinite(low) else -np.inf for c, low in zip(live_columns, domain_low)]
+    compare_high = [compare(c, high) if np.isfinite(high) else np.inf for c, high in zip(live_columns, domain_high)]
+
+    trees = list(engine.tree_structures())
+    leaves = [list(_specialized_leaves(tree, live_position, fixed_compare)) for tree in trees]
+
+    # Grid axes: thresholds reachable with the fixed features pinned, clipped to the domain
+    axes = [set() for _ in LIVE_FEATURES]
+    for tree_leaves in leaves:
+        for bounds, _ in tree_leaves:
+            for k, (lower, upper) in enumerate(bounds):
+                axes[k].update(t for t in (lower, upper) if np.isfinite(t) and compare_low[k] <= t < compare_high[k])
+    thresholds = [np.array(sorted(axis), dtype=np.float64) for axis in axes]
+
+    shape = tuple(len(t) + 1 for t in thresholds)
+    n_cells = int(np.prod(shape, dtype=np.float64))
+    if n_cells > max_cells:
+        raise RegionIndexTooLarge(
+            f"Region grid needs {n_cells:,} cells {list(shape)} (max {max_cells:,}); "
+            f"narrow the --domain or raise --max-cells")
+
+    table = np.zeros(shape, dtype=np.float64)
+    for tree_leaves in leaves:
+        for bounds, leaf_value in tree_leaves:
+            box = []
+            for k, (lower, upper) in enumerate(bounds):
+                if lower >= compare_high[k] or upper < compare_low[k]:
+                    break  # Unreachable from inside the domain
+                axis = thresholds[k]
+                lo = 0 if lower < compare_low[k] else int(np.searchsorted(axis, lower, side='right'))
+                hi = int(np.searchsorted(axis, upper, side='right')) + (1 if upper >= compare_high[k] else 0)
+                box.append(slice(lo, hi))
+            else:
+                table[tuple(box)] += leaf_value
+    table /= len(trees)
+
+    return RegionIndex(engine.features, thresholds, table, offset, scale, cast_float32, fixed_values,
+                       domain_low, domain_high, model_fingerprint(engine))
+
+
+def _probe_axis(index: RegionIndex, k: int) -> np.ndarray:
+    """One raw value inside each cell along live feature k"""
+    column = index.live_columns[k]
+    raw_thresholds = index.thresholds[k] * index.scale[column] + index.offset[column]
+    low, high = index.domain_low[k], index.domain_high[k]
+    if len(raw_thresholds) == 0:
+        return np.array([low if np.isfinite(low) else (high if np.isfinite(high) else 0.0)])
+    step = max(1.0, float(np.abs(raw_thresholds).max()) * 0.01)
+    first = low if np.isfinite(low) else raw_thresholds[0] - step
+    last = high if np.isfinite(high) else raw_thresholds[-1] + step
+    edges = np.concatenate([[first], raw_thresholds, [last]])
+    probes = (edges[:-1] + edges[1:]) / 2.0
+    return np.clip(probes, low, high)
+
+
+def verify_region_index(index: RegionIndex, engine: ForestEngine) -> Dict[str, Any]:
+    """
+    Exhaustive check: evaluate the real forest at one probe point per grid cell and compare
+    with the table lookup.
+    """
+    axes = [_probe_axis(index, k) for k in range(len(LIVE_FEATURES))]
+    shape = tuple(len(axis) for axis in axes)
+    total = int(np.prod(shape))
+    mismatches = 0
+    max_error = 0.0
+    visited = np.zeros(index.table.shape, dtype=bool)
+
+    base = np.array([feature_default(feature) for feature in engine.features], dtype=np.float64)
+    for start in range(0, total, VERIFY_CHUNK_ROWS):
+        flat = np.arange(start, min(start + VERIFY_CHUNK_ROWS, total))
+        coords = np.unravel_index(flat, shape)
+        X = np.tile(base, (len(flat), 1))
+        for k, column in enumerate(index.live_columns):
+            X[:, column] = axes[k][coords[k]]
+
+        expected = engine.forest_predict(X)
+        actual = index.lookup(X)
+        error = np.abs(expected - actual)
+        mismatches += int((error > VERIFY_TOLERANCE).sum())
+        max_error = max(max_error, float(error.max()))
+
+        values = index._compare_values(X[:, index.live_columns])
+        cells = tuple(np.searchsorted(index.thresholds[k], values[:, k], side='left') for k in range(len(LIVE_FEATURES)))
+        visited[cells] = True
+
+    return {
+        "probes": total,
+        "cells_covered": int(visited.sum()),
+        "cells_total": index.n_cells,
+        "mismatches": mismatches,
+        "max_abs_error": max_error,
+        "passed": mismatches == 0
+    }
+
+
+def load_region_index_for(engine: ForestEngine, path: Optional[str] = None) -> Optional[RegionIndex]:
+    """
+    Load the region index for the served model, or None when disabled, missing or built
+    for a different model.
+    """
+    path = path or os.environ.get(REGION_INDEX_ENV_VAR) or REGION_INDEX_FILENAME
+    if path.lower() == 'off' or not os.path.exists(path):
+        return None
+    try:
+        index = RegionIndex.load(path)
+    except Exception as e:
+        logger.warning(f"Failed to load region index from {path}: {e}")
+        return None
+    if index.fingerprint != model_fingerprint(engine) or index.features != engine.features:
+        logger.warning(f"Region index {path} was built for a different model; ignoring it")
+        return None
+    logger.info(f"Region index loaded from {path}: {index.n_cells:,} cells")
+    return index
+
+
+def parse_domain(values: Sequence[str]) -> Dict[str, Tuple[float, float]]:
+    """Parse feature=low:high arguments"""
+    domain = {}
+    for value in values:
+        feature, _, bounds = value.partition('=')
+        low, _, high = bounds.partition(':')
+        if feature not in LIVE_FEATURES:
+            raise ValueError(f"--domain feature must be one of {LIVE_FEATURES}, got '{feature}'")
+        domain[feature] = (float(low) if low else -np.inf, float(high) if high else np.inf)
+    return domain
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build and verify the live-feature region lookup index")
+    parser.add_argument('model', nargs='?', help="Model pickle or compact .npz (default: usual search paths)")
+    parser.add_argument('--output', default=REGION_INDEX_FILENAME)
+    parser.add_argument('--domain', action='append', default=[], metavar='FEATURE=LOW:HIGH',
+                        help="Restrict a live feature to a range; rows outside fall back to the forest")
+    parser.add_argument('--max-cells', type=int, default=DEFAULT_MAX_CELLS)
+    args = parser.parse_args(argv)
+
+    model_system, path = load_model_system([args.model] if args.model else None)
+    if model_system is None:
+        logger.error("No model found")
+        return 1
+    engine = ForestEngine(model_system)
+
+    try:
+        started = time.perf_counter()
+        index = build_region_index(engine, parse_domain(args.domain), args.max_cells)
+        build_seconds = time.perf_counter() - started
+    except ValueError as e:
+        logger.error(f"Cannot build region index: {e}")
+        return 1
+
+    verification = verify_region_index(index, engine)
+    report = {"model": path, "build_seconds": round(build_seconds, 3), **index.describe(),
+              "verification": verification}
+    print(json.dumps(report, indent=2))
+    if not verification["passed"]:
+        logger.error("Verification failed; index not written")
+        return 1
+
+    index.save(args.output)
+    logger.info(f"Region index written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
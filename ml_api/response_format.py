@@ -0,0 +1,176 @@
+"""
+Batch response shaping for the ProactED ML API
+Batch rows repeat the same model metadata (version, note, threshold, R², feature importance,
+timestamp) on every row. The compact format sends fields that are identical across the batch once
+in a shared block, fields that are identical per routed model once per route in a models block,
+and the rest as one array per row; a fields projection drops unrequested columns.
+JSON responses are compressed with zstd or gzip when the client negotiates it.
+"""
+
+import gzip
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+STANDARD = 'standard'
+COMPACT = 'compact'
+FORMATS = (STANDARD, COMPACT)
+
+# Per-row identity and scores always stay in the row arrays, even when the batch happens to agree on them
+ROW_FIELDS = ('success', 'equipment_id', 'failure_probability', 'risk_level', 'confidence_score', 'error')
+
+# Rows scored by the same model agree on its metadata; the compact format groups by this field
+ROUTE_FIELD = 'routed_model'
+
+# Responses smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+_MISSING = object()
+
+
+def parse_fields(value: Any) -> Optional[List[str]]:
+    """Field projection from a comma-separated string or a list; None when absent"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        raise ValueError("fields must be a comma-separated string or a list of names")
+    fields = [str(field).strip() for field in value if str(field).strip()]
+    return fields or None
+
+
+def parse_format(value: Any) -> str:
+    response_format = str(value or STANDARD).strip().lower()
+    if response_format not in FORMATS:
+        raise ValueError(f"Unknown response format {value!r}; expected one of {list(FORMATS)}")
+    return response_format
+
+
+def project(rows: Sequence[Dict[str, Any]], fields: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+    """Rows restricted to the requested fields, in the requested order"""
+    if fields is None:
+        return list(rows)
+    return [{field: row[field] for field in fields if field in row} for row in rows]
+
+
+def _same(value: Any, other: Any) -> bool:
+    return value is other or value == other
+
+
+def _route_values(field: str, succeeded: Sequence[Dict[str, Any]],
+                  failed: Sequence[Dict[str, Any]]) -> Optional[Dict[Any, Any]]:
+    """{route: value} when every successful row of each route carries field with its route's value, else None"""
+    values: Dict[Any, Any] = {}
+    for row in succeeded:
+        value = row.get(field, _MISSING)
+        route = row[ROUTE_FIELD]
+        if value is _MISSING or not _same(values.setdefault(route, value), value):
+            return None
+    for row in failed:
+        if field in row and not _same(values.get(row.get(ROUTE_FIELD), _MISSING), row[field]):
+            return None
+    return values
+
+
+def compact_rows(rows: Sequence[Dict[str, Any]], fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Split rows into {"shared": {...}, "models": {...}, "fields": [...], "rows": [[...], ...]}.
+    A field goes to shared when every successful row carries it with the same value and no failed
+    row carries a different one, so validation error rows (which carry only success, equipment_id
+    and error) do not break sharing; shared values apply to the rows without an error. When rows
+    are routed to several models (and routed_model is kept), a field that is the same within each
+    route goes to models[route] instead and applies to the successful rows naming that route.
+    Row arrays hold the remaining fields in order, with null where a row lacks one.
+    """
+    if fields is None:
+        names: Dict[str, None] = {}
+        for row in rows:
+            names.update(dict.fromkeys(row))
+        fields = list(names)
+
+    succeeded = [row for row in rows if row.get('success', True)]
+    failed = [row for row in rows if not row.get('success', True)]
+    shared = {}
+    row_fields = []
+    for field in fields:
+        first = succeeded[0].get(field, _MISSING) if succeeded else _MISSING
+        if (field not in ROW_FIELDS and first is not _MISSING
+                and all(field in row and _same(row[field], first) for row in succeeded)
+                and all(_same(row.get(field, first), first) for row in failed)):
+            shared[field] = first
+        else:
+            row_fields.append(field)
+
+    models: Dict[Any, Dict[str, Any]] = {}
+    if ROUTE_FIELD in row_fields and all(ROUTE_FIELD in row for row in succeeded):
+        for field in list(row_fields):
+            if field in ROW_FIELDS or field == ROUTE_FIELD:
+                continue
+            values = _route_values(field, succeeded, failed)
+            if values is not None:
+                for route, value in values.items():
+                    models.setdefault(route, {})[field] = value
+                row_fields.remove(field)
+
+    return {
+        "shared": shared,
+        "models": models,
+        "fields": row_fields,
+        "rows": [[row.get(field) for field in row_fields] for row in rows]
+    }
+
+
+def shape_rows(rows: Sequence[Dict[str, Any]], key: str, response_format: str = STANDARD,
+               fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Response fields for a list of rows: {key: rows} in the standard format, the compact blocks otherwise"""
+    if response_format == COMPACT:
+        return {"format": COMPACT, **compact_rows(rows, fields)}
+    return {key: project(rows, fields)}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Preferred content coding the client accepts: zstd (when installed), then gzip"""
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    if zstandard is not None and offered.get('zstd', 0) > 0:
+        return 'zstd'
+    if offered.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response, accept_encoding: str):
+    """Compress a finished JSON response in place when negotiated and worthwhile"""
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,296 @@
+"""
+Materialized fleet risk table for the ProactED ML API
+Holds the latest prediction for every known equipment in a local SQLite file, mirrored in an
+in-memory dict so single and multi-ID lookups never touch the database. Rows come from served
+predictions and from a scheduled sweep that re-scores the whole fleet in one vectorized pass.
+Served predictions update the dict at once; their SQLite writes are batched by a writer thread.
+"""
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from engines import MODEL_FEATURES
+
+logger = logging.getLogger(__name__)
+
+RISK_TABLE_PATH_ENV_VAR = 'ML_RISK_TABLE_PATH'
+DEFAULT_RISK_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'risk_table.sqlite')
+
+# Seconds between scheduled sweeps; 0 disables the scheduler
+RISK_SWEEP_ENV_VAR = 'ML_RISK_SWEEP_SECONDS'
+DEFAULT_SWEEP_SECONDS = 900
+
+# Seconds the writer thread waits after the first buffered write, so concurrent requests share one transaction
+FLUSH_DELAY_SECONDS = 0.5
+
+# Descriptive fields kept with each row (used for grouping, not by the model)
+LOCATION_FIELDS = ['building', 'room']
+DESCRIPTIVE_FIELDS = ['equipment_type'] + LOCATION_FIELDS
+
+# Record fields persisted as the equipment's latest known model input
+STORED_RECORD_FIELDS = MODEL_FEATURES + DESCRIPTIVE_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS risk (
+    equipment_id TEXT PRIMARY KEY,
+    failure_probability REAL NOT NULL,
+    risk_level TEXT NOT NULL,
+    confidence_score REAL,
+    model_version TEXT,
+    computed_at REAL NOT NULL,
+    equipment_type TEXT,
+    building TEXT,
+    room TEXT,
+    record TEXT NOT NULL
+)
+"""
+
+UPSERT = """
+INSERT INTO risk (equipment_id, failure_probability, risk_level, confidence_score, model_version,
+                  computed_at, equipment_type, building, room, record)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(equipment_id) DO UPDATE SET
+    failure_probability = excluded.failure_probability,
+    risk_level = excluded.risk_level,
+    confidence_score = excluded.confidence_score,
+    model_version = excluded.model_version,
+    computed_at = excluded.computed_at,
+    equipment_type = excluded.equipment_type,
+    building = excluded.building,
+    room = excluded.room,
+    record = excluded.record
+"""
+
+
+def stored_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of a parsed request record worth keeping for re-scoring"""
+    stored = {"equipment_id": str(record['equipment_id'])}
+    for field in STORED_RECORD_FIELDS:
+        if record.get(field) is not None:
+            stored[field] = record[field]
+    return stored
+
+
+class RiskTable:
+    """
+    Latest risk per equipment. Reads are served from `rows` (equipment_id -> response dict).
+    Writes update the dict immediately and queue their SQLite rows (the latest per equipment);
+    a daemon writer thread flushes the queue in one transaction, and sweeps flush it themselves.
+    """
+
+    def __init__(self, path: str = DEFAULT_RISK_TABLE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(SCHEMA)
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.last_sweep: Optional[Dict[str, Any]] = None
+        # Bumped on every write so derived views (fleet rollups) know when to rebuild
+        self.version = 0
+        self._load()
+        # SQLite rows not written yet; flushes are serialized so a later row never lands first
+        self._pending: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name='risk-table-writer', daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_environment(cls) -> 'RiskTable':
+        return cls(os.environ.get(RISK_TABLE_PATH_ENV_VAR, DEFAULT_RISK_TABLE_PATH))
+
+    def _load(self) -> None:
+        cursor = self._connection.execute(
+            "SELECT equipment_id, failure_probability, risk_level, confidence_score, model_version, computed_at, "
+            "equipment_type, building, room, record FROM risk")
+        for row in cursor:
+            self.rows[row[0]] = self._row(*row[:9])
+            self.records[row[0]] = json.loads(row[9])
+        if self.rows:
+            logger.info(f"Risk table loaded {len(self.rows)} equipment from {self.path}")
+
+    @staticmethod
+    def _row(equipment_id: str, probability: float, risk_level: str, confidence: Optional[float],
+             model_version: Optional[str], computed_at: float, equipment_type: Optional[str],
+             building: Optional[str], room: Optional[str]) -> Dict[str, Any]:
+        return {
+            "equipment_id": equipment_id,
+            "failure_probability": probability,
+            "risk_level": risk_level,
+            "confidence_score": confidence,
+            "model_version": model_version,
+            "computed_at": computed_at,
+            "equipment_type": equipment_type,
+            "building": building,
+            "room": room
+        }
+
+    def upsert(self, records: Sequence[Dict[str, Any]], predictions: Sequence[Dict[str, Any]],
+               computed_at: Optional[float] = None) -> int:
+        """
+        Store successful predictions with the records they were computed from. Lookups see them
+        at once; the SQLite write happens on the next flush.
+        """
+        computed_at = time.time() if computed_at is None else computed_at
+        parameters: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        rows = {}
+        stored = {}
+        for record, prediction in zip(records, predictions):
+            if not prediction.get("success", False):
+                continue
+            record = stored_record(record)
+            equipment_id = record["equipment_id"]
+            row = self._row(equipment_id, prediction["failure_probability"], prediction["risk_level"],
+                            prediction.get("confidence_score"), prediction.get("model_version"), computed_at,
+                            *(record.get(field) for field in DESCRIPTIVE_FIELDS))
+            rows[equipment_id] = row
+            stored[equipment_id] = record
+            parameters[equipment_id] = (row, record)
+
+        if not parameters:
+            return 0
+        with self._lock:
+            self.rows.update(rows)
+            self.records.update(stored)
+            self._pending.update(parameters)
+            self.version += 1
+        self._dirty.set()
+        return len(parameters)
+
+    def flush(self) -> int:
+        """Write the buffered rows to SQLite in one transaction; returns the number written"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                with self._connection:
+                    self._connection.executemany(UPSERT, [tuple(row.values()) + (json.dumps(record),)
+                                                          for row, record in pending.values()])
+            except Exception:
+                # Requeue unless a newer row for the same equipment arrived meanwhile
+                with self._lock:
+                    for equipment_id, entry in pending.items():
+                        self._pending.setdefault(equipment_id, entry)
+                raise
+            return len(pending)
+
+    def _write_loop(self) -> None:
+        while not self._closed.is_set():
+            self._dirty.wait()
+            self._closed.wait(FLUSH_DELAY_SECONDS)
+            self._dirty.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Risk table flush failed: {e}")
+
+    @property
+    def pending_writes(self) -> int:
+        return len(self._pending)
+
+    def close(self) -> None:
+        """Stop the writer thread and write what is still buffered"""
+        self._closed.set()
+        self._dirty.set()
+        self._writer.join()
+        self.flush()
+
+    def get(self, equipment_id: Any) -> Optional[Dict[str, Any]]:
+        return self.rows.get(str(equipment_id))
+
+    def get_many(self, equipment_ids: Sequence[Any]) -> List[Optional[Dict[str, Any]]]:
+        rows = self.rows
+        return [rows.get(str(equipment_id)) for equipment_id in equipment_ids]
+
+    def snapshot_rows(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """(version, rows) taken together, so a view built from the rows can be tagged with the version"""
+        with self._lock:
+            return self.version, list(self.rows.values())
+
+    def snapshot_records(self) -> List[Dict[str, Any]]:
+        """Copies of every stored record, e.g. to re-score the fleet"""
+        with self._lock:
+            return [dict(record) for record in self.records.values()]
+
+    def sweep(self, score: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+              prepare: Optional[Callable[[List[Dict[str, Any]]], Any]] = None) -> Dict[str, Any]:
+        """
+        Re-score every known equipment: prepare(records) may refresh inputs in place (e.g. sensor
+        means), then score(records) runs once for the fleet and the results are written back.
+        """
+        started = time.perf_counter()
+        computed_at = time.time()
+        records = self.snapshot_records()
+        if prepare is not None and records:
+            prepare(records)
+        predictions = score(records) if records else []
+        scored = time.perf_counter()
+        written = self.upsert(records, predictions, computed_at)
+        # The sweep runs off the request path, so it writes its rows (and any buffered ones) itself
+        self.flush()
+
+        self.last_sweep = {
+            "computed_at": datetime.datetime.fromtimestamp(computed_at, datetime.timezone.utc).isoformat(),
+            "equipment_count": len(records),
+            "rows_written": written,
+            "score_ms": round((scored - started) * 1000, 1),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        logger.info(f"Risk sweep: {written}/{len(records)} equipment in {self.last_sweep['total_ms']} ms")
+        return self.last_sweep
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "equipment_count": len(self.rows),
+            "pending_writes": self.pending_writes,
+            "last_sweep": self.last_sweep
+        }
+
+
+class SweepScheduler:
+    """Daemon thread running a sweep function at a fixed interval"""
+
+    def __init__(self, sweep: Callable[[], Any], interval_seconds: float):
+        self.sweep = sweep
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='risk-sweep', daemon=True)
+        self._thread.start()
+        logger.info(f"Risk sweep scheduled every {self.interval_seconds:.0f}s")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Scheduled risk sweep failed: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def format_row(row: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """JSON-ready copy of a table row with an ISO computed_at and its age in seconds"""
+    now = time.time() if now is None else now
+    formatted = dict(row)
+    formatted["computed_at"] = datetime.datetime.fromtimestamp(row["computed_at"], datetime.timezone.utc).isoformat()
+    formatted["age_seconds"] = round(now - row["computed_at"], 3)
+    return formatted
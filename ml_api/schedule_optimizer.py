@@ -0,0 +1,448 @@
+"""
+Fleet maintenance schedule optimizer for the ProactED ML API
+Assigns maintenance tasks to technicians on a slot grid so the highest-risk equipment is served first,
+respecting shift hours, technician skills and unavailability, and room blackout windows from the timetable.
+Tasks are dispatched from a priority queue (apparent tardiness cost), then improved by local search
+(pairwise swaps and earlier reinsertion) within a time budget.
+"""
+
+import datetime
+import heapq
+import math
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from engines import risk_levels
+
+DEFAULT_SLOT_MINUTES = 30
+DEFAULT_HORIZON_DAYS = 28
+DEFAULT_TASK_HOURS = 2.0
+DEFAULT_SHIFT = ('08:00', '17:00')
+DEFAULT_WORKING_DAYS = [0, 1, 2, 3, 4]
+DEFAULT_TIME_LIMIT_SECONDS = 3.0
+
+# Request bounds: the slot grid has horizon_days * 24 * 60 / slot_minutes slots per technician
+MAX_HORIZON_DAYS = 180
+MIN_SLOT_MINUTES = 15
+MAX_SLOT_MINUTES = 480
+MAX_TIME_LIMIT_SECONDS = 30.0
+
+# Objective: weight * (tardiness days + COMPLETION_WEIGHT * completion days); unscheduled tasks
+# cost as if finished UNSCHEDULED_DAYS_PAST_HORIZON days after the horizon
+COMPLETION_WEIGHT = 0.1
+UNSCHEDULED_DAYS_PAST_HORIZON = 30
+
+# Look-ahead parameter of the apparent tardiness cost rule (in mean task lengths)
+ATC_K = 2.0
+
+# Candidate partners examined per task during the swap phase
+SWAP_CANDIDATES = 64
+
+
+def parse_datetime(value: Any) -> datetime.datetime:
+    """Naive datetime from an ISO-8601 string or epoch seconds (aware values are converted to UTC)"""
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).replace(tzinfo=None)
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.datetime.fromisoformat(text)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_clock(value: str) -> float:
+    """Hours after midnight from 'HH:MM'"""
+    hours, _, minutes = str(value).partition(':')
+    return int(hours) + int(minutes or 0) / 60.0
+
+
+def recommended_due_days(probabilities: np.ndarray) -> np.ndarray:
+    """
+    Days until maintenance is due, mirroring EquipmentPredictionService.GetMaintenanceRecommendationAsync:
+    expected days to failure by probability band, minus a safety buffer.
+    """
+    p = np.asarray(probabilities, dtype=np.float64)
+    days_to_failure = np.select([p >= 0.8, p >= 0.6, p >= 0.4, p >= 0.2], [7, 30, 90, 180], 365).astype(np.float64)
+    buffer = np.where(p >= 0.6, np.minimum(days_to_failure - 5, days_to_failure * 0.8), days_to_failure * 0.5)
+    return np.maximum(1.0, days_to_failure - np.maximum(buffer, 1.0))
+
+
+class ScheduleProblem:
+    """Slot grid, availability masks and task arrays built from a request payload"""
+
+    def __init__(self, tasks: Sequence[Dict[str, Any]], technicians: Sequence[Dict[str, Any]],
+                 blackout_windows: Sequence[Dict[str, Any]] = (), start: Any = None,
+                 horizon_days: float = DEFAULT_HORIZON_DAYS, slot_minutes: int = DEFAULT_SLOT_MINUTES):
+        if not technicians:
+            raise ValueError("At least one technician is required")
+        if not 0 < horizon_days <= MAX_HORIZON_DAYS:
+            raise ValueError(f"horizon_days must be in (0, {MAX_HORIZON_DAYS}]")
+        if not MIN_SLOT_MINUTES <= slot_minutes <= MAX_SLOT_MINUTES:
+            raise ValueError(f"slot_minutes must be between {MIN_SLOT_MINUTES} and {MAX_SLOT_MINUTES}")
+
+        self.slot_minutes = int(slot_minutes)
+        origin = parse_datetime(start) if start is not None else datetime.datetime.now().replace(second=0, microsecond=0)
+        # Round up to the slot grid
+        offset = (origin.minute * 60 + origin.second) % (self.slot_minutes * 60)
+        self.origin = origin + datetime.timedelta(seconds=(self.slot_minutes * 60 - offset) % (self.slot_minutes * 60))
+        self.n_slots = int(horizon_days * 24 * 60 // self.slot_minutes)
+        self.slots_per_day = 24 * 60 / self.slot_minutes
+        slot_starts = np.datetime64(self.origin, 'm') + np.arange(self.n_slots) * self.slot_minutes
+        days = slot_starts.astype('datetime64[D]')
+        self._weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        self._hour = (slot_starts - days).astype(np.int64) / 60.0
+
+        self.technicians = [self._technician(technician, i) for i, technician in enumerate(technicians)]
+        self.free = np.stack([technician["available"] for technician in self.technicians])
+        self.blackouts = [self._window(window) for window in blackout_windows]
+        self.tasks = [self._task(task, i) for i, task in enumerate(tasks)]
+        self._blocked_cache: Dict[Tuple[Optional[str], Optional[str]], np.ndarray] = {}
+
+        self.weight = np.array([task["weight"] for task in self.tasks], dtype=np.float64)
+        self.length = np.array([task["slots"] for task in self.tasks], dtype=np.int64)
+        self.due = np.array([task["due_slot"] for task in self.tasks], dtype=np.float64)
+        self.release = np.array([task["release_slot"] for task in self.tasks], dtype=np.int64)
+
+    def slot_of(self, value: datetime.datetime, round_up: bool = False) -> int:
+        minutes = (value - self.origin).total_seconds() / 60.0 / self.slot_minutes
+        return int(math.ceil(minutes) if round_up else math.floor(minutes))
+
+    def time_of(self, slot: float) -> datetime.datetime:
+        return self.origin + datetime.timedelta(minutes=self.slot_minutes * slot)
+
+    def _interval_mask(self, start: Any, end: Any) -> np.ndarray:
+        mask = np.zeros(self.n_slots, dtype=bool)
+        low = max(self.slot_of(parse_datetime(start)), 0)
+        high = min(self.slot_of(parse_datetime(end), round_up=True), self.n_slots)
+        if high > low:
+            mask[low:high] = True
+        return mask
+
+    def _technician(self, technician: Dict[str, Any], index: int) -> Dict[str, Any]:
+        shift_start, shift_end = (parse_clock(value) for value in
+                                  (technician.get('shift_start', DEFAULT_SHIFT[0]),
+                                   technician.get('shift_end', DEFAULT_SHIFT[1])))
+        working_days = technician.get('working_days', DEFAULT_WORKING_DAYS)
+        available = (np.isin(self._weekday, working_days) & (self._hour >= shift_start)
+                     & (self._hour + self.slot_minutes / 60.0 <= shift_end))
+        for window in technician.get('unavailable', []):
+            available &= ~self._interval_mask(window['start'], window['end'])
+        return {
+            "technician_id": str(technician.get('technician_id', index)),
+            "skills": set(technician.get('skills', [])),
+            "available": available,
+            "shift_slots": int(round((shift_end - shift_start) * 60 / self.slot_minutes))
+        }
+
+    def _window(self, window: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "building": str(window['building']) if window.get('building') is not None else None,
+            "room": str(window['room']) if window.get('room') is not None else None,
+            "mask": self._interval_mask(window['start'], window['end'])
+        }
+
+    def _task(self, task: Dict[str, Any], index: int) -> Dict[str, Any]:
+        probability = float(task['failure_probability'])
+        hours = float(task.get('duration_hours', DEFAULT_TASK_HOURS))
+        if task.get('due_date') is not None:
+            due_slot = self.slot_of(parse_datetime(task['due_date']))
+        else:
+            due_slot = float(recommended_due_days([probability])[0] * self.slots_per_day)
+        release_slot = max(self.slot_of(parse_datetime(task['earliest_start']), round_up=True), 0) \
+            if task.get('earliest_start') is not None else 0
+        return {
+            "index": index,
+            "equipment_id": str(task['equipment_id']),
+            "failure_probability": probability,
+            "weight": probability * float(task.get('criticality', 1.0)),
+            "slots": max(1, int(math.ceil(hours * 60 / self.slot_minutes))),
+            "due_slot": due_slot,
+            "release_slot": release_slot,
+            "skill": task.get('required_skill'),
+            "building": str(task['building']) if task.get('building') is not None else None,
+            "room": str(task['room']) if task.get('room') is not None else None
+        }
+
+    def blocked(self, task: Dict[str, Any]) -> np.ndarray:
+        """Slots in which the task's room may not be worked on"""
+        key = (task["building"], task["room"])
+        if key not in self._blocked_cache:
+            mask = np.zeros(self.n_slots, dtype=bool)
+            for window in self.blackouts:
+                if window["building"] is not None and window["building"] != task["building"]:
+                    continue
+                if window["room"] is not None and window["room"] != task["room"]:
+                    continue
+                mask |= window["mask"]
+            self._blocked_cache[key] = mask
+        return self._blocked_cache[key]
+
+    def eligible(self, task: Dict[str, Any]) -> np.ndarray:
+        """Indices of technicians with the required skill"""
+        if not task["skill"]:
+            return np.arange(len(self.technicians))
+        return np.array([i for i, technician in enumerate(self.technicians) if task["skill"] in technician["skills"]],
+                        dtype=np.int64)
+
+
+class MaintenanceScheduler:
+    """Dispatch + local search over a ScheduleProblem; technician availability is the mutable `free` grid"""
+
+    def __init__(self, problem: ScheduleProblem):
+        self.problem = problem
+        self.free = problem.free.copy()
+        n = len(problem.tasks)
+        self.technician = np.full(n, -1, dtype=np.int64)
+        self.start = np.full(n, -1, dtype=np.int64)
+        self._eligible = [problem.eligible(task) for task in problem.tasks]
+        self.stats = {"swaps": 0, "reinsertions": 0, "passes": 0}
+
+    # Objective
+
+    def task_cost(self, task: int, start: int) -> float:
+        problem = self.problem
+        if start < 0:
+            completion = problem.n_slots + UNSCHEDULED_DAYS_PAST_HORIZON * problem.slots_per_day
+        else:
+            completion = start + problem.length[task]
+        tardiness = max(0.0, completion - problem.due[task])
+        return problem.weight[task] * (tardiness + COMPLETION_WEIGHT * completion) / problem.slots_per_day
+
+    def total_cost(self) -> float:
+        return sum(self.task_cost(task, int(self.start[task])) for task in range(len(self.problem.tasks)))
+
+    # Placement primitives
+
+    def earliest_slot(self, task: int, not_after: Optional[int] = None) -> Tuple[int, int]:
+        """(technician, start) of the earliest feasible placement, or (-1, -1)"""
+        problem = self.problem
+        eligible = self._eligible[task]
+        k = int(problem.length[task])
+        if len(eligible) == 0 or k > problem.n_slots:
+            return -1, -1
+        ok = self.free[eligible] & ~problem.blocked(problem.tasks[task])[None, :]
+        counts = np.zeros((len(eligible), problem.n_slots + 1), dtype=np.int32)
+        np.cumsum(ok, axis=1, out=counts[:, 1:])
+        window = (counts[:, k:] - counts[:, :-k]) == k
+        window[:, :problem.release[task]] = False
+        if not_after is not None:
+            window[:, not_after + 1:] = False
+        has = window.any(axis=1)
+        if not has.any():
+            return -1, -1
+        first = np.where(has, window.argmax(axis=1), np.iinfo(np.int64).max)
+        best = np.flatnonzero(first == first.min())
+        # Ties go to the least booked technician
+        booked = (problem.free[eligible[best]] & ~self.free[eligible[best]]).sum(axis=1)
+        choice = best[int(np.argmin(booked))]
+        return int(eligible[choice]), int(first[choice])
+
+    def fits(self, task: int, technician: int, start: int) -> bool:
+        problem = self.problem
+        k = int(problem.length[task])
+        if start < problem.release[task] or start + k > problem.n_slots:
+            return False
+        if technician not in self._eligible[task]:
+            return False
+        blocked = problem.blocked(problem.tasks[task])
+        return bool(self.free[technician, start:start + k].all() and not blocked[start:start + k].any())
+
+    def place(self, task: int, technician: int, start: int) -> None:
+        self.free[technician, start:start + self.problem.length[task]] = False
+        self.technician[task] = technician
+        self.start[task] = start
+
+    def release_task(self, task: int) -> Tuple[int, int]:
+        technician, start = int(self.technician[task]), int(self.start[task])
+        if start >= 0:
+            self.free[technician, start:start + self.problem.length[task]] = True
+            self.technician[task] = -1
+            self.start[task] = -1
+        return technician, start
+
+    # Construction
+
+    def dispatch(self) -> None:
+        """
+        Place tasks in apparent-tardiness-cost order, each at its earliest feasible slot.
+        The index (w / p) * exp(-slack / (K * mean p)) is compared in log space to avoid underflow.
+        """
+        problem = self.problem
+        mean_length = float(problem.length.mean()) if len(problem.length) else 1.0
+        slack = np.maximum(problem.due - problem.length - problem.release, 0.0)
+        with np.errstate(divide='ignore'):
+            index = np.log(problem.weight / problem.length) - slack / (ATC_K * mean_length)
+        queue = [(-float(index[task]), float(problem.due[task]), task) for task in range(len(problem.tasks))]
+        heapq.heapify(queue)
+        while queue:
+            _, _, task = heapq.heappop(queue)
+            technician, start = self.earliest_slot(task)
+            if start >= 0:
+                self.place(task, technician, start)
+
+    # Local search
+
+    def try_swap(self, a: int, b: int) -> bool:
+        """Exchange the placements of a and b when both fit and the objective improves"""
+        before = self.task_cost(a, int(self.start[a])) + self.task_cost(b, int(self.start[b]))
+        technician_a, start_a = self.release_task(a)
+        technician_b, start_b = self.release_task(b)
+        after = self.task_cost(a, start_b) + self.task_cost(b, start_a)
+        if after < before - 1e-12 and self.fits(a, technician_b, start_b):
+            self.place(a, technician_b, start_b)
+            if self.fits(b, technician_a, start_a):
+                self.place(b, technician_a, start_a)
+                return True
+            self.release_task(a)
+        self.place(a, technician_a, start_a)
+        self.place(b, technician_b, start_b)
+        return False
+
+    def try_reinsert(self, task: int) -> bool:
+        """Move a task to its earliest feasible slot when that finishes it sooner (or schedules it at all)"""
+        technician, start = self.release_task(task)
+        new_technician, new_start = self.earliest_slot(task, not_after=start - 1 if start >= 0 else None)
+        if new_start >= 0 and (start < 0 or new_start < start):
+            self.place(task, new_technician, new_start)
+            return True
+        if start >= 0:
+            self.place(task, technician, start)
+        return False
+
+    def improve(self, deadline: float) -> None:
+        problem = self.problem
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            self.stats["passes"] += 1
+            costs = np.array([self.task_cost(task, int(self.start[task])) for task in range(len(problem.tasks))])
+            order = np.argsort(-costs)
+
+            # Reinsertion first: fills gaps left by blackouts and by earlier moves
+            for task in order:
+                if time.perf_counter() >= deadline:
+                    return
+                if self.try_reinsert(int(task)):
+                    self.stats["reinsertions"] += 1
+                    improved = True
+
+            # Swap expensive tasks with lighter tasks scheduled before them
+            scheduled = np.flatnonzero(self.start >= 0)
+            by_start = scheduled[np.argsort(self.start[scheduled], kind='stable')]
+            for task in order:
+                task = int(task)
+                if time.perf_counter() >= deadline:
+                    return
+                if self.start[task] < 0 or costs[task] <= 0:
+                    continue
+                earlier = by_start[self.start[by_start] < self.start[task]]
+                lighter = earlier[problem.weight[earlier] < problem.weight[task]][:SWAP_CANDIDATES]
+                for partner in lighter:
+                    if self.try_swap(task, int(partner)):
+                        self.stats["swaps"] += 1
+                        improved = True
+                        break
+
+    def solve(self, time_limit: float = DEFAULT_TIME_LIMIT_SECONDS) -> Dict[str, Any]:
+        started = time.perf_counter()
+        self.dispatch()
+        dispatched = time.perf_counter()
+        initial_cost = self.total_cost()
+        self.improve(started + time_limit)
+        final_cost = self.total_cost()
+        return {
+            "initial_cost": round(float(initial_cost), 4),
+            "final_cost": round(float(final_cost), 4),
+            "dispatch_ms": round((dispatched - started) * 1000, 1),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            **self.stats
+        }
+
+    def result(self) -> Dict[str, Any]:
+        """JSON-ready schedule, unscheduled tasks and per-technician utilization"""
+        problem = self.problem
+        scheduled = np.flatnonzero(self.start >= 0)
+        scheduled = scheduled[np.lexsort((self.technician[scheduled], self.start[scheduled]))]
+        probabilities = np.array([task["failure_probability"] for task in problem.tasks])
+        levels = risk_levels(probabilities) if len(probabilities) else np.array([])
+
+        # Priority rank: 1 = most urgent by weight, then due date
+        rank = np.empty(len(problem.tasks), dtype=np.int64)
+        rank[np.lexsort((problem.due, -problem.weight))] = np.arange(1, len(problem.tasks) + 1)
+
+        schedule = []
+        for task in scheduled:
+            info = problem.tasks[task]
+            start, end = int(self.start[task]), int(self.start[task] + problem.length[task])
+            due = problem.time_of(problem.due[task])
+            schedule.append({
+                "equipment_id": info["equipment_id"],
+                "technician_id": problem.technicians[self.technician[task]]["technician_id"],
+                "start": problem.time_of(start).isoformat(),
+                "end": problem.time_of(end).isoformat(),
+                "due_date": due.isoformat(),
+                "tardy_hours": round(max(0.0, (problem.time_of(end) - due).total_seconds() / 3600.0), 2),
+                "failure_probability": info["failure_probability"],
+                "risk_level": str(levels[task]),
+                "priority_rank": int(rank[task]),
+                "building": info["building"],
+                "room": info["room"]
+            })
+
+        unscheduled = []
+        for task in np.flatnonzero(self.start < 0):
+            info = problem.tasks[task]
+            if len(self._eligible[task]) == 0:
+                reason = f"No technician with skill '{info['skill']}'"
+            elif problem.length[task] > max(technician["shift_slots"] for technician in problem.technicians):
+                reason = "Task is longer than any technician shift"
+            else:
+                reason = "No free slot within the horizon"
+            unscheduled.append({
+                "equipment_id": info["equipment_id"],
+                "failure_probability": info["failure_probability"],
+                "risk_level": str(levels[task]),
+                "priority_rank": int(rank[task]),
+                "reason": reason
+            })
+
+        capacity = problem.free.sum(axis=1)
+        booked = capacity - self.free.sum(axis=1)
+        utilization = {
+            technician["technician_id"]: {
+                "tasks": int((self.technician == i).sum()),
+                "booked_hours": round(float(booked[i]) * problem.slot_minutes / 60.0, 2),
+                "utilization": round(float(booked[i] / capacity[i]), 4) if capacity[i] else 0.0
+            }
+            for i, technician in enumerate(problem.technicians)
+        }
+        tardy = [entry for entry in schedule if entry["tardy_hours"] > 0]
+        return {
+            "plan_start": problem.origin.isoformat(),
+            "plan_end": problem.time_of(problem.n_slots).isoformat(),
+            "slot_minutes": problem.slot_minutes,
+            "task_count": len(problem.tasks),
+            "scheduled_count": len(schedule),
+            "unscheduled_count": len(unscheduled),
+            "tardy_count": len(tardy),
+            "schedule": schedule,
+            "unscheduled": unscheduled,
+            "technicians": utilization
+        }
+
+
+def optimize_schedule(tasks: Sequence[Dict[str, Any]], technicians: Sequence[Dict[str, Any]],
+                      blackout_windows: Sequence[Dict[str, Any]] = (), start: Any = None,
+                      horizon_days: float = DEFAULT_HORIZON_DAYS, slot_minutes: int = DEFAULT_SLOT_MINUTES,
+                      time_limit: float = DEFAULT_TIME_LIMIT_SECONDS) -> Dict[str, Any]:
+    """Build, solve and format a schedule in one call"""
+    if not 0 < time_limit <= MAX_TIME_LIMIT_SECONDS:
+        raise ValueError(f"time_limit_seconds must be in (0, {MAX_TIME_LIMIT_SECONDS:g}]")
+    problem = ScheduleProblem(tasks, technicians, blackout_windows, start, horizon_days, slot_minutes)
+    scheduler = MaintenanceScheduler(problem)
+    search = scheduler.solve(time_limit)
+    return {**scheduler.result(), "optimization": search}
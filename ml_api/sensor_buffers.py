@@ -0,0 +1,287 @@
+"""
+Per-equipment sensor ring buffers with incrementally maintained rolling features
+Readings are appended into fixed-size NumPy arrays (one row of slots per equipment), and running
+sums keep rolling mean, standard deviation and slope per hour up to date without rescanning the window.
+"""
+
+import datetime
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from engines import feature_default
+
+# Channels buffered per equipment; these are also model feature names
+SENSOR_CHANNELS = [
+    'operating_temperature',
+    'vibration_level',
+    'power_consumption',
+    'humidity_level',
+    'dust_accumulation'
+]
+
+# Channels every reading must carry; the others carry forward when omitted
+REQUIRED_SENSOR_CHANNELS = ['operating_temperature', 'vibration_level', 'power_consumption']
+
+DEFAULT_WINDOW = 60
+DEFAULT_CAPACITY = 1024
+
+
+def parse_timestamp(value: Any) -> float:
+    """Epoch seconds from an epoch number, an ISO-8601 string or None (now)"""
+    if value is None:
+        return datetime.datetime.now(datetime.timezone.utc).timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+class SlotIndex:
+    """Maps equipment IDs to dense array slots, growing capacity by doubling"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.slots: Dict[str, int] = {}
+        self.ids: List[str] = []
+
+    def get(self, equipment_ids: Sequence[Any]) -> np.ndarray:
+        """Slots for known IDs, -1 for unknown ones"""
+        return np.fromiter((self.slots.get(str(equipment_id), -1) for equipment_id in equipment_ids),
+                           dtype=np.int64, count=len(equipment_ids))
+
+    def assign(self, equipment_ids: Sequence[Any]) -> Tuple[np.ndarray, Optional[int]]:
+        """
+        Slots for the IDs, registering new ones.
+        Returns the slots and the new capacity if the arrays must grow, else None.
+        """
+        slots = np.empty(len(equipment_ids), dtype=np.int64)
+        for i, equipment_id in enumerate(equipment_ids):
+            key = str(equipment_id)
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = len(self.ids)
+                self.slots[key] = slot
+                self.ids.append(key)
+            slots[i] = slot
+
+        new_capacity = None
+        if len(self.ids) > self.capacity:
+            while self.capacity < len(self.ids):
+                self.capacity *= 2
+            new_capacity = self.capacity
+        return slots, new_capacity
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def grow_rows(array: np.ndarray, capacity: int, fill: float = 0.0) -> np.ndarray:
+    """Copy of array with its first axis extended to capacity"""
+    grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def occurrence_rank(slots: np.ndarray) -> np.ndarray:
+    """0 for the first occurrence of each slot in the batch, 1 for the second, ..."""
+    order = np.argsort(slots, kind='stable')
+    sorted_slots = slots[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(slots)]))
+    rank = np.empty(len(slots), dtype=np.int64)
+    rank[order] = np.arange(len(slots)) - group_start
+    return rank
+
+
+class SensorRingBuffers:
+    """
+    Fixed-size reading windows for every equipment.
+    Running sums (x, x², t, t², t·x) are updated on each append and eviction; every `window`
+    appends a slot's sums are recomputed from the buffer and its time origin rebased,
+    which bounds floating-point drift.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW, capacity: int = DEFAULT_CAPACITY,
+                 channels: Sequence[str] = SENSOR_CHANNELS):
+        self.window = window
+        self.channels = list(channels)
+        self.index = SlotIndex(capacity)
+        self._lock = threading.Lock()
+
+        n_channels = len(self.channels)
+        self.values = np.zeros((capacity, window, n_channels))
+        self.times = np.zeros((capacity, window))
+        self.head = np.zeros(capacity, dtype=np.int64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.since_refresh = np.zeros(capacity, dtype=np.int64)
+        self.origin = np.zeros(capacity)
+        self.last_values = np.zeros((capacity, n_channels))
+        self.sum_x = np.zeros((capacity, n_channels))
+        self.sum_xx = np.zeros((capacity, n_channels))
+        self.sum_tx = np.zeros((capacity, n_channels))
+        self.sum_t = np.zeros(capacity)
+        self.sum_tt = np.zeros(capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (
+            self.values, self.times, self.head, self.count, self.since_refresh, self.origin,
+            self.last_values, self.sum_x, self.sum_xx, self.sum_tx, self.sum_t, self.sum_tt))
+
+    def _grow(self, capacity: int) -> None:
+        for name in ('values', 'times', 'head', 'count', 'since_refresh', 'origin', 'last_values',
+                     'sum_x', 'sum_xx', 'sum_tx', 'sum_t', 'sum_tt'):
+            setattr(self, name, grow_rows(getattr(self, name), capacity))
+
+    def readings_matrix(self, readings: Sequence[Dict[str, Any]]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Parse raw reading dicts into IDs, epoch timestamps and an (n, channels) matrix.
+        Optional channels that are missing are NaN (carried forward on append).
+        """
+        equipment_ids = [str(reading['equipment_id']) for reading in readings]
+        timestamps = np.fromiter((parse_timestamp(reading.get('timestamp')) for reading in readings),
+                                 dtype=np.float64, count=len(readings))
+        values = np.empty((len(readings), len(self.channels)))
+        for j, channel in enumerate(self.channels):
+            required = channel in REQUIRED_SENSOR_CHANNELS
+            column = ((reading[channel] if required else reading.get(channel)) for reading in readings)
+            values[:, j] = np.fromiter((np.nan if value is None else float(value) for value in column),
+                                       dtype=np.float64, count=len(readings))
+        return equipment_ids, timestamps, values
+
+    def append(self, equipment_ids: Sequence[Any], timestamps: np.ndarray, values: np.ndarray) -> int:
+        """
+        Append readings (in order) for any mix of equipment.
+        Readings for the same equipment are applied in rounds so each round is one vectorized update.
+        """
+        if len(equipment_ids) == 0:
+            return 0
+        with self._lock:
+            slots, new_capacity = self.index.assign(equipment_ids)
+            if new_capacity is not None:
+                self._grow(new_capacity)
+
+            rank = occurrence_rank(slots)
+            for round_number in range(int(rank.max()) + 1):
+                selected = np.flatnonzero(rank == round_number)
+                self._append_round(slots[selected], timestamps[selected], values[selected])
+        return len(equipment_ids)
+
+    def _append_round(self, slots: np.ndarray, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """One reading per slot; slots are unique"""
+        new = self.count[slots] == 0
+        self.origin[slots[new]] = timestamps[new]
+
+        # Missing optional channels carry the last value forward (or the feature default)
+        defaults = np.array([feature_default(channel) for channel in self.channels])
+        previous = np.where(new[:, None], defaults, self.last_values[slots])
+        values = np.where(np.isnan(values), previous, values)
+
+        position = self.head[slots]
+        full = self.count[slots] == self.window
+        old_t = (self.times[slots, position] - self.origin[slots]) / 3600.0
+        old_x = self.values[slots, position]
+        weight = full.astype(np.float64)
+
+        t = (timestamps - self.origin[slots]) / 3600.0
+        self.sum_x[slots] += values - weight[:, None] * old_x
+        self.sum_xx[slots] += values * values - weight[:, None] * old_x * old_x
+        self.sum_tx[slots] += t[:, None] * values - (weight * old_t)[:, None] * old_x
+        self.sum_t[slots] += t - weight * old_t
+        self.sum_tt[slots] += t * t - weight * old_t * old_t
+
+        self.values[slots, position] = values
+        self.times[slots, position] = timestamps
+        self.last_values[slots] = values
+        self.head[slots] = (position + 1) % self.window
+        self.count[slots] = np.minimum(self.count[slots] + 1, self.window)
+        self.since_refresh[slots] += 1
+
+        stale = slots[self.since_refresh[slots] >= self.window]
+        if len(stale):
+            self._refresh(stale)
+
+    def _refresh(self, slots: np.ndarray) -> None:
+        """Recompute the running sums of the given slots exactly, rebasing time at the newest reading"""
+        count = self.count[slots]
+        valid = np.arange(self.window)[None, :] < count[:, None]
+        times = self.times[slots]
+        newest = np.where(valid, times, -np.inf).max(axis=1)
+        self.origin[slots] = newest
+
+        t = np.where(valid, (times - newest[:, None]) / 3600.0, 0.0)
+        x = np.where(valid[:, :, None], self.values[slots], 0.0)
+        self.sum_x[slots] = x.sum(axis=1)
+        self.sum_xx[slots] = (x * x).sum(axis=1)
+        self.sum_tx[slots] = (t[:, :, None] * x).sum(axis=1)
+        self.sum_t[slots] = t.sum(axis=1)
+        self.sum_tt[slots] = (t * t).sum(axis=1)
+        self.since_refresh[slots] = 0
+
+    def rolling_features(self, equipment_ids: Sequence[Any]) -> Dict[str, np.ndarray]:
+        """
+        Rolling statistics for each ID (NaN rows for IDs without readings):
+        mean/std/slope arrays of shape (n, channels), plus reading counts and last timestamps.
+        """
+        with self._lock:
+            slots = self.index.get(equipment_ids)
+            known = slots >= 0
+            safe = np.where(known, slots, 0)
+            n = np.where(known, self.count[safe], 0).astype(np.float64)
+            sum_x, sum_xx, sum_tx = self.sum_x[safe], self.sum_xx[safe], self.sum_tx[safe]
+            sum_t, sum_tt = self.sum_t[safe], self.sum_tt[safe]
+            last_time = np.where(n > 0, self.times[safe, (self.head[safe] - 1) % self.window], np.nan)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = sum_x / n[:, None]
+            std = np.sqrt(np.maximum(sum_xx / n[:, None] - mean * mean, 0.0))
+            denominator = n * sum_tt - sum_t * sum_t
+            slope = (n[:, None] * sum_tx - sum_t[:, None] * sum_x) / denominator[:, None]
+        slope = np.where((denominator[:, None] > 1e-12) & (n[:, None] > 1), slope, 0.0)
+        empty = n == 0
+        mean[empty] = std[empty] = slope[empty] = np.nan
+        return {
+            "count": n.astype(np.int64),
+            "last_timestamp": last_time,
+            "mean": mean,
+            "std": std,
+            "slope_per_hour": slope
+        }
+
+    def feature_dicts(self, equipment_ids: Sequence[Any]) -> List[Optional[Dict[str, Any]]]:
+        """JSON-ready rolling features per ID, None for IDs without readings"""
+        features = self.rolling_features(equipment_ids)
+        results = []
+        for i in range(len(equipment_ids)):
+            if features["count"][i] == 0:
+                results.append(None)
+                continue
+            row = {
+                "readings": int(features["count"][i]),
+                "last_reading": datetime.datetime.fromtimestamp(
+                    features["last_timestamp"][i], datetime.timezone.utc).isoformat()
+            }
+            for j, channel in enumerate(self.channels):
+                row[channel] = {
+                    "mean": round(float(features["mean"][i, j]), 4),
+                    "std": round(float(features["std"][i, j]), 4),
+                    "slope_per_hour": round(float(features["slope_per_hour"][i, j]), 4)
+                }
+            results.append(row)
+        return results
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "equipment_count": len(self.index),
+            "capacity": self.index.capacity,
+            "window": self.window,
+            "channels": self.channels,
+            "bytes": self.nbytes
+        }
@@ -0,0 +1,252 @@
+"""
+Append-optimized, memory-mapped columnar store for equipment sensor history
+Layout: <root>/<equipment>/<YYYY-MM>/<column>.f8, one raw little-endian float64 file per column.
+Appends only write to the end of the files; reads memory-map them, so range scans, downsampling
+and fleet-wide streams never load more than the requested slices into RAM.
+"""
+
+import datetime
+import os
+import re
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from sensor_buffers import SENSOR_CHANNELS
+
+STORE_COLUMNS = ['timestamp'] + SENSOR_CHANNELS
+
+COLUMN_DTYPE = np.dtype('<f8')
+
+# Marker file written when a partition received out-of-order timestamps
+UNSORTED_MARKER = '_unsorted'
+
+DEFAULT_CHUNK_ROWS = 65536
+
+_SAFE_KEY = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9_.-]*')
+
+
+def equipment_key(equipment_id: Any) -> str:
+    """Directory name for an equipment ID (hex-escaped with a '%' prefix when not filename-safe)"""
+    text = str(equipment_id)
+    if _SAFE_KEY.fullmatch(text):
+        return text
+    return '%' + text.encode('utf-8').hex()
+
+
+def equipment_id_from_key(key: str) -> str:
+    if key.startswith('%'):
+        return bytes.fromhex(key[1:]).decode('utf-8')
+    return key
+
+
+def partition_bounds(name: str) -> Tuple[float, float]:
+    """[start, end) epoch seconds of a YYYY-MM partition"""
+    start = datetime.datetime.strptime(name, '%Y-%m').replace(tzinfo=datetime.timezone.utc)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start.timestamp(), end.timestamp()
+
+
+class SensorHistoryStore:
+    """Columnar sensor history partitioned by equipment and month"""
+
+    def __init__(self, root: str, columns: Sequence[str] = STORE_COLUMNS):
+        self.root = root
+        self.columns = list(columns)
+        self._lock = threading.Lock()
+        # Last timestamp written per partition directory, to detect out-of-order appends
+        self._last_timestamp: Dict[str, float] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _column_path(self, directory: str, column: str) -> str:
+        return os.path.join(directory, f"{column}.f8")
+
+    def _partition_rows(self, directory: str) -> int:
+        """Rows fully written to every column (guards against a torn append)"""
+        sizes = []
+        for column in self.columns:
+            path = self._column_path(directory, column)
+            sizes.append(os.path.getsize(path) if os.path.exists(path) else 0)
+        return min(sizes) // COLUMN_DTYPE.itemsize
+
+    def _last_written(self, directory: str) -> float:
+        if directory not in self._last_timestamp:
+            rows = self._partition_rows(directory)
+            last = -np.inf
+            if rows:
+                timestamps = np.memmap(self._column_path(directory, 'timestamp'), dtype=COLUMN_DTYPE, mode='r',
+                                       shape=(rows,))
+                last = float(timestamps[-1])
+                del timestamps
+            self._last_timestamp[directory] = last
+        return self._last_timestamp[directory]
+
+    def append(self, equipment_ids: Sequence[Any], timestamps: np.ndarray, values: np.ndarray) -> int:
+        """
+        Append readings; values is (n, len(columns) - 1) in SENSOR_CHANNELS order (NaN for missing).
+        Rows are grouped per partition and sorted by time before writing.
+        """
+        if len(equipment_ids) == 0:
+            return 0
+        unique_ids, id_codes = np.unique(np.asarray(equipment_ids, dtype=str), return_inverse=True)
+        month_codes = np.asarray(timestamps, dtype=np.float64).astype('datetime64[s]').astype('datetime64[M]')
+        unique_months, month_codes = np.unique(month_codes, return_inverse=True)
+        table = np.column_stack([timestamps, values]).astype(COLUMN_DTYPE)
+
+        # One group per (equipment, month) pair
+        group_codes = id_codes.reshape(-1) * len(unique_months) + month_codes.reshape(-1)
+        order = np.argsort(group_codes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(group_codes[order])) + 1
+
+        with self._lock:
+            for rows in np.split(order, boundaries):
+                key = equipment_key(unique_ids[id_codes[rows[0]]])
+                month = str(unique_months[month_codes[rows[0]]])
+                block = table[rows]
+                block = block[np.argsort(block[:, 0], kind='stable')]
+                directory = os.path.join(self.root, key, month)
+                os.makedirs(directory, exist_ok=True)
+
+                if block[0, 0] < self._last_written(directory):
+                    open(os.path.join(directory, UNSORTED_MARKER), 'a').close()
+                for j, column in enumerate(self.columns):
+                    with open(self._column_path(directory, column), 'ab') as f:
+                        f.write(np.ascontiguousarray(block[:, j]).tobytes())
+                self._last_timestamp[directory] = max(self._last_written(directory), float(block[-1, 0]))
+        return len(equipment_ids)
+
+    def equipment_ids(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(equipment_id_from_key(name) for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)))
+
+    def partitions(self, equipment_id: Any, start: Optional[float] = None, end: Optional[float] = None) -> List[str]:
+        """Partition directories overlapping [start, end), in time order"""
+        base = os.path.join(self.root, equipment_key(equipment_id))
+        if not os.path.isdir(base):
+            return []
+        selected = []
+        for name in sorted(os.listdir(base)):
+            low, high = partition_bounds(name)
+            if (start is None or high > start) and (end is None or low < end):
+                selected.append(os.path.join(base, name))
+        return selected
+
+    def _open_partition(self, directory: str, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Memory-mapped columns of one partition (sorted copies if it holds out-of-order rows)"""
+        rows = self._partition_rows(directory)
+        if rows == 0:
+            return {column: np.empty(0, dtype=COLUMN_DTYPE) for column in columns}
+        mapped = {column: np.memmap(self._column_path(directory, column), dtype=COLUMN_DTYPE, mode='r',
+                                    shape=(rows,))
+                  for column in set(columns) | {'timestamp'}}
+        if os.path.exists(os.path.join(directory, UNSORTED_MARKER)):
+            order = np.argsort(mapped['timestamp'], kind='stable')
+            mapped = {column: np.asarray(array)[order] for column, array in mapped.items()}
+        return mapped
+
+    def iter_chunks(self, equipment_id: Any, start: Optional[float] = None, end: Optional[float] = None,
+                    columns: Optional[Sequence[str]] = None,
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Stream rows with start <= timestamp < end as dicts of column slices (views into the maps).
+        Only the located range is touched, found by binary search on the timestamp column.
+        """
+        columns = list(columns or self.columns)
+        for directory in self.partitions(equipment_id, start, end):
+            mapped = self._open_partition(directory, columns)
+            timestamps = mapped.get('timestamp')
+            if timestamps is None or len(timestamps) == 0:
+                continue
+            low = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+            high = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='left'))
+            for chunk_start in range(low, high, chunk_rows):
+                chunk_end = min(chunk_start + chunk_rows, high)
+                yield {column: mapped[column][chunk_start:chunk_end] for column in columns}
+
+    def scan(self, equipment_id: Any, start: Optional[float] = None, end: Optional[float] = None,
+             columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Materialize a time range as in-memory arrays"""
+        columns = list(columns or self.columns)
+        chunks = list(self.iter_chunks(equipment_id, start, end, columns))
+        if not chunks:
+            return {column: np.empty(0, dtype=COLUMN_DTYPE) for column in columns}
+        return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in columns}
+
+    def downsample(self, equipment_id: Any, interval_seconds: float, start: Optional[float] = None,
+                   end: Optional[float] = None, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Per-bucket means of each column over fixed time buckets, computed while streaming.
+        Returns bucket start timestamps, row counts per bucket and one mean array per column.
+        NaN values (missing optional channels) are excluded from their column's mean.
+        """
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds must be positive")
+        value_columns = [column for column in (columns or self.columns) if column != 'timestamp']
+        sums: Dict[int, np.ndarray] = {}
+        counts: Dict[int, np.ndarray] = {}
+        rows: Dict[int, int] = {}
+
+        for chunk in self.iter_chunks(equipment_id, start, end, ['timestamp'] + value_columns):
+            bucket = np.floor(chunk['timestamp'] / interval_seconds).astype(np.int64)
+            unique, inverse = np.unique(bucket, return_inverse=True)
+            row_counts = np.bincount(inverse, minlength=len(unique))
+            stacked = np.column_stack([np.asarray(chunk[column]) for column in value_columns]) \
+                if value_columns else np.empty((len(bucket), 0))
+            present = ~np.isnan(stacked)
+            chunk_sums = np.column_stack([
+                np.bincount(inverse, weights=np.where(present[:, j], stacked[:, j], 0.0), minlength=len(unique))
+                for j in range(len(value_columns))]) if value_columns else np.empty((len(unique), 0))
+            chunk_counts = np.column_stack([
+                np.bincount(inverse, weights=present[:, j], minlength=len(unique))
+                for j in range(len(value_columns))]) if value_columns else np.empty((len(unique), 0))
+            for i, key in enumerate(unique.tolist()):
+                if key in sums:
+                    sums[key] += chunk_sums[i]
+                    counts[key] += chunk_counts[i]
+                    rows[key] += int(row_counts[i])
+                else:
+                    sums[key] = chunk_sums[i].copy()
+                    counts[key] = chunk_counts[i].copy()
+                    rows[key] = int(row_counts[i])
+
+        keys = sorted(sums)
+        result = {
+            "bucket_start": np.array(keys, dtype=np.float64) * interval_seconds,
+            "count": np.array([rows[key] for key in keys], dtype=np.int64)
+        }
+        if keys:
+            total = np.vstack([sums[key] for key in keys])
+            present = np.vstack([counts[key] for key in keys])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = total / present
+        else:
+            means = np.empty((0, len(value_columns)))
+        for j, column in enumerate(value_columns):
+            result[column] = means[:, j]
+        return result
+
+    def iter_fleet(self, start: Optional[float] = None, end: Optional[float] = None,
+                   columns: Optional[Sequence[str]] = None,
+                   chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Tuple[str, Dict[str, np.ndarray]]]:
+        """Stream (equipment_id, chunk) pairs for every equipment, e.g. for retraining or drift analysis"""
+        for equipment_id in self.equipment_ids():
+            for chunk in self.iter_chunks(equipment_id, start, end, columns, chunk_rows):
+                yield equipment_id, chunk
+
+    def describe(self) -> Dict[str, Any]:
+        total_bytes = 0
+        partitions = 0
+        for directory, _, files in os.walk(self.root):
+            column_files = [name for name in files if name.endswith('.f8')]
+            if column_files:
+                partitions += 1
+                total_bytes += sum(os.path.getsize(os.path.join(directory, name)) for name in column_files)
+        return {
+            "root": self.root,
+            "columns": self.columns,
+            "partitions": partitions,
+            "bytes_on_disk": total_bytes
+        }
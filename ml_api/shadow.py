@@ -0,0 +1,222 @@
+"""
+Shadow evaluation of a candidate model for the ProactED ML API
+A candidate engine is loaded next to the production one. A sampled share of live prediction
+requests is copied onto a bounded queue, and a background thread scores them with the candidate,
+keeping running statistics of the probability deltas, risk level changes and latency of both
+models. Production requests only pay for the sampling decision and a non-blocking enqueue; when
+the queue is full the sample is dropped rather than slowing the request.
+"""
+
+import logging
+import math
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional, Sequence
+
+import numpy as np
+
+from engines import ForestEngine, PredictorEngine, create_engine, load_model_file
+from model_router import GLOBAL_ROUTE
+
+logger = logging.getLogger(__name__)
+
+SHADOW_MODEL_ENV_VAR = 'ML_SHADOW_MODEL_PATH'
+SHADOW_SAMPLE_RATE_ENV_VAR = 'ML_SHADOW_SAMPLE_RATE'
+SHADOW_MODEL_DIR_ENV_VAR = 'ML_SHADOW_MODEL_DIR'
+
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Sampled requests waiting for the shadow worker; beyond this they are dropped
+QUEUE_SIZE = 256
+
+# Recent batches kept for latency and absolute-delta percentiles
+STATS_WINDOW = 1024
+
+
+class RunningStats:
+    """Count, mean and variance of a stream of values (Welford's algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, values: np.ndarray) -> None:
+        """Merge a batch of values (Chan et al. parallel update)"""
+        n = len(values)
+        if n == 0:
+            return
+        batch_mean = float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += batch_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+def percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(float(np.percentile(np.fromiter(values, dtype=float), q)), 4)
+
+
+class ShadowEvaluator:
+    """Scores sampled production traffic with a candidate engine on a background thread"""
+
+    def __init__(self, engine: PredictorEngine, model_system: Any = None, model_path: Optional[str] = None,
+                 sample_rate: float = DEFAULT_SAMPLE_RATE):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.engine = engine
+        self.model_system = model_system
+        self.model_path = model_path
+        self.sample_rate = float(sample_rate)
+        self.loaded_at = time.time()
+        self._queue: 'queue.Queue[Optional[Dict[str, Any]]]' = queue.Queue(maxsize=QUEUE_SIZE)
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        self.delta = RunningStats()
+        self.abs_delta = RunningStats()
+        self.max_abs_delta = 0.0
+        self.transitions = Counter()
+        self._recent_abs_delta: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self._primary_ms_per_row: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self._candidate_ms_per_row: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self._thread = threading.Thread(target=self._run, name='shadow-evaluator', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_path(cls, path: str, sample_rate: float = DEFAULT_SAMPLE_RATE) -> 'ShadowEvaluator':
+        """Load a candidate model file (pickle or compact .npz) as a forest engine"""
+        model_system = load_model_file(path)
+        engine = create_engine(ForestEngine.name, model_system)
+        logger.info(f"Shadow model loaded from {path} ({engine.model_version}), sampling {sample_rate:.0%}")
+        return cls(engine, model_system, path, sample_rate)
+
+    @classmethod
+    def from_environment(cls) -> Optional['ShadowEvaluator']:
+        path = os.environ.get(SHADOW_MODEL_ENV_VAR)
+        if not path:
+            return None
+        return cls.from_path(path, float(os.environ.get(SHADOW_SAMPLE_RATE_ENV_VAR, DEFAULT_SAMPLE_RATE)))
+
+    def offer(self, records: Sequence[Dict[str, Any]], predictions: Sequence[Dict[str, Any]],
+              primary_ms: float) -> bool:
+        """
+        Copy a scored request to the shadow queue when it is sampled; never blocks.
+        Only rows the production global model answered are compared, since type-routed rows would
+        keep their type model after a promotion.
+        """
+        self.counts["requests_seen"] += 1
+        if not records or self._random.random() >= self.sample_rate:
+            return False
+        rows = [(dict(record), prediction["failure_probability"], prediction.get("risk_level"))
+                for record, prediction in zip(records, predictions)
+                if prediction.get("success", True) and prediction.get("routed_model", GLOBAL_ROUTE) == GLOBAL_ROUTE]
+        if not rows:
+            return False
+        try:
+            self._queue.put_nowait({"rows": rows, "primary_ms_per_row": primary_ms / len(records)})
+        except queue.Full:
+            self.counts["requests_dropped"] += 1
+            return False
+        self.counts["requests_sampled"] += 1
+        return True
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._evaluate(item)
+            except Exception as e:
+                self.counts["requests_failed"] += 1
+                logger.warning(f"Shadow scoring failed: {e}")
+
+    def _evaluate(self, item: Dict[str, Any]) -> None:
+        records = [row[0] for row in item["rows"]]
+        started = time.perf_counter()
+        candidate = self.engine.predict_records(records)
+        candidate_ms = (time.perf_counter() - started) * 1000.0
+
+        primary = np.fromiter((row[1] for row in item["rows"]), dtype=float, count=len(records))
+        scored = np.fromiter((prediction["failure_probability"] for prediction in candidate), dtype=float,
+                             count=len(candidate))
+        delta = scored - primary
+        abs_delta = np.abs(delta)
+        with self._lock:
+            self.counts["requests_scored"] += 1
+            self.counts["rows_scored"] += len(records)
+            self.delta.update(delta)
+            self.abs_delta.update(abs_delta)
+            self.max_abs_delta = max(self.max_abs_delta, float(abs_delta.max()))
+            self._recent_abs_delta.extend(abs_delta.tolist())
+            self._primary_ms_per_row.append(item["primary_ms_per_row"])
+            self._candidate_ms_per_row.append(candidate_ms / len(records))
+            for row, prediction in zip(item["rows"], candidate):
+                self.transitions[(row[2], prediction["risk_level"])] += 1
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            agreeing = sum(count for (primary, candidate), count in self.transitions.items() if primary == candidate)
+            compared = sum(self.transitions.values())
+            primary_ms = list(self._primary_ms_per_row)
+            candidate_ms = list(self._candidate_ms_per_row)
+            return {
+                "model_path": self.model_path,
+                "model_version": self.engine.model_version,
+                "loaded_at": self.loaded_at,
+                "sample_rate": self.sample_rate,
+                "queued": self._queue.qsize(),
+                "counts": {
+                    "requests_seen": self.counts["requests_seen"],
+                    "requests_sampled": self.counts["requests_sampled"],
+                    "requests_dropped": self.counts["requests_dropped"],
+                    "requests_failed": self.counts["requests_failed"],
+                    "requests_scored": self.counts["requests_scored"],
+                    "rows_scored": self.counts["rows_scored"]
+                },
+                "probability_delta": {
+                    "mean": round(self.delta.mean, 4),
+                    "std": round(self.delta.std, 4),
+                    "mean_abs": round(self.abs_delta.mean, 4),
+                    "p95_abs": percentile(self._recent_abs_delta, 95),
+                    "max_abs": round(self.max_abs_delta, 4)
+                },
+                "risk_level_agreement": round(agreeing / compared, 4) if compared else None,
+                "risk_level_changes": {f"{primary}->{candidate}": count
+                                       for (primary, candidate), count in sorted(self.transitions.items())
+                                       if primary != candidate},
+                "latency_ms_per_row": {
+                    "primary_p50": percentile(primary_ms, 50),
+                    "primary_p95": percentile(primary_ms, 95),
+                    "candidate_p50": percentile(candidate_ms, 50),
+                    "candidate_p95": percentile(candidate_ms, 95)
+                }
+            }
+
+    def stop(self) -> None:
+        """Stop the worker after the samples already queued"""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+def resolve_model_path(name: str, model_dir: Optional[str] = None) -> str:
+    """Candidate model file by name; only files inside the shadow model directory are accepted"""
+    model_dir = model_dir or os.environ.get(SHADOW_MODEL_DIR_ENV_VAR, DEFAULT_MODEL_DIR)
+    path = os.path.join(model_dir, os.path.basename(str(name)))
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Model file not found: {os.path.basename(path)}")
+    return path
@@ -7,9 +7,86 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 import json
 
+from engines import build_feature_matrix, load_engine
+
 app = Flask(__name__)
 CORS(app)
 
+# Shared predictor engine (heuristic unless ML_ENGINE says otherwise)
+ENGINE = load_engine(default='heuristic')
+
+RISK_COLORS = {
+    "Critical": "danger",
+    "High": "warning",
+    "Medium": "info",
+    "Low": "success"
+}
+
+def parse_equipment(equipment):
+    """Model record for one request payload, with defaults for missing fields (raises on bad values)"""
+    return {
+        'equipment_id': equipment.get('equipment_id', 'unknown'),
+        'age_months': float(equipment.get('age_months', 24)),
+        'operating_temperature': float(equipment.get('operating_temperature', 65)),
+        'vibration_level': float(equipment.get('vibration_level', 2.5)),
+        'power_consumption': float(equipment.get('power_consumption', 250))
+    }
+
+def score_equipment(equipment_list):
+    """
+    Score a list of request payloads: each payload is parsed on its own (bad ones get an
+    error response in place) and the valid ones are scored with one engine call
+    """
+    results = [None] * len(equipment_list)
+    valid_positions = []
+    records = []
+    for position, equipment in enumerate(equipment_list):
+        try:
+            records.append(parse_equipment(equipment))
+            valid_positions.append(position)
+        except Exception as e:
+            results[position] = {
+                'success': False,
+                'error': str(e),
+                'equipment_id': equipment.get('equipment_id', 'unknown') if isinstance(equipment, dict) else 'unknown'
+            }
+    
+    if records:
+        for position, result in zip(valid_positions, score_records(records)):
+            results[position] = result
+    return results
+
+def score_records(records):
+    """Score parsed records with one engine call"""
+    equipment_ids = [record['equipment_id'] for record in records]
+    X = build_feature_matrix(records, ENGINE.features)
+    probabilities, confidences = ENGINE.score(X, equipment_ids)
+    predictions = ENGINE.build_responses(equipment_ids, probabilities, confidences)
+    
+    factors = ENGINE.factor_contributions(X) if hasattr(ENGINE, 'factor_contributions') else None
+    
+    results = []
+    for i, prediction in enumerate(predictions):
+        result = {
+            'success': True,
+            'equipment_id': prediction['equipment_id'],
+            'failure_probability': prediction['failure_probability'],
+            'risk_level': prediction['risk_level'],
+            'confidence_score': prediction['confidence_score'],
+            'model_version': prediction['model_version'],
+            'prediction_timestamp': prediction['prediction_timestamp'],
+            'risk_color': RISK_COLORS[prediction['risk_level']]
+        }
+        if factors is not None:
+            result['factors'] = {
+                'age_impact': round(float(factors['age'][i]), 3),
+                'temperature_impact': round(float(factors['temperature'][i]), 3),
+                'vibration_impact': round(float(factors['vibration'][i]), 3),
+                'power_impact': round(float(factors['power'][i]), 3)
+            }
+        results.append(result)
+    return results
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -50,56 +127,7 @@ def predict_equipment():
     """Single equipment prediction endpoint"""
     try:
         data = request.get_json()
-        equipment_id = data.get('equipment_id', 'unknown')
-        
-        # Simple mock prediction based on input data
-        age = data.get('age_months', 24)
-        temp = data.get('operating_temperature', 65)
-        vibration = data.get('vibration_level', 2.5)
-        power = data.get('power_consumption', 250)
-        
-        # Calculate risk based on input parameters
-        risk_score = 0.0
-        risk_score += min(age / 100.0, 0.3)  # Age factor
-        risk_score += min((temp - 20) / 100.0, 0.3)  # Temperature factor
-        risk_score += min(vibration / 10.0, 0.2)  # Vibration factor
-        risk_score += min(power / 1000.0, 0.2)  # Power factor
-        
-        # Add some randomization
-        import random
-        risk_score += random.uniform(-0.1, 0.1)
-        risk_score = max(0.0, min(1.0, risk_score))
-        
-        # Determine risk level
-        if risk_score >= 0.7:
-            risk_level = "Critical"
-            risk_color = "danger"
-        elif risk_score >= 0.5:
-            risk_level = "High"
-            risk_color = "warning"
-        elif risk_score >= 0.3:
-            risk_level = "Medium" 
-            risk_color = "info"
-        else:
-            risk_level = "Low"
-            risk_color = "success"
-        
-        return jsonify({
-            'success': True,
-            'equipment_id': equipment_id,
-            'failure_probability': round(risk_score, 3),
-            'risk_level': risk_level,
-            'confidence_score': round(random.uniform(0.8, 0.95), 3),
-            'model_version': 'Random Forest v1.0',
-            'prediction_timestamp': '2025-08-09T12:00:00Z',
-            'risk_color': risk_color,
-            'factors': {
-                'age_impact': round(min(age / 100.0, 0.3), 3),
-                'temperature_impact': round(min((temp - 20) / 100.0, 0.3), 3),
-                'vibration_impact': round(min(vibration / 10.0, 0.2), 3),
-                'power_impact': round(min(power / 1000.0, 0.2), 3)
-            }
-        })
+        return jsonify(score_records([parse_equipment(data)])[0])
         
     except Exception as e:
         return jsonify({
@@ -115,16 +143,7 @@ def batch_predict():
         data = request.get_json()
         equipment_list = data.get('equipment_list', [])
         
-        predictions = []
-        for equipment in equipment_list:
-            # Reuse single prediction logic
-            single_request = {'json': equipment}
-            with app.test_request_context('/api/equipment/predict', method='POST', json=equipment):
-                response = predict_equipment()
-                if hasattr(response, 'json'):
-                    predictions.append(response.json)
-                else:
-                    predictions.append(response[0].json)
+        predictions = score_equipment(equipment_list)
         
         return jsonify({
             'success': True,
@@ -0,0 +1,345 @@
+"""
+Timetable PDF extraction for the ProactED ML API
+Derives per-room daily usage hours from uploaded timetables. Every upload is identified by the SHA-256
+of its content, so byte-identical files saved under different names are parsed once; parsed results are
+cached on disk by hash, and only new content is parsed, in a process pool. The room usage feeds the
+`daily_usage_hours` feature in featurizer.py.
+
+Usage:
+    python timetable_usage.py ../wwwroot/uploads/timetables --workers 4
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIMETABLE_DIR_ENV_VAR = 'ML_TIMETABLE_DIR'
+DEFAULT_TIMETABLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     'wwwroot', 'uploads', 'timetables')
+
+TIMETABLE_CACHE_ENV_VAR = 'ML_TIMETABLE_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timetable_cache')
+
+TIMETABLE_WORKERS_ENV_VAR = 'ML_TIMETABLE_WORKERS'
+
+# Bump when parsing changes so cached results from older parsers are ignored
+PARSER_VERSION = 2
+
+HASH_BLOCK_BYTES = 1 << 20
+
+# Length assumed for a session listed with a start time only
+DEFAULT_SESSION_HOURS = 1.0
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+TEACHING_DAYS = 5
+
+# Patterns of PdfTimetableExtractionService, plus time ranges
+TIME_RANGE_PATTERN = re.compile(r'\b([0-9]{1,2})[:.]([0-9]{2})\s*(?:-|–|to)\s*([0-9]{1,2})[:.]([0-9]{2})\b', re.IGNORECASE)
+TIME_PATTERN = re.compile(r'\b([0-9]{1,2}):([0-9]{2})\b')
+# Multi-word prefixes come first so "Lecture Hall 3" captures "3" rather than "Hall"
+ROOM_PATTERN = re.compile(r'\b(Lecture\s+Hall|Lecture\s+Theat(?:er|re)|Room|Lab|Hall|Theat(?:er|re)|Lecture)'
+                          r'\s*([A-Z]?\d+[A-Z]?|[A-Z])\b', re.IGNORECASE)
+DAY_PATTERN = re.compile(r'\b(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday|Mon|Tue|Wed|Thu|Fri|Sat|Sun)\b',
+                         re.IGNORECASE)
+COURSE_PATTERN = re.compile(r'\b[A-Z]{2,4}[0-9]{3,4}\b')
+
+
+def room_key(value: Any) -> str:
+    """Lower-case alphanumeric key used to match timetable rooms to equipment rooms ("Room 101" -> "room101")"""
+    return re.sub(r'[^0-9a-z]', '', str(value).lower())
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_text(path: str) -> str:
+    """Text of every page, one page per block"""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def parse_timetable_text(text: str) -> List[Dict[str, Any]]:
+    """
+    Sessions found in timetable text: a line with a time and a room is one session. The day comes from
+    the line itself or the latest day header; a time range gives the length, a single time DEFAULT_SESSION_HOURS.
+    """
+    sessions = []
+    current_day: Optional[str] = None
+    for line in text.splitlines():
+        day_match = DAY_PATTERN.search(line)
+        room_match = ROOM_PATTERN.search(line)
+        time_range = TIME_RANGE_PATTERN.search(line)
+        time_match = time_range or TIME_PATTERN.search(line)
+        day = _day_name(day_match.group(1)) if day_match else None
+
+        if time_match is None or room_match is None:
+            if day is not None:
+                current_day = day
+            continue
+
+        start = int(time_match.group(1)) + int(time_match.group(2)) / 60.0
+        end = (int(time_range.group(3)) + int(time_range.group(4)) / 60.0) if time_range else start + DEFAULT_SESSION_HOURS
+        if not 0 <= start < end <= 24:
+            continue
+        course = COURSE_PATTERN.search(line)
+        sessions.append({
+            "room": f"{' '.join(room_match.group(1).split()).title()} {room_match.group(2).upper()}",
+            "day": day or current_day,
+            "start": round(start, 4),
+            "end": round(end, 4),
+            "course": course.group(0) if course else None
+        })
+    return sessions
+
+
+def _day_name(token: str) -> str:
+    token = token.lower()
+    return next(day for day in DAYS if day.startswith(token[:3]))
+
+
+def parse_file(path: str) -> Dict[str, Any]:
+    """Extract and parse one PDF (runs in a worker process)"""
+    started = time.perf_counter()
+    text = extract_text(path)
+    sessions = parse_timetable_text(text)
+    return {
+        "parser_version": PARSER_VERSION,
+        "characters": len(text),
+        "sessions": sessions,
+        "rooms": sorted({session["room"] for session in sessions}),
+        "parse_seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def union_hours(starts: np.ndarray, ends: np.ndarray) -> float:
+    """Length of the union of [start, end) intervals, so overlapping bookings are counted once"""
+    if len(starts) == 0:
+        return 0.0
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    # A new block starts where an interval begins after everything before it has ended
+    block_start = np.r_[True, starts[1:] > reach[:-1]]
+    block_id = np.cumsum(block_start) - 1
+    block_begin = starts[block_start]
+    block_end = np.zeros(block_id[-1] + 1)
+    np.maximum.at(block_end, block_id, ends)
+    return float((block_end - block_begin).sum())
+
+
+def room_usage(sessions: Sequence[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-room booked hours by weekday and daily_usage_hours (weekly hours over TEACHING_DAYS).
+    Sessions without a known day are spread evenly over the teaching days.
+    """
+    grouped: Dict[Tuple[str, Optional[str]], List[Tuple[float, float]]] = {}
+    labels: Dict[str, str] = {}
+    for session in sessions:
+        key = room_key(session["room"])
+        labels.setdefault(key, session["room"])
+        grouped.setdefault((key, session.get("day")), []).append((session["start"], session["end"]))
+
+    usage: Dict[str, Dict[str, Any]] = {}
+    for (key, day), intervals in grouped.items():
+        bounds = np.asarray(intervals, dtype=np.float64)
+        hours = union_hours(bounds[:, 0], bounds[:, 1])
+        entry = usage.setdefault(key, {"room": labels[key], "weekday_hours": dict.fromkeys(DAYS, 0.0),
+                                       "sessions": 0})
+        entry["sessions"] += len(intervals)
+        if day is None:
+            for teaching_day in DAYS[:TEACHING_DAYS]:
+                entry["weekday_hours"][teaching_day] += hours / TEACHING_DAYS
+        else:
+            entry["weekday_hours"][day] += hours
+
+    for entry in usage.values():
+        weekly = sum(entry["weekday_hours"].values())
+        entry["weekday_hours"] = {day: round(hours, 2) for day, hours in entry["weekday_hours"].items()}
+        entry["weekly_hours"] = round(weekly, 2)
+        entry["daily_usage_hours"] = round(min(weekly / TEACHING_DAYS, 24.0), 2)
+    return usage
+
+
+class TimetableExtractor:
+    """
+    Content-addressed timetable parser. `<cache_dir>/<sha256>.json` holds the parsed result of each
+    distinct file; `index.json` maps (path, size, mtime) to its hash so unchanged files are not re-hashed.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, workers: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.workers = workers or min(os.cpu_count() or 1, 4)
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        self._index: Dict[str, Dict[str, Any]] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable timetable hash index: {e}")
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.usage: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_environment(cls) -> 'TimetableExtractor':
+        workers = os.environ.get(TIMETABLE_WORKERS_ENV_VAR)
+        return cls(os.environ.get(TIMETABLE_CACHE_ENV_VAR, DEFAULT_CACHE_DIR), int(workers) if workers else None)
+
+    def digest(self, path: str) -> str:
+        """Content hash, reused from the index while the file's size and mtime are unchanged"""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self._index.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        digest = file_digest(path)
+        self._index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        return digest
+
+    def _cache_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def cached(self, digest: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._cache_path(digest)) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return result if result.get("parser_version") == PARSER_VERSION else None
+
+    def _store(self, digest: str, result: Dict[str, Any]) -> None:
+        temporary = self._cache_path(digest) + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(result, f)
+        os.replace(temporary, self._cache_path(digest))
+
+    def extract(self, paths: Sequence[str]) -> Dict[str, Any]:
+        """Parse every distinct timetable among paths and rebuild the per-room usage"""
+        with self._lock:
+            started = time.perf_counter()
+            by_digest: Dict[str, List[str]] = {}
+            for path in paths:
+                by_digest.setdefault(self.digest(path), []).append(path)
+            hashed = time.perf_counter()
+
+            results = {digest: self.cached(digest) for digest in by_digest}
+            missing = [digest for digest, result in results.items() if result is None]
+            errors = {}
+            if missing:
+                representatives = [by_digest[digest][0] for digest in missing]
+                parsed = self._parse_all(representatives)
+                for digest, (result, error) in zip(missing, parsed):
+                    if error is None:
+                        self._store(digest, result)
+                        results[digest] = result
+                    else:
+                        errors[digest] = error
+                        logger.error(f"Timetable {by_digest[digest][0]} could not be parsed: {error}")
+            self._save_index()
+
+            sessions = [session for result in results.values() if result for session in result["sessions"]]
+            self.usage = room_usage(sessions)
+            self.last_run = {
+                "files": len(paths),
+                "distinct_files": len(by_digest),
+                "duplicate_files": len(paths) - len(by_digest),
+                "cache_hits": len(by_digest) - len(missing),
+                "parsed": len(missing) - len(errors),
+                "failed": len(errors),
+                "rooms": len(self.usage),
+                "hash_ms": round((hashed - started) * 1000, 1),
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            return {
+                **self.last_run,
+                "timetables": [
+                    {"sha256": digest, "paths": [os.path.basename(path) for path in file_paths],
+                     "sessions": len(results[digest]["sessions"]) if results[digest] else 0,
+                     "error": errors.get(digest)}
+                    for digest, file_paths in by_digest.items()
+                ]
+            }
+
+    def extract_directory(self, directory: str) -> Dict[str, Any]:
+        paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                       if name.lower().endswith('.pdf'))
+        return self.extract(paths)
+
+    def _parse_all(self, paths: List[str]) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """(result, error) per path; a single file is parsed inline rather than paying for a pool"""
+        if len(paths) == 1 or self.workers <= 1:
+            return [self._parse_safely(path) for path in paths]
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(paths))) as pool:
+            futures = [pool.submit(parse_file, path) for path in paths]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append((future.result(), None))
+                except Exception as e:
+                    outcomes.append((None, str(e)))
+            return outcomes
+
+    @staticmethod
+    def _parse_safely(path: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        try:
+            return parse_file(path), None
+        except Exception as e:
+            return None, str(e)
+
+    def _save_index(self) -> None:
+        temporary = self._index_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(temporary, self._index_path)
+
+    def daily_usage_hours(self) -> Dict[str, float]:
+        """room_key -> daily usage hours, as consumed by featurizer.featurize(room_usage=...)"""
+        return {key: entry["daily_usage_hours"] for key, entry in self.usage.items()}
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "cache_dir": self.cache_dir,
+            "workers": self.workers,
+            "indexed_files": len(self._index),
+            "rooms": len(self.usage),
+            "last_run": self.last_run
+        }
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Extract per-room daily usage hours from timetable PDFs")
+    parser.add_argument('directory', nargs='?', default=os.environ.get(TIMETABLE_DIR_ENV_VAR, DEFAULT_TIMETABLE_DIR))
+    parser.add_argument('--cache-dir', default=os.environ.get(TIMETABLE_CACHE_ENV_VAR, DEFAULT_CACHE_DIR))
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    extractor = TimetableExtractor(args.cache_dir, args.workers)
+    report = extractor.extract_directory(args.directory)
+    report["room_usage"] = extractor.usage
+    print(json.dumps(report, indent=2))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
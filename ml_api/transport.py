@@ -0,0 +1,209 @@
+"""
+Listening transports for the ProactED ML API
+The API can listen on TCP, on a Unix domain socket, or both. ProactED and the ML API usually run on
+the same host, and a Unix socket skips the loopback TCP stack. Connections are kept alive between
+requests so a long-lived client (the .NET HttpClient pool) does not pay a connect per prediction.
+"""
+
+import http.client
+import io
+import logging
+import os
+import socket
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, make_server
+
+logger = logging.getLogger(__name__)
+
+LISTEN_ENV_VAR = 'ML_API_LISTEN'
+KEEPALIVE_ENV_VAR = 'ML_API_KEEPALIVE_SECONDS'
+
+DEFAULT_LISTEN = 'tcp://0.0.0.0:5001'
+
+# Idle seconds before a kept-alive connection is closed; above the 60 s idle timeout of .NET's
+# connection pool so the client, not the server, retires idle connections
+DEFAULT_KEEPALIVE_SECONDS = 75.0
+
+# Owner and group (the ProactED service account) may connect to the socket
+SOCKET_MODE = 0o660
+
+TCP = 'tcp'
+UNIX = 'unix'
+
+
+def parse_listen(spec: str) -> List[Tuple[str, str, int]]:
+    """
+    Parse a comma-separated listen list such as 'tcp://0.0.0.0:5001,unix:///run/proacted/ml.sock'
+    into (transport, host, port) triples; Unix sockets carry the socket path as host and port 0.
+    """
+    addresses = []
+    for part in (spec or DEFAULT_LISTEN).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if part.startswith('unix://'):
+            path = part[len('unix://'):]
+            if not path:
+                raise ValueError(f"Missing socket path in {part!r}")
+            addresses.append((UNIX, path, 0))
+            continue
+        address = part[len('tcp://'):] if part.startswith('tcp://') else part
+        host, separator, port = address.rpartition(':')
+        if not separator or not port.isdigit():
+            raise ValueError(f"Listen address {part!r} must be tcp://host:port or unix:///path")
+        addresses.append((TCP, host.strip('[]') or '0.0.0.0', int(port)))
+    if not addresses:
+        raise ValueError("No listen addresses given")
+    return addresses
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Werkzeug's handler closes every connection, and after each response it polls the socket for
+    10 ms to drain unread body bytes, which would also swallow the next request on a kept-alive
+    connection. Requests with a Content-Length are read in full up front and answered here with an
+    explicit Content-Length, so the connection stays open; chunked uploads and 100-continue
+    requests go through Werkzeug's own path and close as before.
+    """
+
+    timeout = DEFAULT_KEEPALIVE_SECONDS
+
+    def setup(self) -> None:
+        super().setup()
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            # Small JSON responses must not wait for Nagle's algorithm
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def content_length(self) -> Optional[int]:
+        """Length of a fully readable request body, or None when Werkzeug must handle the request"""
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            return None
+        if self.headers.get('Expect', '').lower().strip(' \t') == '100-continue':
+            return None
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return None
+        return length if length >= 0 else None
+
+    def run_wsgi(self) -> None:
+        length = self.content_length()
+        if length is None:
+            super().run_wsgi()
+            return
+
+        environ = self.make_environ()
+        environ['wsgi.input'] = io.BytesIO(self.rfile.read(length) if length else b'')
+        self.environ = environ
+        response: Dict[str, Any] = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, headers
+            return lambda data: response.setdefault('written', []).append(data)
+
+        try:
+            body = self.call_app(self.server.app, environ, start_response, response)
+        except Exception as e:
+            if self.server.passthrough_errors:
+                raise
+            self.server.log('error', f"Error on request {self.command} {self.path}: {e!r}")
+            body = self.call_app(InternalServerError(), environ, start_response, response)
+
+        code, _, message = response['status'].partition(' ')
+        code = int(code)
+        self.send_response(code, message)
+        head = self.command == 'HEAD'
+        for key, value in response['headers']:
+            # HEAD responses keep the application's length of the body they omit
+            if key.lower() not in ('connection', 'transfer-encoding') and (head or key.lower() != 'content-length'):
+                self.send_header(key, value)
+        if not (head or 100 <= code < 200 or code in (204, 304)):
+            self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        self.wfile.flush()
+
+    @staticmethod
+    def call_app(app, environ, start_response, response: Dict[str, Any]) -> bytes:
+        response.pop('written', None)
+        iterable = app(environ, start_response)
+        try:
+            chunks = response.get('written', []) + list(iterable)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        return b''.join(chunks)
+
+
+def keep_alive_handler(keepalive_seconds: float) -> type:
+    return type('KeepAliveRequestHandler', (KeepAliveRequestHandler,), {
+        'timeout': keepalive_seconds,
+        'protocol_version': 'HTTP/1.1'
+    })
+
+
+def make_servers(app, listen: str, keepalive_seconds: float = DEFAULT_KEEPALIVE_SECONDS) -> List[BaseWSGIServer]:
+    """Threaded WSGI servers for every listen address; Unix socket files are replaced and restricted"""
+    handler = keep_alive_handler(keepalive_seconds)
+    servers = []
+    for transport, host, port in parse_listen(listen):
+        if transport == UNIX:
+            directory = os.path.dirname(host)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            server = make_server(f"unix://{host}", 0, app, threaded=True, request_handler=handler)
+            os.chmod(host, SOCKET_MODE)
+        else:
+            server = make_server(host, port, app, threaded=True, request_handler=handler)
+        servers.append(server)
+    return servers
+
+
+def describe_server(server: BaseWSGIServer) -> str:
+    if server.address_family == socket.AF_UNIX:
+        return server.host
+    return f"http://{server.host}:{server.port}"
+
+
+def serve(app, listen: Optional[str] = None, keepalive_seconds: Optional[float] = None) -> None:
+    """Serve the app on every configured address until interrupted"""
+    listen = listen or os.environ.get(LISTEN_ENV_VAR, DEFAULT_LISTEN)
+    if keepalive_seconds is None:
+        keepalive_seconds = float(os.environ.get(KEEPALIVE_ENV_VAR, DEFAULT_KEEPALIVE_SECONDS))
+    servers = make_servers(app, listen, keepalive_seconds)
+    threads = [threading.Thread(target=server.serve_forever, name=f"serve-{i}", daemon=True)
+               for i, server in enumerate(servers)]
+    for server, thread in zip(servers, threads):
+        logger.info(f"Listening on {describe_server(server)} (keep-alive {keepalive_seconds:.0f}s)")
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+            socket_path = server.host[len('unix://'):]
+            if server.address_family == socket.AF_UNIX and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client connection over a Unix domain socket (for the benchmark and local tooling)"""
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
@@ -0,0 +1,370 @@
+"""
+Hyperparameter search for the Random Forest served by the ProactED ML API
+Candidate configurations are cross-validated on a process pool. The feature matrix, target and fold
+assignment live in shared memory, so workers never copy the data. Successive halving trains every
+candidate on a small row budget first and only promotes the best third to larger budgets. Each candidate
+records cross-validated accuracy, model size and serving latency. Finalists are re-timed one at a time
+after the search, and the fastest one within a tolerance of the best accuracy is retrained on the dataset
+(less the generator's test share) and written in the API's pickle layout.
+
+Usage:
+    python tune_model.py --data fleet.npz --output complete_equipment_failure_prediction_system.pkl
+    python tune_model.py --rows 500000 --candidates 32 --workers 8 --report tuning.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from engines import MODEL_FEATURES, MODEL_FILENAME, ForestEngine
+from generate_fleet import (DEFAULT_SEED, LABEL_COLUMN, TARGET_COLUMN, generate_fleet, save_model_system,
+                            train_model_system)
+from optimize_model import compact_from_engine, r2, time_call
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Search space; candidates are sampled from the full grid without replacement
+SEARCH_SPACE = {
+    "n_estimators": [25, 50, 100, 200],
+    "max_depth": [6, 8, 12, 16, None],
+    "min_samples_leaf": [1, 5, 20, 50],
+    "max_features": [1.0, 0.6, 'sqrt']
+}
+
+DEFAULT_CANDIDATES = 24
+DEFAULT_FOLDS = 3
+# Successive halving: keep 1/ETA of the candidates per rung, multiply the row budget by ETA
+DEFAULT_ETA = 3
+DEFAULT_MIN_ROWS = 5000
+# Validation rows scored per fold (cap keeps evaluation cheap on very large fleets)
+DEFAULT_VALIDATION_ROWS = 20000
+# Accuracy (R²) a faster model may give up relative to the best one
+DEFAULT_TOLERANCE = 0.002
+
+LATENCY_BATCH_ROWS = 1000
+LATENCY_REPEATS = 20
+
+# Shared arrays attached by each worker process
+_SHARED: Dict[str, np.ndarray] = {}
+_SEGMENTS: List[shared_memory.SharedMemory] = []
+
+
+class SharedArrays:
+    """Named NumPy arrays copied once into shared memory; workers attach by name"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.segments: List[shared_memory.SharedMemory] = []
+        self.specs: Dict[str, Tuple[str, Tuple[int, ...], str]] = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+            self.segments.append(segment)
+            self.specs[name] = (segment.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+
+
+def _attach(specs: Dict[str, Tuple[str, Tuple[int, ...], str]]) -> None:
+    """Pool initializer: map the shared arrays into this worker without copying"""
+    for name, (segment_name, shape, dtype) in specs.items():
+        # Pool workers share the parent's resource tracker, so the parent's unlink stays the only cleanup
+        segment = shared_memory.SharedMemory(name=segment_name)
+        _SEGMENTS.append(segment)
+        _SHARED[name] = np.ndarray(shape, np.dtype(dtype), buffer=segment.buf)
+
+
+def fold_rows(fold: int, budget: int, validation_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Training rows (the first `budget` rows outside the fold, in the shared shuffled order)
+    and validation rows (up to `validation_rows` inside the fold)
+    """
+    order = _SHARED["order"]
+    in_fold = _SHARED["fold"][order] == fold
+    return order[~in_fold][:budget], order[in_fold][:validation_rows]
+
+
+def model_nbytes(model: Any) -> int:
+    """Bytes of the fitted trees' node and value arrays"""
+    total = 0
+    for estimator in model.estimators_:
+        state = estimator.tree_.__getstate__()
+        total += state['nodes'].nbytes + state['values'].nbytes
+    return total
+
+
+def evaluate(candidate: int, params: Dict[str, Any], fold: int, budget: int, validation_rows: int,
+             seed: int, measure: bool, keep_model: bool = False) -> Dict[str, Any]:
+    """
+    Fit one candidate on one fold in a worker; optionally measure its size and serving latency
+    (timed while other workers are busy, so only a rough estimate) and return the pickled model
+    """
+    from sklearn.ensemble import RandomForestRegressor
+
+    X, y = _SHARED["X"], _SHARED["y"]
+    train, validation = fold_rows(fold, budget, validation_rows)
+    model = RandomForestRegressor(random_state=seed, n_jobs=1, **params)
+    started = time.perf_counter()
+    # Trees are invariant to the StandardScaler, so folds are fitted on raw features
+    model.fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - started
+    predicted = model.predict(X[validation])
+
+    result = {
+        "candidate": candidate,
+        "fold": fold,
+        "r2": r2(y[validation], predicted),
+        "mse": float(((y[validation] - predicted) ** 2).mean()),
+        "fit_seconds": fit_seconds
+    }
+    if measure:
+        pickled = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+        compact, latency = measure_latency(model, X[validation[:LATENCY_BATCH_ROWS]])
+        result["size"] = {
+            "pickle_bytes": len(pickled),
+            "tree_array_bytes": model_nbytes(model),
+            "compact_bytes": compact.nbytes,
+            "nodes": int(sum(estimator.tree_.node_count for estimator in model.estimators_))
+        }
+        result["latency_ms"] = latency
+        if keep_model:
+            result["model_pickle"] = pickled
+    return result
+
+
+def measure_latency(model: Any, batch: np.ndarray) -> Tuple[Any, Dict[str, float]]:
+    """(compact form, single-row and batch latency of the sklearn and compact forests)"""
+    engine = ForestEngine({'model_info': {'model_object': model, 'features': list(MODEL_FEATURES)}})
+    compact, _ = compact_from_engine(engine)
+    ids = np.arange(len(batch))
+    return compact, {
+        "forest_single": time_call(lambda: engine.predict(batch[:1], ids[:1]), LATENCY_REPEATS),
+        "forest_batch_1000": time_call(lambda: engine.predict(batch, ids), max(3, LATENCY_REPEATS // 4)),
+        "compact_single": time_call(lambda: compact.predict(batch[:1]), LATENCY_REPEATS),
+        "compact_batch_1000": time_call(lambda: compact.predict(batch), max(3, LATENCY_REPEATS // 4))
+    }
+
+
+def sample_candidates(count: int, seed: int) -> List[Dict[str, Any]]:
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    chosen = np.random.default_rng(seed).permutation(len(grid))[:min(count, len(grid))]
+    return [grid[i] for i in sorted(chosen)]
+
+
+def rung_budgets(min_rows: int, max_rows: int, eta: int) -> List[int]:
+    """Row budgets from min_rows growing by eta, ending exactly at max_rows"""
+    budgets = []
+    budget = min(min_rows, max_rows)
+    while budget < max_rows:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(max_rows)
+    return budgets
+
+
+def successive_halving(shared: SharedArrays, candidates: List[Dict[str, Any]], folds: int, eta: int,
+                       min_rows: int, max_rows: int, validation_rows: int, seed: int,
+                       workers: int) -> Tuple[List[Dict[str, Any]], Dict[int, bytes]]:
+    """
+    Run all rungs on one pool; returns one record per candidate with its last-rung results and
+    the pickled fold-0 models of the finalists
+    """
+    records = [{"candidate": i, "params": params, "rungs": []} for i, params in enumerate(candidates)]
+    alive = list(range(len(candidates)))
+    budgets = rung_budgets(min_rows, max_rows, eta)
+    finalist_models: Dict[int, bytes] = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.specs,)) as pool:
+        for rung, budget in enumerate(budgets):
+            final = rung == len(budgets) - 1
+            started = time.perf_counter()
+            futures = []
+            for candidate in alive:
+                for fold in range(folds):
+                    # Size and a concurrent latency estimate come from fold 0 in every rung; the last
+                    # rung also ships the fold-0 model back so finalists can be re-timed serially
+                    futures.append(pool.submit(evaluate, candidate, candidates[candidate], fold, budget,
+                                               validation_rows, seed, fold == 0, final and fold == 0))
+            by_candidate: Dict[int, List[Dict[str, Any]]] = {candidate: [] for candidate in alive}
+            for future in futures:
+                result = future.result()
+                if "model_pickle" in result:
+                    finalist_models[result["candidate"]] = result.pop("model_pickle")
+                by_candidate[result["candidate"]].append(result)
+
+            for candidate, results in by_candidate.items():
+                scores = np.array([result["r2"] for result in results])
+                measured = next(result for result in results if "size" in result)
+                records[candidate]["rungs"].append({
+                    "rung": rung,
+                    "train_rows": budget,
+                    "cv_r2": float(scores.mean()),
+                    "cv_r2_std": float(scores.std()),
+                    "cv_mse": float(np.mean([result["mse"] for result in results])),
+                    "fit_seconds": float(np.mean([result["fit_seconds"] for result in results])),
+                    "size": measured["size"],
+                    "latency_ms": measured["latency_ms"]
+                })
+
+            ranked = sorted(alive, key=lambda candidate: -records[candidate]["rungs"][-1]["cv_r2"])
+            keep = ranked if final else ranked[:max(1, math.ceil(len(ranked) / eta))]
+            logger.info(f"Rung {rung}: {len(alive)} candidates on {budget} rows x {folds} folds in "
+                        f"{time.perf_counter() - started:.1f}s; best R² "
+                        f"{records[ranked[0]]['rungs'][-1]['cv_r2']:.4f}, promoting {len(keep)}")
+            for candidate in alive:
+                records[candidate]["stopped_at_rung"] = rung
+                records[candidate]["finalist"] = final
+            alive = keep
+    return records, finalist_models
+
+
+def retime_finalists(records: List[Dict[str, Any]], models: Dict[int, bytes], batch: np.ndarray) -> None:
+    """
+    Replace the finalists' latency (timed next to busy workers) with timings taken one model at a
+    time in this process on the same batch; the concurrent figure is kept as latency_ms_concurrent
+    """
+    for candidate, pickled in sorted(models.items()):
+        rung = records[candidate]["rungs"][-1]
+        _, latency = measure_latency(pickle.loads(pickled), batch)
+        rung["latency_ms_concurrent"] = rung["latency_ms"]
+        rung["latency_ms"] = latency
+
+
+def select(records: List[Dict[str, Any]], tolerance: float) -> Dict[str, Any]:
+    """Fastest finalist (compact batch latency) whose CV R² is within tolerance of the best"""
+    finalists = [record for record in records if record["finalist"]]
+    best = max(record["rungs"][-1]["cv_r2"] for record in finalists)
+    eligible = [record for record in finalists if record["rungs"][-1]["cv_r2"] >= best - tolerance]
+    return min(eligible, key=lambda record: (record["rungs"][-1]["latency_ms"]["compact_batch_1000"],
+                                             -record["rungs"][-1]["cv_r2"]))
+
+
+def load_training_data(path: str) -> Dict[str, np.ndarray]:
+    """Model features, target and (if present) failure labels from a .npz or .csv file"""
+    columns = list(MODEL_FEATURES) + [TARGET_COLUMN]
+    if path.endswith('.npz'):
+        with np.load(path, allow_pickle=False) as data:
+            loaded = {column: data[column] for column in columns}
+            if LABEL_COLUMN in data:
+                loaded[LABEL_COLUMN] = data[LABEL_COLUMN]
+        return loaded
+    import pandas as pd
+    frame = pd.read_csv(path)
+    if LABEL_COLUMN in frame:
+        columns.append(LABEL_COLUMN)
+    return {column: frame[column].to_numpy() for column in columns}
+
+
+def tune(data: Dict[str, np.ndarray], candidates: int = DEFAULT_CANDIDATES, folds: int = DEFAULT_FOLDS,
+         eta: int = DEFAULT_ETA, min_rows: int = DEFAULT_MIN_ROWS, max_rows: Optional[int] = None,
+         validation_rows: int = DEFAULT_VALIDATION_ROWS, tolerance: float = DEFAULT_TOLERANCE,
+         seed: int = DEFAULT_SEED, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Search, select and return the report (the selected configuration is in report['selected'])"""
+    if folds < 2:
+        raise ValueError("At least two folds are required")
+    X = np.column_stack([data[feature] for feature in MODEL_FEATURES]).astype(np.float32)
+    y = np.asarray(data[TARGET_COLUMN], dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    n = len(y)
+    order = rng.permutation(n)
+    fold = np.empty(n, dtype=np.int8)
+    fold[order] = np.arange(n) % folds
+
+    training_rows = n - n // folds
+    max_rows = min(max_rows or training_rows, training_rows)
+    workers = workers or min(os.cpu_count() or 1, 8)
+    configurations = sample_candidates(candidates, seed)
+
+    started = time.perf_counter()
+    shared = SharedArrays({"X": X, "y": y, "order": order, "fold": fold})
+    try:
+        records, finalist_models = successive_halving(shared, configurations, folds, eta, min_rows, max_rows,
+                                                      validation_rows, seed, workers)
+    finally:
+        shared.close()
+    retime_finalists(records, finalist_models, X[order[fold[order] == 0][:LATENCY_BATCH_ROWS]])
+
+    selected = select(records, tolerance)
+    return {
+        "rows": n,
+        "folds": folds,
+        "eta": eta,
+        "budgets": rung_budgets(min_rows, max_rows, eta),
+        "workers": workers,
+        "shared_bytes": int(X.nbytes + y.nbytes + order.nbytes + fold.nbytes),
+        "search_seconds": round(time.perf_counter() - started, 2),
+        "tolerance": tolerance,
+        "selected": selected,
+        "candidates": sorted(records, key=lambda record: (-record["stopped_at_rung"], -record["rungs"][-1]["cv_r2"]))
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tune the Random Forest with parallel successive halving")
+    parser.add_argument('--data', help="Training data (.npz or .csv with model features and failure_probability)")
+    parser.add_argument('--rows', type=int, default=200000, help="Synthetic fleet size when --data is not given")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--candidates', type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS)
+    parser.add_argument('--eta', type=int, default=DEFAULT_ETA)
+    parser.add_argument('--min-rows', type=int, default=DEFAULT_MIN_ROWS)
+    parser.add_argument('--max-rows', type=int, default=None, help="Row budget of the last rung (default: all)")
+    parser.add_argument('--validation-rows', type=int, default=DEFAULT_VALIDATION_ROWS)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', nargs='?', const=MODEL_FILENAME,
+                        help="Retrain the selected configuration on the dataset, less the held-out test share used for "
+                             f"its metrics and threshold, and write it (default name: {MODEL_FILENAME})")
+    parser.add_argument('--report', help="Write the full JSON report to this file")
+    args = parser.parse_args(argv)
+
+    data = load_training_data(args.data) if args.data else generate_fleet(args.rows, args.seed)
+    report = tune(data, args.candidates, args.folds, args.eta, args.min_rows, args.max_rows,
+                  args.validation_rows, args.tolerance, args.seed, args.workers)
+
+    if args.output:
+        params = report["selected"]["params"]
+        model_system = train_model_system(data, seed=args.seed, train_rows=len(data[TARGET_COLUMN]),
+                                          n_jobs=args.workers, synthetic=not args.data, **params)
+        model_system['model_info']['performance_metrics']["tuning"] = {
+            "params": params,
+            "cv_r2": report["selected"]["rungs"][-1]["cv_r2"],
+            "candidates": len(report["candidates"])
+        }
+        save_model_system(model_system, args.output)
+        report["output"] = {"path": args.output, **model_system['model_info']['performance_metrics']}
+        logger.info(f"Selected model written to {args.output}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    summary = {key: value for key, value in report.items() if key != "candidates"}
+    summary["leaderboard"] = [
+        {"params": record["params"], **{key: record["rungs"][-1][key] for key in ("train_rows", "cv_r2")},
+         "compact_batch_1000_ms": round(record["rungs"][-1]["latency_ms"]["compact_batch_1000"], 3),
+         "compact_bytes": record["rungs"][-1]["size"]["compact_bytes"]}
+        for record in report["candidates"][:10]
+    ]
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
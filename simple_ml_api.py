@@ -5,9 +5,14 @@ This version doesn't require the pickle file and provides realistic predictions
 
 from flask import Flask, request, jsonify
 import datetime
-import random
 import logging
 import json
+import os
+import sys
+
+# Shared predictor engines live in ml_api/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_api'))
+from engines import REQUIRED_FIELDS, load_engine
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -15,91 +20,58 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Simple in-memory model simulation
+NUMERIC_FIELDS = ['age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
+
+# Thin wrapper around the shared engine (heuristic unless ML_ENGINE says otherwise)
 class SimpleEquipmentPredictor:
     def __init__(self):
-        self.model_version = "Simple-Test-Model-v1.0"
+        self.engine = load_engine(default='heuristic')
+        self.model_version = self.engine.model_version
         self.accuracy = 0.887
-        random.seed(42)  # For consistent results during testing
         
     def predict(self, equipment_data):
-        """Generate realistic failure probability based on equipment parameters"""
+        """Generate a failure prediction for one equipment item"""
+        return self.predict_many([equipment_data])[0]
+    
+    def predict_many(self, equipment_list):
+        """
+        Generate failure predictions for many equipment items in one vectorized call.
+        Items with non-numeric values get their own error response; the rest are still scored.
+        """
+        predictions = [None] * len(equipment_list)
+        valid_positions = []
+        records = []
+        for position, equipment_data in enumerate(equipment_list):
+            try:
+                record = dict(equipment_data)
+                for field in NUMERIC_FIELDS:
+                    record[field] = float(record[field])
+            except Exception as e:
+                logger.error(f"Prediction error: {e}")
+                predictions[position] = self.error_response(e)
+                continue
+            records.append(record)
+            valid_positions.append(position)
+        
         try:
-            # Extract parameters
-            age_months = float(equipment_data.get('age_months', 0))
-            temp = float(equipment_data.get('operating_temperature', 50))
-            vibration = float(equipment_data.get('vibration_level', 1))
-            power = float(equipment_data.get('power_consumption', 1000))
-            
-            # Calculate risk score based on realistic factors
-            risk_score = 0.0
-            
-            # Age factor (older equipment more likely to fail)
-            risk_score += min(age_months / 120.0, 0.4)  # Max 40% from age
-            
-            # Temperature factor (high temp = higher risk)
-            if temp > 80:
-                risk_score += min((temp - 80) / 50.0, 0.25)  # Max 25% from temp
-            elif temp > 60:
-                risk_score += min((temp - 60) / 100.0, 0.15)  # Max 15% from moderate temp
-                
-            # Vibration factor (high vibration = problems)
-            if vibration > 5.0:
-                risk_score += min((vibration - 5.0) / 10.0, 0.2)  # Max 20% from vibration
-            elif vibration > 3.0:
-                risk_score += min((vibration - 3.0) / 20.0, 0.1)  # Max 10% from moderate vibration
-                
-            # Power consumption factor (unusual power = potential issues)
-            normal_power = 1500  # Assume normal power consumption
-            power_deviation = abs(power - normal_power) / normal_power
-            risk_score += min(power_deviation * 0.15, 0.15)  # Max 15% from power deviation
-            
-            # Add some realistic randomness
-            random_factor = random.uniform(-0.05, 0.05)
-            risk_score += random_factor
-            
-            # Ensure probability is in valid range
-            failure_probability = max(0.01, min(0.99, risk_score))
-            
-            # Determine risk level
-            if failure_probability >= 0.7:
-                risk_level = "Critical"
-            elif failure_probability >= 0.5:
-                risk_level = "High"  
-            elif failure_probability >= 0.3:
-                risk_level = "Medium"
-            else:
-                risk_level = "Low"
-                
-            # Calculate confidence (inversely related to uncertainty factors)
-            confidence = 0.85
-            if age_months < 6:  # New equipment harder to predict
-                confidence -= 0.1
-            if temp > 90 or temp < 10:  # Extreme temperatures harder to predict
-                confidence -= 0.1
-            if vibration > 8:  # Very high vibration harder to predict
-                confidence -= 0.05
-                
-            confidence_score = max(0.6, min(0.95, confidence + random.uniform(-0.05, 0.05)))
-            
-            return {
-                "success": True,
-                "failure_probability": round(failure_probability, 3),
-                "risk_level": risk_level,
-                "confidence_score": round(confidence_score, 3),
-                "model_version": self.model_version,
-                "prediction_timestamp": datetime.datetime.utcnow().isoformat()
-            }
-            
+            scored = self.engine.predict_records(records) if records else []
         except Exception as e:
             logger.error(f"Prediction error: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "failure_probability": 0.5,
-                "risk_level": "Unknown",
-                "confidence_score": 0.0
-            }
+            scored = [self.error_response(e) for _ in records]
+        
+        for position, prediction in zip(valid_positions, scored):
+            predictions[position] = prediction
+        return predictions
+    
+    @staticmethod
+    def error_response(error):
+        return {
+            "success": False,
+            "error": str(error),
+            "failure_probability": 0.5,
+            "risk_level": "Unknown",
+            "confidence_score": 0.0
+        }
 
 # Initialize the predictor
 predictor = SimpleEquipmentPredictor()
@@ -131,6 +103,7 @@ def health_check():
         "version": "1.0.0",
         "model_loaded": True,
         "model_type": "Simple Test Predictor",
+        "engine": predictor.engine.name,
         "message": "API is running and ready for predictions"
     })
 
@@ -166,8 +139,7 @@ def predict_single():
         logger.info(f"Received single prediction request for: {data.get('equipment_id')}")
         
         # Validate required fields
-        required_fields = ['equipment_id', 'age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = [field for field in REQUIRED_FIELDS if field not in data]
         
         if missing_fields:
             return jsonify({
@@ -205,33 +177,27 @@ def predict_batch():
         equipment_list = data['equipment_list']
         logger.info(f"Processing batch prediction for {len(equipment_list)} items")
         
-        predictions = []
+        predictions = [None] * len(equipment_list)
+        valid_positions = []
         
-        for equipment_data in equipment_list:
-            try:
-                # Validate each equipment item
-                required_fields = ['equipment_id', 'age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
-                missing_fields = [field for field in required_fields if field not in equipment_data]
-                
-                if missing_fields:
-                    predictions.append({
-                        "success": False,
-                        "equipment_id": equipment_data.get('equipment_id', 'unknown'),
-                        "error": f"Missing fields: {missing_fields}"
-                    })
-                    continue
-                
-                # Generate prediction
-                prediction = predictor.predict(equipment_data)
-                prediction["equipment_id"] = equipment_data['equipment_id']
-                predictions.append(prediction)
-                
-            except Exception as e:
-                predictions.append({
+        for position, equipment_data in enumerate(equipment_list):
+            # Validate each equipment item
+            missing_fields = [field for field in REQUIRED_FIELDS if field not in equipment_data]
+            
+            if missing_fields:
+                predictions[position] = {
                     "success": False,
                     "equipment_id": equipment_data.get('equipment_id', 'unknown'),
-                    "error": str(e)
-                })
+                    "error": f"Missing fields: {missing_fields}"
+                }
+            else:
+                valid_positions.append(position)
+        
+        # Generate predictions for all valid items at once
+        valid_items = [equipment_list[position] for position in valid_positions]
+        for position, prediction in zip(valid_positions, predictor.predict_many(valid_items)):
+            prediction["equipment_id"] = equipment_list[position]['equipment_id']
+            predictions[position] = prediction
         
         logger.info(f"Completed batch prediction: {len(predictions)} results")
         
@@ -6,8 +6,13 @@ Fallback implementation for testing when the full API is not available
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import datetime
-import random
 import logging
+import os
+import sys
+
+# Shared predictor engines live in ml_api/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_api'))
+from engines import REQUIRED_FIELDS, load_engine
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +21,31 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for .NET integration
 
+# Shared predictor engine (heuristic unless ML_ENGINE says otherwise)
+ENGINE = load_engine(default='heuristic')
+
+def parse_equipment(equipment):
+    """Model record for one equipment payload (raises on non-numeric values)"""
+    return {
+        'equipment_id': equipment['equipment_id'],
+        'age_months': float(equipment['age_months']),
+        'operating_temperature': float(equipment['operating_temperature']),
+        'vibration_level': float(equipment['vibration_level']),
+        'power_consumption': float(equipment['power_consumption'])
+    }
+
+def score_equipment(records):
+    """Score parsed equipment records with one engine call"""
+    return [{
+        "success": True,
+        "equipment_id": prediction['equipment_id'],
+        "failure_probability": prediction['failure_probability'],
+        "risk_level": prediction['risk_level'],
+        "confidence_score": prediction['confidence_score'],
+        "prediction_timestamp": prediction['prediction_timestamp'],
+        "model_version": prediction['model_version']
+    } for prediction in ENGINE.predict_records(records)]
+
 @app.route('/', methods=['GET'])
 def api_documentation():
     """API documentation and endpoint list"""
@@ -69,55 +99,16 @@ def predict_single():
         logger.info(f"Received prediction request for equipment: {data.get('equipment_id')}")
         
         # Validate required fields
-        required_fields = ['equipment_id', 'age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
-        if not all(field in data for field in required_fields):
+        if not all(field in data for field in REQUIRED_FIELDS):
             return jsonify({
                 "success": False,
-                "error": f"Missing required fields. Required: {required_fields}"
+                "error": f"Missing required fields. Required: {REQUIRED_FIELDS}"
             }), 400
         
-        # Generate realistic prediction based on input data
-        age_months = data['age_months']
-        temp = data['operating_temperature']
-        vibration = data['vibration_level']
-        power = data['power_consumption']
+        # Generate prediction based on input data
+        prediction = score_equipment([parse_equipment(data)])[0]
         
-        # Simple risk calculation based on inputs
-        risk_score = 0.0
-        risk_score += min(age_months / 100.0, 0.4)  # Age factor (max 40%)
-        risk_score += min((temp - 50) / 100.0, 0.3) if temp > 50 else 0  # Temperature factor
-        risk_score += min(vibration / 10.0, 0.2)  # Vibration factor  
-        risk_score += min(power / 2000.0, 0.1)  # Power factor
-        
-        # Add some randomness
-        risk_score += random.uniform(-0.1, 0.1)
-        risk_score = max(0.01, min(0.99, risk_score))
-        
-        # Determine risk level
-        if risk_score >= 0.7:
-            risk_level = "Critical"
-        elif risk_score >= 0.5:
-            risk_level = "High"
-        elif risk_score >= 0.3:
-            risk_level = "Medium"
-        else:
-            risk_level = "Low"
-        
-        # Generate confidence score
-        confidence_score = 0.85 + random.uniform(-0.15, 0.1)
-        confidence_score = max(0.6, min(0.95, confidence_score))
-        
-        prediction = {
-            "success": True,
-            "equipment_id": data['equipment_id'],
-            "failure_probability": round(risk_score, 3),
-            "risk_level": risk_level,
-            "confidence_score": round(confidence_score, 3),
-            "prediction_timestamp": datetime.datetime.utcnow().isoformat(),
-            "model_version": "Test-Model-v1.0"
-        }
-        
-        logger.info(f"Generated prediction for {data['equipment_id']}: {risk_level} risk ({risk_score:.1%})")
+        logger.info(f"Generated prediction for {data['equipment_id']}: {prediction['risk_level']} risk ({prediction['failure_probability']:.1%})")
         return jsonify(prediction)
         
     except Exception as e:
@@ -140,67 +131,36 @@ def predict_batch():
             }), 400
         
         equipment_list = data['equipment_list']
-        predictions = []
+        predictions = [None] * len(equipment_list)
+        valid_positions = []
+        valid_records = []
         
         logger.info(f"Processing batch prediction for {len(equipment_list)} equipment items")
         
-        for equipment_data in equipment_list:
+        for position, equipment_data in enumerate(equipment_list):
             try:
                 # Validate each equipment item
-                required_fields = ['equipment_id', 'age_months', 'operating_temperature', 'vibration_level', 'power_consumption']
-                if not all(field in equipment_data for field in required_fields):
-                    predictions.append({
+                if not all(field in equipment_data for field in REQUIRED_FIELDS):
+                    predictions[position] = {
                         "success": False,
                         "equipment_id": equipment_data.get('equipment_id', 'unknown'),
                         "error": "Missing required fields"
-                    })
+                    }
                     continue
                 
-                # Generate prediction (same logic as single prediction)
-                age_months = equipment_data['age_months']
-                temp = equipment_data['operating_temperature']
-                vibration = equipment_data['vibration_level']
-                power = equipment_data['power_consumption']
-                
-                # Simple risk calculation
-                risk_score = 0.0
-                risk_score += min(age_months / 100.0, 0.4)
-                risk_score += min((temp - 50) / 100.0, 0.3) if temp > 50 else 0
-                risk_score += min(vibration / 10.0, 0.2)
-                risk_score += min(power / 2000.0, 0.1)
-                risk_score += random.uniform(-0.1, 0.1)
-                risk_score = max(0.01, min(0.99, risk_score))
-                
-                # Determine risk level
-                if risk_score >= 0.7:
-                    risk_level = "Critical"
-                elif risk_score >= 0.5:
-                    risk_level = "High"
-                elif risk_score >= 0.3:
-                    risk_level = "Medium"
-                else:
-                    risk_level = "Low"
-                
-                confidence_score = 0.85 + random.uniform(-0.15, 0.1)
-                confidence_score = max(0.6, min(0.95, confidence_score))
-                
-                prediction = {
-                    "success": True,
-                    "equipment_id": equipment_data['equipment_id'],
-                    "failure_probability": round(risk_score, 3),
-                    "risk_level": risk_level,
-                    "confidence_score": round(confidence_score, 3),
-                    "prediction_timestamp": datetime.datetime.utcnow().isoformat(),
-                    "model_version": "Test-Model-v1.0"
-                }
-                predictions.append(prediction)
+                valid_records.append(parse_equipment(equipment_data))
+                valid_positions.append(position)
                 
             except Exception as e:
-                predictions.append({
+                predictions[position] = {
                     "success": False,
                     "equipment_id": equipment_data.get('equipment_id', 'unknown'),
                     "error": str(e)
-                })
+                }
+        
+        # Generate predictions for all valid items at once (same logic as single prediction)
+        for position, prediction in zip(valid_positions, score_equipment(valid_records)):
+            predictions[position] = prediction
         
         return jsonify({
             "success": True,